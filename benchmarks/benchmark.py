@@ -0,0 +1,349 @@
+# Benchmarks for the physics, drawing and graph editing speed of GraPy.
+#
+# Every graph is generated from a fixed seed, so results are comparable
+# between runs. The results are written as JSON, and can be compared against
+# a baseline saved by an earlier run to catch regressions:
+#
+#   python benchmark.py --save-baseline baseline.json
+#   (make some changes)
+#   python benchmark.py --baseline baseline.json
+#
+# The exit code is 1 if anything got slower (or bigger) than the baseline by
+# more than the tolerance.
+from __future__ import print_function
+
+import argparse
+import gc
+import json
+import os
+import platform
+import random
+import sys
+import time
+import tracemalloc
+
+# drawing is benchmarked on an offscreen window
+os.environ.setdefault("SDL_VIDEODRIVER", "dummy")
+os.environ.setdefault("PYGAME_HIDE_SUPPORT_PROMPT", "1")
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+
+import grapy
+
+try:
+    import numpy
+except ImportError:
+    numpy = None
+
+try:
+    import pygame
+except ImportError:
+    pygame = None
+
+
+DEFAULT_SIZES = [100, 1000, 5000, 20000]
+
+# the plain python physics is O(n^2), so it isn't run on graphs bigger than this
+DEFAULT_MAX_EXACT = 1000
+
+# the numpy physics is O(n^2) too, but much faster
+DEFAULT_MAX_NUMPY = 20000
+
+
+# graph generators. each returns a list of node UIDs and a list of
+# (outgoing, incoming) pairs.
+
+def randomgraph(size, rng, degree=2):
+    nodes = [str(i) for i in range(size)]
+    edges = set()
+    while len(edges) < min(size * degree // 2, size * (size - 1) // 2):
+        a = rng.randrange(size)
+        b = rng.randrange(size)
+        if a != b and (b, a) not in edges:
+            edges.add((a, b))
+    return nodes, [(nodes[a], nodes[b]) for a, b in sorted(edges)]
+
+
+def treegraph(size, rng, children=3):
+    # like companytreetest.py: every node has a boss on the layer above it
+    nodes = [str(i) for i in range(size)]
+    edges = [(nodes[(i - 1) // children], nodes[i]) for i in range(1, size)]
+    return nodes, edges
+
+
+def scalefreegraph(size, rng, links=2):
+    # preferential attachment: new nodes link to nodes that already have
+    # lots of relationships
+    nodes = [str(i) for i in range(size)]
+    edges = []
+    targets = []
+    for i in range(size):
+        chosen = set()
+        if i <= links:
+            chosen.update(range(i))
+        else:
+            while len(chosen) < links:
+                chosen.add(rng.choice(targets))
+        for other in sorted(chosen):
+            edges.append((nodes[i], nodes[other]))
+            targets.extend((i, other))
+    return nodes, edges
+
+
+GENERATORS = {
+    "random": randomgraph,
+    "tree": treegraph,
+    "scalefree": scalefreegraph,
+}
+
+
+def buildgraph(kind, size, seed):
+    rng = random.Random(seed)
+    uids, edges = GENERATORS[kind](size, rng)
+    spread = max(500.0, (size ** 0.5) * 60)
+
+    graph = grapy.Graph()
+    for uid in uids:
+        graph.addNode(grapy.Node(uid, position=(rng.uniform(0, spread),
+                                                rng.uniform(0, spread))))
+    for outgoing, incoming in edges:
+        graph.addRelationship(outgoing, incoming)
+    return graph, uids, edges
+
+
+def median(values):
+    values = sorted(values)
+    middle = len(values) // 2
+    if len(values) % 2:
+        return values[middle]
+    return (values[middle - 1] + values[middle]) / 2.0
+
+
+def timeit(function, repeats):
+    times = []
+    for i in range(repeats):
+        starttime = time.perf_counter()
+        function()
+        times.append(time.perf_counter() - starttime)
+    return median(times)
+
+
+# the benchmarks. each yields (name, value, unit) results.
+
+def benchphysics(kind, size, seed, options):
+    modes = []
+    if size <= options.max_exact:
+        modes.append(("python", None, None))
+    modes.append(("barneshut", None, 0.8))
+    if numpy is not None and size <= options.max_numpy:
+        modes.append(("numpy", grapy.NumpyPhysics, None))
+    if numpy is not None:
+        modes.append(("numpy-barneshut", grapy.NumpyPhysics, 0.8))
+    if numpy is not None and size >= grapy.ParallelPhysics.minimumparallelsize:
+        if size <= options.max_numpy:
+            modes.append(("parallel", grapy.ParallelPhysics, None))
+        modes.append(("parallel-barneshut", grapy.ParallelPhysics, 0.8))
+
+    for name, backend, theta in modes:
+        graph = buildgraph(kind, size, seed)[0]
+        if backend is not None:
+            graph.setPhysicsBackend(backend(theta=theta))
+        else:
+            graph.setBarnesHut(theta)
+        # the first step also builds any cached structures
+        graph.step(50)
+        yield ("physics." + name, timeit(lambda: graph.step(50), options.steps),
+               "s/step")
+        if hasattr(graph._physicsbackend, "close"):
+            graph._physicsbackend.close()
+
+
+def benchrender(kind, size, seed, options):
+    if pygame is None or not hasattr(grapy, "Grapher"):
+        return
+
+    graph = buildgraph(kind, size, seed)[0]
+    grapher = grapy.Grapher(graph=graph, size=(1280, 800))
+    pygame.init()
+    screen = pygame.display.set_mode(grapher.size)
+    snapshot = grapy.GraphSnapshot.fromGraph(graph)
+
+    # centring the camera on the graph, so that culling doesn't hide everything
+    xs = [n.position[0] for n in graph.nodes.values()]
+    ys = [n.position[1] for n in graph.nodes.values()]
+    grapher.camera.position = ((min(xs) + max(xs) - grapher.size[0]) / 2.0,
+                               (min(ys) + max(ys) - grapher.size[1]) / 2.0)
+
+    def fullframe():
+        grapher.redraw()
+        grapher._draw(screen, snapshot)
+
+    fullframe()
+    yield ("render.fullframe", timeit(fullframe, options.frames), "s/frame")
+
+    def idleframe():
+        grapher._draw(screen, snapshot)
+
+    yield ("render.idleframe", timeit(idleframe, options.frames), "s/frame")
+
+
+def benchmutation(kind, size, seed, options):
+    rng = random.Random(seed)
+    uids, edges = GENERATORS[kind](size, rng)
+
+    addnode = []
+    addrelationship = []
+    removenode = []
+    for i in range(options.repeats):
+        nodes = [grapy.Node(uid) for uid in uids]
+        graph = grapy.Graph()
+
+        starttime = time.perf_counter()
+        for n in nodes:
+            graph.addNode(n)
+        addnode.append(time.perf_counter() - starttime)
+
+        starttime = time.perf_counter()
+        for outgoing, incoming in edges:
+            graph.addRelationship(outgoing, incoming)
+        addrelationship.append(time.perf_counter() - starttime)
+
+        starttime = time.perf_counter()
+        for uid in uids:
+            graph.removeNode(uid)
+        removenode.append(time.perf_counter() - starttime)
+
+    addnodes = []
+    addrelationships = []
+    for i in range(options.repeats):
+        nodes = [grapy.Node(uid) for uid in uids]
+        graph = grapy.Graph()
+
+        starttime = time.perf_counter()
+        graph.addNodes(nodes)
+        addnodes.append(time.perf_counter() - starttime)
+
+        starttime = time.perf_counter()
+        graph.addRelationships(edges)
+        addrelationships.append(time.perf_counter() - starttime)
+
+    yield ("mutation.addNode", size / median(addnode), "ops/s")
+    yield ("mutation.addNodes", size / median(addnodes), "ops/s")
+    if edges:
+        yield ("mutation.addRelationship", len(edges) / median(addrelationship), "ops/s")
+        yield ("mutation.addRelationships", len(edges) / median(addrelationships), "ops/s")
+    yield ("mutation.removeNode", size / median(removenode), "ops/s")
+
+
+def benchmemory(kind, size, seed, options):
+    gc.collect()
+    tracemalloc.start()
+    graph = buildgraph(kind, size, seed)[0]
+    current = tracemalloc.get_traced_memory()[0]
+    tracemalloc.stop()
+    yield ("memory.pernode", current / float(size), "bytes")
+    del graph
+
+
+BENCHMARKS = {
+    "physics": benchphysics,
+    "render": benchrender,
+    "mutation": benchmutation,
+    "memory": benchmemory,
+}
+
+
+def runall(options):
+    results = []
+    for kind in options.graphs:
+        for size in options.sizes:
+            for benchmark in options.benchmarks:
+                for name, value, unit in BENCHMARKS[benchmark](
+                        kind, size, options.seed, options):
+                    result = {"name": name, "graph": kind, "nodes": size,
+                              "value": value, "unit": unit}
+                    results.append(result)
+                    print("{:<28} {:<10} {:>6} nodes  {:.6g} {}".format(
+                        name, kind, size, value, unit))
+    return results
+
+
+def resultkey(result):
+    return (result["name"], result["graph"], result["nodes"])
+
+
+def compare(results, baseline, tolerance):
+    """Returns a list of messages describing every result that is worse than
+    the baseline by more than tolerance (a fraction).
+    """
+    previous = dict((resultkey(r), r) for r in baseline["results"])
+    regressions = []
+    for result in results:
+        old = previous.get(resultkey(result))
+        if old is None or old["value"] <= 0:
+            continue
+        # for throughput bigger is better, for everything else smaller is
+        if result["unit"] == "ops/s":
+            change = old["value"] / result["value"] - 1
+        else:
+            change = result["value"] / old["value"] - 1
+        if change > tolerance:
+            regressions.append("{} ({}, {} nodes): {:.6g} -> {:.6g} {} ({:.0%} worse)".format(
+                result["name"], result["graph"], result["nodes"],
+                old["value"], result["value"], result["unit"], change))
+    return regressions
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmarks GraPy.")
+    parser.add_argument("--sizes", type=int, nargs="+", default=DEFAULT_SIZES)
+    parser.add_argument("--graphs", nargs="+", choices=sorted(GENERATORS),
+                        default=sorted(GENERATORS))
+    parser.add_argument("--benchmarks", nargs="+", choices=sorted(BENCHMARKS),
+                        default=sorted(BENCHMARKS))
+    parser.add_argument("--seed", type=int, default=1)
+    parser.add_argument("--steps", type=int, default=3,
+                        help="physics steps to time (the median is used)")
+    parser.add_argument("--frames", type=int, default=5,
+                        help="frames to time (the median is used)")
+    parser.add_argument("--repeats", type=int, default=5,
+                        help="times to repeat the graph editing benchmarks (the median is used)")
+    parser.add_argument("--max-exact", type=int, default=DEFAULT_MAX_EXACT)
+    parser.add_argument("--max-numpy", type=int, default=DEFAULT_MAX_NUMPY)
+    parser.add_argument("--output", help="where to write the results")
+    parser.add_argument("--baseline", help="results to compare against")
+    parser.add_argument("--save-baseline", help="where to save these results as a baseline")
+    parser.add_argument("--tolerance", type=float, default=0.2,
+                        help="how much worse than the baseline is allowed (0.2 = 20%%)")
+    options = parser.parse_args()
+
+    output = {
+        "meta": {
+            "python": platform.python_version(),
+            "platform": platform.platform(),
+            "numpy": numpy.__version__ if numpy is not None else None,
+            "pygame": pygame.version.ver if pygame is not None else None,
+            "seed": options.seed,
+        },
+        "results": runall(options),
+    }
+
+    for path in (options.output, options.save_baseline):
+        if path:
+            with open(path, "w") as f:
+                json.dump(output, f, indent=2)
+
+    if options.baseline:
+        with open(options.baseline) as f:
+            baseline = json.load(f)
+        regressions = compare(output["results"], baseline, options.tolerance)
+        if regressions:
+            print("\nREGRESSIONS:")
+            for message in regressions:
+                print("  " + message)
+            sys.exit(1)
+        print("\nNo regressions against", options.baseline)
+
+
+if __name__ == "__main__":
+    main()
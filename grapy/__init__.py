@@ -1,5 +1,29 @@
 from .graph import Graph
-from .grapher import *
 from .node import *
+from .numpyphysics import NumpyPhysics
+from .parallelphysics import ParallelPhysics
+from .integrators import EulerIntegrator, VerletIntegrator, TemperatureIntegrator, AdaptiveStepSize
+from . import quadtree
+from .spatialindex import SpatialIndex
+from .snapshot import GraphSnapshot
+from .metrics import Metrics, printMetrics
+from .layoutfile import LayoutFile
+from .ingest import StreamIngester, readCSV, readJSONL
+from .commands import CommandQueue
+from .export import renderSurface, savePNG, saveFrames, SVGWriter, saveSVG
+from .events import EventQueue
 from .framerateaverager import FramerateAverager
 from .debug import DebugMsg
+
+# the grapher needs pygame, so it is only imported the first time it is
+# used. everything apart from drawing, such as computing layouts with
+# Graph.run, works without pygame being installed or loaded.
+_GRAPHERNAMES = ("Grapher", "Camera", "checkCollision", "pointInRect",
+                 "segmentIntersectsRect", "tupleAdd", "tupleSubtract")
+
+
+def __getattr__(name):
+    if name in _GRAPHERNAMES:
+        from . import grapher
+        return getattr(grapher, name)
+    raise AttributeError("module {!r} has no attribute {!r}".format(__name__, name))
@@ -0,0 +1,57 @@
+
+# The graph keeps the relationships of each node in dictionaries used as
+# insertion ordered sets, so adding, removing and checking for a
+# relationship are all O(1).
+# users only ever see them through an AdjacencyView, which can be iterated,
+# indexed and checked for membership like the lists that used to be there,
+# but can't be changed. the graph's methods must be used for that.
+
+
+class AdjacencyView:
+    """A read-only view of the UIDs a node is related to, in the order the
+    relationships were added.
+    """
+
+    __slots__ = ("_items",)
+
+    def __init__(self, items):
+        self._items = items
+
+    def __iter__(self):
+        return iter(self._items)
+
+    def __len__(self):
+        return len(self._items)
+
+    def __contains__(self, uid):
+        return uid in self._items
+
+    def __getitem__(self, index):
+        """Indexing and slicing are O(n) and return copies, so are only here
+        for compatibility with code written for lists.
+        """
+        return list(self._items)[index]
+
+    def __add__(self, other):
+        return list(self._items) + list(other)
+
+    def __radd__(self, other):
+        return list(other) + list(self._items)
+
+    def __eq__(self, other):
+        # only compared with other sequences of UIDs, so that a string isn't
+        # split into characters, and anything else is simply not equal
+        if not isinstance(other, (list, tuple, AdjacencyView)):
+            return NotImplemented
+        return list(self._items) == list(other)
+
+    def __ne__(self, other):
+        equal = self.__eq__(other)
+        if equal is NotImplemented:
+            return NotImplemented
+        return not equal
+
+    __hash__ = None
+
+    def __repr__(self):
+        return "AdjacencyView({})".format(list(self._items))
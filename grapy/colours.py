@@ -0,0 +1,13 @@
+# Colours shared by the grapher's default draw functions and the exporters,
+# so that pictures and SVGs look the same as the window. this doesn't need
+# pygame, so SVGs can be written without it.
+
+
+def relationshipColour(relationships):
+    """Returns the colour the default node draw function uses for a node
+    with the given number of relationships, from blue to red.
+    """
+    # n produces a colour gradient between 0 and 254,
+    # depending on the number of relationships
+    n = (((1 + 1.0 / (0.35 * (relationships + 1)))**(0.35 * relationships) - 1) / 1.71828) * 254  # tends to 254 as relaitonships tend to infinity
+    return (int(n), 0, 255 - int(n))
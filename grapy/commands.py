@@ -0,0 +1,165 @@
+import collections
+
+from .debug import DebugMsg
+
+# A queue of changes to a graph, so that any thread can change the graph
+# without locking it.
+#
+# queueing a command only appends it to a deque (which is thread safe), so it
+# takes the same short time however long a frame takes. the graph applies
+# everything that has been queued in one go at the start of its next physics
+# step, while it is locked.
+#
+# before being applied, the commands are coalesced into the changes they make
+# overall, so work that would be undone later in the same batch is skipped:
+#   adding or removing a node replaces every earlier command for that node,
+#       including its relationships and updates, since those would have been
+#       thrown away along with it
+#   the last add or remove of a relationship is the one that counts
+#   updates to the same node are merged, with later values winning
+# the graph ends up the same as if the commands had been applied one at a
+# time, in order.
+
+_ADD_NODE = 0
+_REMOVE_NODE = 1
+_ADD_RELATIONSHIP = 2
+_REMOVE_RELATIONSHIP = 3
+_UPDATE_NODE = 4
+
+# the node attributes that can be updated
+UPDATABLE_ATTRIBUTES = ("position", "velocity", "mass", "charge", "static",
+                        "radius", "data")
+
+
+class CommandQueue:
+
+    def __init__(self):
+        self._commands = collections.deque()
+
+        # messages for every command that couldn't be applied
+        self.errors = []
+        self.applied = 0
+
+    def addNode(self, node):
+        self._commands.append((_ADD_NODE, node))
+
+    def removeNode(self, nodeID):
+        self._commands.append((_REMOVE_NODE, nodeID))
+
+    def addRelationship(self, outgoing, incoming):
+        self._commands.append((_ADD_RELATIONSHIP, (outgoing, incoming)))
+
+    def removeRelationship(self, outgoing, incoming):
+        self._commands.append((_REMOVE_RELATIONSHIP, (outgoing, incoming)))
+
+    def updateNode(self, nodeID, attributes):
+        for name in attributes:
+            if name not in UPDATABLE_ATTRIBUTES:
+                DebugMsg("TRIED TO UPDATE ATTRIBUTE {} OF NODE {} WHICH CAN'T BE UPDATED.".format(
+                    name, str(nodeID)))
+                return
+        self._commands.append((_UPDATE_NODE, (nodeID, dict(attributes))))
+
+    def pending(self):
+        """Returns the number of commands waiting to be applied.
+        """
+        return len(self._commands)
+
+    def _take(self):
+        # only the commands that were there at the start are taken, so that a
+        # writer that keeps queueing can't hold up the step forever
+        commands = []
+        popleft = self._commands.popleft
+        for i in range(len(self._commands)):
+            commands.append(popleft())
+        return commands
+
+    def apply(self, graph):
+        """Applies every queued command to graph, which must be locked.
+        Returns the number of commands that were taken from the queue.
+        """
+        commands = self._take()
+        if not commands:
+            return 0
+
+        # each node's UID to [the last add or remove command, whether it was
+        # added at any point]
+        nodes = {}
+        # each relationship to [whether it is added in the end, whether it
+        # was both added and removed]
+        relationships = {}
+        # each node's UID to the relationships queued for it, so they can be
+        # thrown away when the node is added or removed
+        noderelationships = {}
+        updates = {}
+        errors = self.errors
+
+        for kind, values in commands:
+            if kind == _ADD_NODE or kind == _REMOVE_NODE:
+                uid = values.UID if kind == _ADD_NODE else values
+                for pair in noderelationships.pop(uid, ()):
+                    relationships.pop(pair, None)
+                updates.pop(uid, None)
+                state = nodes.get(uid)
+                added = kind == _ADD_NODE or (state is not None and state[1])
+                nodes[uid] = [(kind, values), added]
+            elif kind == _UPDATE_NODE:
+                uid, attributes = values
+                state = nodes.get(uid)
+                if state is not None and state[0][0] == _REMOVE_NODE:
+                    errors.append("TRIED TO UPDATE NODE {} WHICH DIDN'T EXIST.".format(str(uid)))
+                    continue
+                updates.setdefault(uid, {}).update(attributes)
+            else:
+                adding = kind == _ADD_RELATIONSHIP
+                state = relationships.get(values)
+                if state is None:
+                    relationships[values] = [adding, False]
+                    for uid in values:
+                        noderelationships.setdefault(uid, []).append(values)
+                elif state[0] != adding:
+                    state[0] = adding
+                    state[1] = True
+
+        # nodes first, since the relationships left all came after the last
+        # add or remove of both of their nodes
+        adds = []
+        for uid, ((kind, values), added) in nodes.items():
+            if kind == _ADD_NODE:
+                adds.append(values)
+            elif uid in graph.nodes:
+                graph.removeNode(uid)
+            elif not added:
+                errors.append("TRIED TO REMOVE NODE {} WHICH DIDN'T EXIST.".format(str(uid)))
+        if adds:
+            errors.extend(graph.addNodes(adds))
+
+        graphrelationships = graph.relationships
+        additions = []
+        for (outgoing, incoming), (adding, mixed) in relationships.items():
+            exists = (outgoing in graphrelationships and
+                      incoming in graphrelationships[outgoing][0])
+            if adding:
+                # a relationship that was removed then added back again
+                # doesn't need anything doing
+                if not (mixed and exists):
+                    additions.append((outgoing, incoming))
+            elif exists:
+                graph.removeRelationship(outgoing, incoming)
+            elif not mixed:
+                errors.append("TRIED TO REMOVE RELATIONSHIP {} > {} WHICH DIDN'T EXIST.".format(
+                    str(outgoing), str(incoming)))
+        if additions:
+            errors.extend(graph.addRelationships(additions))
+
+        for uid, attributes in updates.items():
+            node = graph.nodes.get(uid)
+            if node is None:
+                errors.append("TRIED TO UPDATE NODE {} WHICH DIDN'T EXIST.".format(str(uid)))
+                continue
+            for name, value in attributes.items():
+                setattr(node, name, value)
+            node.wake()
+
+        self.applied += len(commands)
+        return len(commands)
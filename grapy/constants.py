@@ -11,3 +11,16 @@ class Constants:
 
     # Calculated whenever the friction coefficient or framerate changes
     PER_FRAME_FRICTION_COEFFICIENT = 1
+
+    # when sleeping is turned on for a graph, a node whose speed and net force
+    # stay below these thresholds for SLEEP_FRAMES frames in a row is put to
+    # sleep, and is no longer moved until something wakes it up
+    SLEEP_VELOCITY_THRESHOLD = 1.0
+
+    SLEEP_FORCE_THRESHOLD = 10.0
+
+    SLEEP_FRAMES = 30
+
+    # an awake node that moves further than this in one frame wakes up any
+    # sleeping nodes it has a relationship with
+    WAKE_DISTANCE = 0.5
@@ -0,0 +1,127 @@
+import collections
+import threading
+import traceback
+
+from .debug import DebugMsg
+
+# A thread safe queue of the mouse events from a Grapher.
+#
+# an event is a tuple of (0 for a click or 1 for a release, the mouse button,
+# the UID of the node under the mouse or None).
+#
+# events can be taken from the queue in several ways, none of which need the
+# graph to be locked or busy loop while waiting:
+#   get(timeout) returns every waiting event, waiting up to timeout seconds
+#       for one to arrive (None waits forever, 0 doesn't wait)
+#   iterating over the queue waits for and yields each event in turn
+#   async for ... in the queue does the same from an asyncio event loop
+#   callbacks added with addCallback are called with every event
+# each event goes to only one of the first three, but to every callback.
+# when the queue is closed (the grapher quits), waiting stops and the
+# iterators end.
+
+
+class EventQueue:
+
+    def __init__(self):
+        self._events = collections.deque()
+        self._condition = threading.Condition()
+        self._callbacks = []
+        # (event loop, future) pairs for async iterators waiting for an event
+        self._waiters = []
+        self.closed = False
+
+    def put(self, event):
+        """Adds an event, wakes up anything waiting for one and calls the
+        callbacks. The callbacks are called on the thread that puts the event,
+        which for a Grapher is the drawing thread while the graph is locked.
+        """
+        with self._condition:
+            self._events.append(event)
+            self._condition.notify_all()
+            self._wakeWaiters()
+
+        for callback in list(self._callbacks):
+            try:
+                callback(event)
+            except Exception:
+                DebugMsg("EVENT CALLBACK {} RAISED AN EXCEPTION:\n{}".format(
+                    callback, traceback.format_exc()))
+
+    def get(self, timeout=None):
+        """Returns a list of every waiting event. If there aren't any, waits
+        for at most timeout seconds (forever if it is None) for one to arrive.
+        Returns an empty list if none arrive or the queue is closed.
+        """
+        with self._condition:
+            if not self._events and timeout != 0:
+                self._condition.wait_for(
+                    lambda: self._events or self.closed, timeout)
+            events = list(self._events)
+            self._events.clear()
+        return events
+
+    def close(self):
+        """Stops anything waiting for events. The events already in the queue
+        can still be taken.
+        """
+        with self._condition:
+            self.closed = True
+            self._condition.notify_all()
+            self._wakeWaiters()
+
+    def addCallback(self, callback):
+        """Takes a function which is called with every event from now on.
+        """
+        self._callbacks.append(callback)
+
+    def removeCallback(self, callback):
+        self._callbacks.remove(callback)
+
+    def _wakeWaiters(self):
+        # called with the condition held
+        for loop, future in self._waiters:
+            try:
+                loop.call_soon_threadsafe(_setResult, future)
+            except RuntimeError:
+                # the event loop has been closed
+                pass
+        del self._waiters[:]
+
+    def __iter__(self):
+        while True:
+            with self._condition:
+                self._condition.wait_for(lambda: self._events or self.closed)
+                if not self._events:
+                    return
+                event = self._events.popleft()
+            yield event
+
+    def __aiter__(self):
+        return self._aiterate()
+
+    async def _aiterate(self):
+        # imported here so that asyncio is only loaded when it is used
+        import asyncio
+
+        loop = asyncio.get_running_loop()
+        while True:
+            with self._condition:
+                if self._events:
+                    event = self._events.popleft()
+                    future = None
+                elif self.closed:
+                    return
+                else:
+                    future = loop.create_future()
+                    self._waiters.append((loop, future))
+
+            if future is None:
+                yield event
+            else:
+                await future
+
+
+def _setResult(future):
+    if not future.done():
+        future.set_result(None)
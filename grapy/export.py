@@ -0,0 +1,273 @@
+import math
+import os
+from xml.sax.saxutils import escape, quoteattr
+
+from .colours import relationshipColour
+from .snapshot import GraphSnapshot
+
+# Exporting pictures of a graph without a window.
+#
+# PNGs and frame sequences are drawn on an offscreen pygame.Surface by a
+# Grapher's own node, vertex, background and foreground draw functions, so
+# they look the same as the window. the grapher doesn't need to be started,
+# and mustn't be running, since the draw functions share its sprite cache.
+# pygame can be made to run without a display by setting the SDL_VIDEODRIVER
+# environment variable to "dummy" before it is imported. it is only imported
+# when a picture is drawn, so SVGs can be written without it.
+#
+# frames are drawn as fast as they can be, one after the other, rather than
+# at the grapher's framerate.
+#
+# SVGs are written straight to the file, one element at a time, so any
+# number of nodes can be written without the size of a surface being a
+# limit. since they aren't pixels, they can't use the draw functions, and
+# nodes are drawn as a circle and a label instead.
+
+# the widest or tallest surface that will be drawn
+MAXIMUM_SURFACE_SIZE = 16384
+
+
+def _importPygame():
+    try:
+        import pygame
+    except ImportError:
+        raise ImportError("Drawing a graph requires pygame.")
+    return pygame
+
+
+def takeSnapshot(graph):
+    """Returns a snapshot of graph, locking it while it is taken.
+    """
+    graph.lock()
+    try:
+        return GraphSnapshot.fromGraph(graph)
+    finally:
+        graph.unlock()
+
+
+def _graphBounds(grapher, snapshot, margin):
+    """Returns ((left, top), (right, bottom)) around everything the grapher
+    would draw for the nodes in snapshot, plus margin.
+    """
+    if not snapshot.nodes:
+        return ((-margin, -margin), (margin, margin))
+    left = top = float("inf")
+    right = bottom = float("-inf")
+    for n, position in snapshot.nodes:
+        (nodeleft, nodetop), (noderight, nodebottom) = grapher._nodeRect(n, position)
+        left = min(left, nodeleft)
+        top = min(top, nodetop)
+        right = max(right, noderight)
+        bottom = max(bottom, nodebottom)
+    return ((left - margin, top - margin), (right + margin, bottom + margin))
+
+
+def renderSurface(grapher, snapshot=None, size=None, fit=True, margin=20):
+    """Draws a graph on a new surface with grapher's draw functions, and
+    returns it. Takes:
+        snapshot: the GraphSnapshot to draw, by default one of grapher's graph
+        size: the (width, height) of the surface
+        fit: when True, the whole graph is drawn, and the surface is made
+            big enough for it unless size is given, in which case the graph
+            is centred in it. when False, the surface shows what the window
+            would, at the grapher's camera position and (by default) size
+        margin: the space left around the graph when fitting it
+    """
+    pygame = _importPygame()
+    if grapher.running:
+        raise RuntimeError("Can't export from a Grapher while it is running.")
+    if not pygame.get_init():
+        pygame.init()
+    if snapshot is None:
+        snapshot = takeSnapshot(grapher.graph)
+
+    if fit:
+        (left, top), (right, bottom) = _graphBounds(grapher, snapshot, margin)
+        if size is None:
+            size = (int(math.ceil(right - left)), int(math.ceil(bottom - top)))
+            camera = (left, top)
+        else:
+            camera = ((left + right - size[0]) / 2.0,
+                      (top + bottom - size[1]) / 2.0)
+    else:
+        if size is None:
+            size = grapher.size
+        camera = tuple(grapher.camera.position)
+
+    if max(size) > MAXIMUM_SURFACE_SIZE:
+        raise ValueError("THE GRAPH IS {} x {} PIXELS, WHICH IS TOO BIG TO DRAW. TRY saveSVG.".format(
+            size[0], size[1]))
+
+    surface = pygame.Surface(size)
+    cam_x, cam_y = camera
+    grapher._drawRegion(surface, snapshot,
+                        ((cam_x, cam_y), (cam_x + size[0], cam_y + size[1])),
+                        camera)
+    return surface
+
+
+def savePNG(grapher, path, snapshot=None, size=None, fit=True, margin=20):
+    """Draws a graph like renderSurface, and saves it as a PNG at path.
+    """
+    _importPygame().image.save(renderSurface(grapher, snapshot, size, fit, margin), path)
+
+
+def saveFrames(grapher, directory, frames, stepsperframe=1, framerate=50.0,
+               size=None, fit=False, margin=20, filename="frame{:05d}.png"):
+    """Runs the physics of grapher's graph, saving a picture after every
+    stepsperframe steps, for frames frames. The pictures are numbered
+    from 0 with filename in directory, which is created if it doesn't exist.
+    Every frame is size pixels (by default, the grapher's size), and when fit
+    is True the graph is centred in each one rather than using the grapher's
+    camera. Returns the paths of the pictures.
+    """
+    if size is None:
+        size = grapher.size
+    if not os.path.isdir(directory):
+        os.makedirs(directory)
+
+    graph = grapher.graph
+    paths = []
+    snapshot = None
+    for frame in range(frames):
+        graph.lock()
+        try:
+            if frame:
+                for i in range(stepsperframe):
+                    graph.step(framerate)
+            snapshot = GraphSnapshot.fromGraph(graph, frame * stepsperframe,
+                                               snapshot)
+        finally:
+            graph.unlock()
+
+        path = os.path.join(directory, filename.format(frame))
+        savePNG(grapher, path, snapshot, size, fit, margin)
+        paths.append(path)
+    return paths
+
+
+def _colour(colour):
+    return "rgb({},{},{})".format(*colour[:3])
+
+
+def _number(value):
+    return "{:.2f}".format(value).rstrip("0").rstrip(".")
+
+
+class SVGWriter:
+    """Writes an SVG one element at a time. Takes a path or a text file to
+    write to, and the area of the graph it shows, as
+    ((left, top), (right, bottom)). Can be used in a with statement.
+    """
+
+    def __init__(self, file, bounds, background=(20, 20, 20)):
+        if isinstance(file, str):
+            self._file = open(file, "w", encoding="utf-8")
+            self._ownsfile = True
+        else:
+            self._file = file
+            self._ownsfile = False
+
+        (left, top), (right, bottom) = bounds
+        width = right - left
+        height = bottom - top
+        self._file.write(
+            '<?xml version="1.0" encoding="UTF-8"?>\n'
+            '<svg xmlns="http://www.w3.org/2000/svg" width="{}" height="{}" '
+            'viewBox="{} {} {} {}">\n'.format(
+                _number(width), _number(height), _number(left), _number(top),
+                _number(width), _number(height)))
+        if background is not None:
+            self._file.write('<rect x="{}" y="{}" width="{}" height="{}" fill="{}"/>\n'.format(
+                _number(left), _number(top), _number(width), _number(height),
+                _colour(background)))
+
+    def line(self, start, end, colour=(255, 255, 255), width=1):
+        self._file.write('<line x1="{}" y1="{}" x2="{}" y2="{}" stroke="{}" stroke-width="{}"/>\n'.format(
+            _number(start[0]), _number(start[1]), _number(end[0]),
+            _number(end[1]), _colour(colour), _number(width)))
+
+    def circle(self, centre, radius, colour):
+        self._file.write('<circle cx="{}" cy="{}" r="{}" fill="{}"/>\n'.format(
+            _number(centre[0]), _number(centre[1]), _number(radius),
+            _colour(colour)))
+
+    def text(self, position, text, size=14, colour=(255, 255, 255)):
+        """Writes text with its top left corner at position.
+        """
+        self._file.write('<text x="{}" y="{}" font-size="{}" fill="{}" '
+                         'font-family="sans-serif" dominant-baseline="hanging">{}</text>\n'.format(
+                             _number(position[0]), _number(position[1]),
+                             _number(size), _colour(colour), escape(text)))
+
+    def startGroup(self, name):
+        self._file.write("<g id={}>\n".format(quoteattr(name)))
+
+    def endGroup(self):
+        self._file.write("</g>\n")
+
+    def close(self):
+        if self._file is None:
+            return
+        self._file.write("</svg>\n")
+        if self._ownsfile:
+            self._file.close()
+        self._file = None
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exceptiontype, exception, traceback):
+        self.close()
+
+
+def defaultNodeStyle(node, snapshot):
+    """Returns (radius, colour, label) for a node in snapshot, the same as
+    the Grapher's default node draw function.
+    """
+    noderelationships = snapshot.relationships.get(node.UID, ((), ()))
+    relationships = len(noderelationships[0]) + len(noderelationships[1])
+    return node.radius, relationshipColour(relationships), str(node.UID)
+
+
+def saveSVG(graph, path, snapshot=None, nodestylefunction=None,
+            edgecolour=(255, 255, 255), background=(20, 20, 20),
+            labelsize=14, margin=50):
+    """Writes a graph to path (or a text file) as an SVG. Takes:
+        snapshot: the GraphSnapshot to write, by default one of graph
+        nodestylefunction: a function taking a node and the snapshot, and
+            returning its (radius, colour, label). label can be None.
+            By default the nodes are coloured like the Grapher's.
+        edgecolour: the colour of the relationships
+        background: the colour of the background, or None for none
+        labelsize: the size of the labels' text
+        margin: the space left around the graph
+    """
+    if snapshot is None:
+        snapshot = takeSnapshot(graph)
+    if nodestylefunction is None:
+        nodestylefunction = defaultNodeStyle
+
+    if snapshot.nodes:
+        xs = [position[0] for n, position in snapshot.nodes]
+        ys = [position[1] for n, position in snapshot.nodes]
+        bounds = ((min(xs) - margin, min(ys) - margin),
+                  (max(xs) + margin, max(ys) + margin))
+    else:
+        bounds = ((-margin, -margin), (margin, margin))
+
+    with SVGWriter(path, bounds, background) as writer:
+        writer.startGroup("relationships")
+        for start, end in snapshot.edges:
+            writer.line(start, end, edgecolour)
+        writer.endGroup()
+
+        writer.startGroup("nodes")
+        for n, position in snapshot.nodes:
+            radius, colour, label = nodestylefunction(n, snapshot)
+            writer.circle(position, radius, colour)
+            if label is not None:
+                # the same offset as the default node draw function's label
+                writer.text((position[0] - 5, position[1] - 5), label,
+                            labelsize)
+        writer.endGroup()
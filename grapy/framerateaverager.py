@@ -7,15 +7,21 @@ class FramerateAverager:
 
     def __init__(self, numberofframerates=5):
         self._numberOfFramerates = numberofframerates
+        # a ring buffer of the most recent framerates, with a running total
         self._framerates = [50.0] * numberofframerates
+        self._index = 0
+        self._total = 50.0 * numberofframerates
 
     def addFramerate(self, framerate):
         if framerate <= self.minFramerate:
             framerate = self.minFramerate
-        self._framerates = self._framerates[1:] + [framerate * 1.0]
+        framerate = framerate * 1.0
+        self._total += framerate - self._framerates[self._index]
+        self._framerates[self._index] = framerate
+        self._index = (self._index + 1) % self._numberOfFramerates
 
     def addFrametime(self, frametime):
-        self.addFramerate(1000.0 / frametime)
+        self.addFramerate(1000.0 / max(frametime, 1))
 
     def getAverageFramerate(self):
-        return sum(self._framerates) / self._numberOfFramerates
+        return self._total / self._numberOfFramerates
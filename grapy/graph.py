@@ -1,6 +1,27 @@
+import itertools
+import math
+import random
 import threading
+import time
+from types import MappingProxyType
 
+try:
+    import numpy
+except ImportError:
+    numpy = None
+
+from .adjacency import AdjacencyView
+from .commands import CommandQueue
+from .constants import Constants
 from .debug import DebugMsg
+from .integrators import EulerIntegrator
+from .layoutfile import LayoutFile, saveLayout
+from .multilevel import multilevelLayout
+from .node import Node
+from . import groups
+from . import placement
+from . import quadtree
+from .spatialindex import SpatialIndex
 
 # The graph object contains a bunch of nodes and is responsible for maintaining
 # the datastructure of nodes. and having physics act upon them
@@ -8,19 +29,91 @@ from .debug import DebugMsg
 # the main datastructure is a dictionary of nodes. where the key is the UID and the value is the node
 # the other datastructure is of all of the relationships.
 # this datastructure uses the UID as a key
-# the value is a list like this [[outgoingrelationships as UIDs], [incomingrelationships as UIDs]]
+# the value is a pair like this (outgoingrelationships as UIDs, incomingrelationships as UIDs)
+# each half is a dictionary used as an insertion ordered set, so relationships
+# can be added, removed and looked up in O(1). users get a read-only view of it.
 
 
 class Graph:
 
     nodes = {}
-    # relationships contains 2 lists for each entry.
-    # the first is outgoing, the second is incoming
-    relationships = {}
 
     data = []  # some arbitrary data the graph can store
 
-    _lock = threading.Lock()
+    # incremented whenever a node or relationship is added or removed,
+    # so that anything caching the structure of the graph knows to rebuild it
+    _version = 0
+
+    # an optional object which does the physics for the whole graph at once.
+    # it must have a doPhysics(graph, framerate) method.
+    # when it is None the physics is done node by node.
+    _physicsbackend = None
+
+    # when this is set, repulsion is approximated with a Barnes-Hut quadtree
+    # using this as the opening angle. None means every pair is calculated.
+    barneshuttheta = None
+
+    # a grid of node positions for finding nodes near a point or in a region.
+    # it is rebuilt at the end of every physics step.
+    _spatialindex = None
+
+    # when this is True, nodes that have settled are put to sleep and skipped
+    # by the physics until they are woken up again. see Constants for the
+    # thresholds.
+    sleepingenabled = False
+
+    # when this is True, nodes added to the graph are placed near the nodes
+    # they have relationships with at the start of the next physics step,
+    # rather than staying where they were given. see placement.py
+    autoplacement = False
+
+    # a Metrics object to record the time each part of the physics takes in,
+    # or None to not record anything
+    metrics = None
+
+    # what moves the nodes once the forces on them are known.
+    # see integrators.py
+    integrator = None
+
+    def __init__(self):
+        self.nodes = {}
+        self.data = []
+
+        self._lock = threading.Lock()
+
+        self.integrator = EulerIntegrator()
+
+        # _adjacency contains 2 dictionaries for each entry.
+        # the first is outgoing, the second is incoming
+        self._adjacency = {}
+        self._relationships = {}
+        self._relationshipsview = MappingProxyType(self._relationships)
+
+        # changes queued by any thread, applied at the start of every step.
+        # see commands.py
+        self.commands = CommandQueue()
+
+        # StreamIngesters that records are applied from before every step
+        self._ingesters = []
+
+        # each grouped node's UID to its group, and each group to its members
+        # (a dictionary used as an insertion ordered set of UIDs)
+        self._nodegroups = {}
+        self._groups = {}
+        # each collapsed group to the offsets of its nodes from the group's
+        # centre when it was collapsed, so that expanding can put them back
+        self._collapsed = {}
+
+        # the UIDs of nodes waiting to be placed, as an insertion ordered set
+        self._unplaced = {}
+        self._placementrandom = random.Random(0)
+
+    @property
+    def relationships(self):
+        """A read-only mapping of each node's UID to a pair of views:
+        (outgoing relationship UIDs, incoming relationship UIDs)
+        """
+        return self._relationshipsview
 
     def lock(self):
         self._lock.acquire()
@@ -28,15 +121,185 @@ class Graph:
     def unlock(self):
         self._lock.release()
 
+    def setPhysicsBackend(self, backend):
+        """Takes a physics backend such as NumpyPhysics,
+        or None to go back to doing the physics node by node.
+        """
+        self._physicsbackend = backend
+
+    def setIntegrator(self, integrator):
+        """Takes an integrator such as VerletIntegrator, TemperatureIntegrator
+        or AdaptiveStepSize, or None to go back to EulerIntegrator.
+        """
+        if integrator is None:
+            integrator = EulerIntegrator()
+        self.integrator = integrator
+
+    def setBarnesHut(self, theta=0.8):
+        """Turns on Barnes-Hut repulsion with the opening angle theta.
+        Larger values are faster but less accurate. None turns it off.
+        """
+        self.barneshuttheta = theta
+
+    def setSleeping(self, enabled=True):
+        """Turns the sleeping of settled nodes on or off.
+        Turning it off wakes every node.
+        """
+        self.sleepingenabled = enabled
+        if not enabled:
+            for n in self.nodes.values():
+                n.wake()
+
+    def wakeNode(self, nodeID, neighbours=True):
+        """Wakes a node, and by default every node it has a relationship with.
+        Should be called after moving a node by hand (eg. dragging it),
+        so that the physics picks it up again.
+        """
+        if nodeID not in self.nodes:
+            return
+        self.nodes[nodeID].wake()
+        if neighbours:
+            self._wakeNeighbours(nodeID)
+
+    def _wakeNeighbours(self, nodeID):
+        outgoings, incomings = self._adjacency[nodeID]
+        for other in outgoings:
+            self.nodes[other].wake()
+        for other in incomings:
+            self.nodes[other].wake()
+
+    def setAutoPlacement(self, enabled=True):
+        """Turns automatic placement of new nodes on or off. See placement.py.
+        """
+        self.autoplacement = enabled
+        if not enabled:
+            self._unplaced.clear()
+
+    def placeNewNodes(self):
+        """Places the nodes added since the last physics step, when automatic
+        placement is on. Is done at the start of every step anyway.
+        """
+        if self._unplaced:
+            uids = list(self._unplaced)
+            self._unplaced.clear()
+            placement.placeNodes(self, uids, self._placementrandom)
+
+    def setGroup(self, nodeID, group):
+        """Puts a node in a group, which can be any hashable value.
+        None takes it out of its group. The nodes in a group act as one large
+        node to the nodes outside of it. See groups.py.
+        """
+        if nodeID not in self.nodes:
+            DebugMsg("TRIED TO GROUP NODE {} WHICH DIDN'T EXIST.".format(str(nodeID)))
+            return
+
+        oldgroup = self._nodegroups.pop(nodeID, None)
+        if oldgroup is not None:
+            self._leaveGroup(nodeID, oldgroup)
+        if group is None:
+            return
+
+        self._nodegroups[nodeID] = group
+        self._groups.setdefault(group, {})[nodeID] = None
+        if group in self._collapsed:
+            # joining a collapsed group puts the node with the rest of it
+            self._collapsed[group][nodeID] = (0.0, 0.0)
+            groups.gatherCollapsed(self._groupNodes(group))
+
+    def _leaveGroup(self, nodeID, group):
+        members = self._groups[group]
+        del members[nodeID]
+        if group in self._collapsed:
+            self._collapsed[group].pop(nodeID, None)
+        if not members:
+            del self._groups[group]
+            self._collapsed.pop(group, None)
+
+    def getGroup(self, nodeID):
+        """Returns the group a node is in, or None.
+        """
+        return self._nodegroups.get(nodeID)
+
+    def getGroupMembers(self, group):
+        """Returns a list of the UIDs of the nodes in a group.
+        """
+        return list(self._groups.get(group, ()))
+
+    def _groupNodes(self, group):
+        return [self.nodes[uid] for uid in self._groups[group]]
+
+    def collapseGroup(self, group):
+        """Pulls every node in a group to the group's centre, where they move
+        together as a single node until the group is expanded.
+        """
+        if group not in self._groups or group in self._collapsed:
+            return
+
+        nodes = self._groupNodes(group)
+        positions = [n.position for n in nodes]
+        groups.gatherCollapsed(nodes)
+        self._collapsed[group] = dict(
+            (n.UID, (x - n.position[0], y - n.position[1]))
+            for n, (x, y) in zip(nodes, positions))
+        for n in nodes:
+            n.wake()
+
+    def expandGroup(self, group):
+        """Spreads the nodes of a collapsed group back out around wherever the
+        group is now, the same way they were arranged when it was collapsed.
+        """
+        offsets = self._collapsed.pop(group, None)
+        if offsets is None:
+            return
+
+        for n in self._groupNodes(group):
+            if n.static:
+                continue
+            x, y = n.position
+            offsetx, offsety = offsets.get(n.UID, (0.0, 0.0))
+            n.position = (x + offsetx, y + offsety)
+            n.wake()
+
+    def isCollapsed(self, group):
+        return group in self._collapsed
+
+    def getSpatialIndex(self):
+        """Returns the spatial index of the node positions as of the last
+        physics step. It is rebuilt first if nodes have been added or removed
+        since then.
+        """
+        if (self._spatialindex is None or
+                self._spatialindex.graphversion != self._version):
+            self._updateSpatialIndex()
+        return self._spatialindex
+
+    def _updateSpatialIndex(self):
+        if self._spatialindex is None:
+            self._spatialindex = SpatialIndex()
+        self._spatialindex.rebuild(self.nodes, self._version)
+
     def addNode(self, node):
         """Takes a node to add to the graph.
         If the node exists, remove it and all its relationships, then re-add it.
         """
-        if node.UID in self.nodes:
-            self.removeNode(node.UID)
+        self._insertNode(node)
+        self._version += 1
+
+    def _insertNode(self, node):
+        """Adds a node like addNode, without changing the structure version.
+        """
+        uid = node.UID
+        if uid in self.nodes:
+            self.removeNode(uid)
 
-        self.nodes[node.UID] = node
-        self.relationships[node.UID] = [[], []]
+        self.nodes[uid] = node
+        outgoings = {}
+        incomings = {}
+        self._adjacency[uid] = (outgoings, incomings)
+        self._relationships[uid] = (AdjacencyView(outgoings),
+                                    AdjacencyView(incomings))
+        if self.autoplacement:
+            self._unplaced[uid] = None
 
     def removeNode(self, nodeID):
         """Removes a node, based on the node's ID.
@@ -46,87 +309,556 @@ class Graph:
                 str(nodeID)))
             return
 
-        outgoings = self.relationships[nodeID][0][:]
+        self._wakeNeighbours(nodeID)
 
-        for outgoingrelation in outgoings:
-            self.removeRelationship(nodeID, outgoingrelation)
+        group = self._nodegroups.pop(nodeID, None)
+        if group is not None:
+            self._leaveGroup(nodeID, group)
+        self._unplaced.pop(nodeID, None)
 
-        incomings = self.relationships[nodeID][1][:]
+        outgoings, incomings = self._adjacency[nodeID]
+
+        for outgoingrelation in outgoings:
+            del self._adjacency[outgoingrelation][1][nodeID]
 
         for incomingrelation in incomings:
-            self.removeRelationship(incomingrelation, nodeID)
+            del self._adjacency[incomingrelation][0][nodeID]
 
-        del self.relationships[nodeID]
+        del self._adjacency[nodeID]
+        del self._relationships[nodeID]
         del self.nodes[nodeID]
+        self._version += 1
 
     def removeRelationship(self, outgoing, incoming):
         """Takes the IDs of the outgoing and incoming nodes.
         """
-        if outgoing not in self.relationships:
+        if outgoing not in self._adjacency:
             DebugMsg("TRIED TO REMOVE RELATIONSHIP {} > {} WHEN OUTGOING DIDN'T EXIST.".format(str(outgoing), str(incoming)))
             return
-        if incoming not in self.relationships:
+        if incoming not in self._adjacency:
             DebugMsg("TRIED TO REMOVE RELATIONSHIP {} > {} WHEN INCOMING DIDN'T EXIST.".format(str(outgoing), str(incoming)))
             return
+        if incoming not in self._adjacency[outgoing][0]:
+            DebugMsg("TRIED TO REMOVE RELATIONSHIP {} > {} WHICH DIDN'T EXIST.".format(str(outgoing), str(incoming)))
+            return
 
-        self.relationships[outgoing][0].remove(incoming)
-        self.relationships[incoming][1].remove(outgoing)
+        del self._adjacency[outgoing][0][incoming]
+        del self._adjacency[incoming][1][outgoing]
+        self.nodes[outgoing].wake()
+        self.nodes[incoming].wake()
+        self._version += 1
 
     def addRelationship(self, outgoing, incoming):
         """Adds a directional relationship to the graph between nodes.
         """
-        if outgoing not in self.relationships:
-            DebugMsg("TRIED TO ADD RELATIONSHIP {} > {} WHEN OUTGOING DIDN'T EXIST.".format(str(outgoing), str(incoming)))
+        errors = self._insertRelationships(((outgoing, incoming),))[0]
+        if errors:
+            DebugMsg(errors[0][1])
             return
-        if incoming not in self.relationships:
-            DebugMsg("TRIED TO ADD RELATIONSHIP {} > {} WHEN INCOMING DIDN'T EXIST.".format(str(outgoing), str(incoming)))
-            return
-        if outgoing == incoming:
-            DebugMsg("TRIED TO ADD RELATIONSHIP BETWEEN NODE {} AND ITSELF.".format(str(outgoing)))
-            return
-        if incoming in self.relationships[outgoing][0]:
-            DebugMsg("RELATIONSHIP {} > {} ALREADY EXISTS.".format(str(outgoing), str(incoming)))
+
+        self.nodes[outgoing].wake()
+        self.nodes[incoming].wake()
+        self._version += 1
+
+    def _insertRelationships(self, pairs):
+        """Adds each (outgoing, incoming) pair of UIDs in pairs, without waking
+        any nodes or changing the structure version. Returns a tuple of
+        (errors, number added), where errors is a list of (index into pairs,
+        error message) for the pairs that couldn't be added.
+        """
+        adjacency = self._adjacency
+        errors = []
+
+        for position, (outgoing, incoming) in enumerate(pairs):
+            outgoingadjacency = adjacency.get(outgoing)
+            if outgoingadjacency is None:
+                errors.append((position, "TRIED TO ADD RELATIONSHIP {} > {} WHEN OUTGOING DIDN'T EXIST.".format(
+                    str(outgoing), str(incoming))))
+                continue
+            incomingadjacency = adjacency.get(incoming)
+            if incomingadjacency is None:
+                errors.append((position, "TRIED TO ADD RELATIONSHIP {} > {} WHEN INCOMING DIDN'T EXIST.".format(
+                    str(outgoing), str(incoming))))
+                continue
+            if outgoing == incoming:
+                errors.append((position, "TRIED TO ADD RELATIONSHIP BETWEEN NODE {} AND ITSELF.".format(
+                    str(outgoing))))
+                continue
+            if incoming in outgoingadjacency[0]:
+                errors.append((position, "RELATIONSHIP {} > {} ALREADY EXISTS.".format(
+                    str(outgoing), str(incoming))))
+                continue
+
+            # adding the relationships in the appropriate locations
+            outgoingadjacency[0][incoming] = None
+            incomingadjacency[1][outgoing] = None
+
+        return errors, len(pairs) - len(errors)
+
+    # bulk construction. adding nodes and relationships one at a time prints
+    # a message for everything that can't be added, and changes the structure
+    # version (so the physics backends rebuild their arrays) every time.
+    # these add a whole batch, changing the version and waking nodes once,
+    # and return a list of error messages instead of printing them.
+    # addNode and addRelationship use the same code to add each one, so the
+    # results are the same either way. for nodes, most of the time goes on
+    # making each node's dictionaries, so addNodes is no quicker than calling
+    # addNode for each. addRelationships is about twice as quick as calling
+    # addRelationship for each pair. numpy arrays of indexes are checked all
+    # at once, rather than one pair at a time.
+
+    def addNodes(self, nodes):
+        """Takes an iterable of nodes to add to the graph. Anything that
+        isn't a Node is used as the UID of a new Node with default values.
+        Like addNode, a node that already exists is removed along with all its
+        relationships, then re-added.
+        Returns a list of error messages, one for each UID that was given more
+        than once (the last one given is the one that is kept).
+        """
+        errors = []
+        added = set()
+
+        for node in nodes:
+            if not isinstance(node, Node):
+                node = Node(node)
+            uid = node.UID
+            if uid in added:
+                errors.append("NODE {} WAS ADDED MORE THAN ONCE.".format(str(uid)))
+            else:
+                added.add(uid)
+            self._insertNode(node)
+
+        if added:
+            self._version += 1
+        return errors
+
+    def addRelationships(self, relationships, uids=None):
+        """Takes an iterable of (outgoing, incoming) pairs, or a numpy array
+        with 2 columns. If uids is given, each pair holds indexes into uids
+        rather than UIDs themselves.
+        Pairs that can't be added (missing nodes, relationships between a node
+        and itself, and relationships that already exist) are skipped.
+        Returns a list of error messages, one for each skipped pair.
+        """
+        if uids is None:
+            if hasattr(relationships, "tolist"):
+                pairs = relationships.tolist()
+            else:
+                pairs = list(relationships)
+            inserterrors, added = self._insertRelationships(pairs)
+            self._finishRelationships(pairs, inserterrors, added)
+            return [message for position, message in inserterrors]
+
+        rows, pairs, errors = _lookupPairs(relationships, uids)
+        inserterrors, added = self._insertRelationships(pairs)
+        for position, message in inserterrors:
+            errors[rows[position]] = message
+        self._finishRelationships(pairs, inserterrors, added)
+        return [errors[row] for row in sorted(errors)]
+
+    def _finishRelationships(self, pairs, errors, added):
+        """Takes the pairs of UIDs given to _insertRelationships, and what it
+        returned. Wakes up the nodes of every relationship that was added.
+        """
+        if not added:
             return
+        # nodes can only be asleep when sleeping is turned on
+        if self.sleepingenabled:
+            failed = set(position for position, message in errors)
+            touched = set()
+            for position, pair in enumerate(pairs):
+                if position not in failed:
+                    touched.update(pair)
+            graphnodes = self.nodes
+            for uid in touched:
+                graphnodes[uid].wake()
+        self._version += 1
+
+    def addRelationshipsFromCSR(self, indptr, indices, uids=None):
+        """Adds relationships from a compressed sparse row adjacency matrix,
+        where row i has an outgoing relationship to every column in
+        indices[indptr[i]:indptr[i + 1]]. For a scipy.sparse csr_matrix m,
+        pass m.indptr and m.indices.
+        Rows and columns are indexes into uids, which defaults to the UIDs of
+        the nodes in the order they were added.
+        Returns a list of error messages, like addRelationships.
+        """
+        if uids is None:
+            uids = list(self.nodes)
+
+        if hasattr(indptr, "shape") and hasattr(indices, "shape"):
+            rows = numpy.repeat(numpy.arange(len(indptr) - 1),
+                                numpy.diff(indptr))
+            columns = indices[indptr[0]:indptr[-1]]
+            return self.addRelationships(numpy.column_stack((rows, columns)),
+                                         uids)
+
+        pairs = [(row, column)
+                 for row in range(len(indptr) - 1)
+                 for column in indices[indptr[row]:indptr[row + 1]]]
+        return self.addRelationships(pairs, uids)
+
+    def save(self, path):
+        """Saves the nodes, relationships and layout of the graph to a binary
+        file at path, which Graph.load can read back. The graph should be
+        locked, or not running. Node data and radii aren't saved.
+        """
+        saveLayout(self, path)
+
+    @classmethod
+    def load(cls, path):
+        """Returns a new graph with the nodes, relationships and layout
+        saved at path by Graph.save.
+        A Node is made for every node in the file, so this takes as long as
+        adding them all would. LayoutFile can be used to read the arrays
+        straight from the file without building a graph.
+        """
+        graph = cls()
+        with LayoutFile(path) as layout:
+            positions = layout.positions.tolist()
+            velocities = layout.velocities.tolist()
+            masses = layout.masses.tolist()
+            charges = layout.charges.tolist()
+            static = layout.static.tolist()
+            graph.addNodes(
+                Node(uid,
+                     position=(positions[2 * i], positions[2 * i + 1]),
+                     velocity=(velocities[2 * i], velocities[2 * i + 1]),
+                     mass=masses[i], static=bool(static[i]), charge=charges[i])
+                for i, uid in enumerate(layout.uids))
+
+            uids = layout.uids
+            indexes = iter(layout.relationships.tolist())
+            graph.addRelationships([(uids[outgoing], uids[incoming])
+                                    for outgoing, incoming in zip(indexes, indexes)])
+        return graph
+
+    # queued changes. these don't need the graph to be locked, and return
+    # straight away. the changes are made at the start of the next step, and
+    # messages for any that can't be made are added to commands.errors
+
+    def queueAddNode(self, node):
+        """Queues a node to be added, like addNode.
+        """
+        self.commands.addNode(node)
+
+    def queueRemoveNode(self, nodeID):
+        """Queues a node to be removed, like removeNode.
+        """
+        self.commands.removeNode(nodeID)
+
+    def queueAddRelationship(self, outgoing, incoming):
+        """Queues a relationship to be added, like addRelationship.
+        """
+        self.commands.addRelationship(outgoing, incoming)
+
+    def queueRemoveRelationship(self, outgoing, incoming):
+        """Queues a relationship to be removed, like removeRelationship.
+        """
+        self.commands.removeRelationship(outgoing, incoming)
 
-        # adding the relationships in the appropriate locations
-        self.relationships[outgoing][0] = self.relationships[outgoing][0] + [incoming]
-        self.relationships[incoming][1] = self.relationships[incoming][1] + [outgoing]
+    def queueUpdateNode(self, nodeID, **attributes):
+        """Queues a change to some of a node's attributes, eg.
+        queueUpdateNode("a", position=(0, 0), data=[1]). The attributes that
+        can be changed are in commands.UPDATABLE_ATTRIBUTES. The node is woken
+        up when they are.
+        """
+        self.commands.updateNode(nodeID, attributes)
+
+    def applyCommands(self):
+        """Applies every queued change now, rather than at the start of the
+        next step. The graph must be locked.
+        """
+        self.commands.apply(self)
+
+    def addIngester(self, ingester):
+        """Takes a StreamIngester, and starts applying its records at the
+        start of every physics step.
+        """
+        self._ingesters.append(ingester)
+        ingester.start()
+
+    def removeIngester(self, ingester):
+        """Stops applying records from ingester, and stops it reading.
+        """
+        ingester.stop()
+        self._ingesters.remove(ingester)
+
+    def step(self, framerate=50.0):
+        """Does a single physics step, as if the simulation was running at
+        framerate. Doesn't need a Grapher or a window, so can be used to
+        compute layouts without a display.
+        Queued changes and records from any ingesters are applied first, then
+        any new nodes are placed.
+        """
+        self.commands.apply(self)
+        for ingester in self._ingesters:
+            ingester.applyBatch(self)
+        self.placeNewNodes()
+
+        Constants.PER_FRAME_FRICTION_COEFFICIENT = math.pow(
+            Constants.FRICTION_COEFFICIENT, 1.0 / framerate)
+        self._doPhysics(framerate)
+
+    def run(self, steps=None, energythreshold=None, timebudget=None,
+            framerate=50.0):
+        """Runs fixed timestep physics steps until one of the following:
+            steps (int): this many steps have been done
+            energythreshold (float): the total kinetic energy of the graph
+                has fallen below this
+            timebudget (float): this many seconds have passed
+
+        At least one of them must be given.
+        Returns a tuple of (positions, number of steps done), where positions
+        is a dictionary of node UIDs to (x, y) positions.
+        """
+        if steps is None and energythreshold is None and timebudget is None:
+            raise ValueError("run needs steps, energythreshold or timebudget.")
+
+        starttime = time.monotonic()
+        stepcount = 0
+
+        while steps is None or stepcount < steps:
+            if timebudget is not None and time.monotonic() - starttime >= timebudget:
+                break
+
+            self.step(framerate)
+            stepcount += 1
+
+            if energythreshold is not None and self.kineticEnergy() < energythreshold:
+                break
+
+        return self.getPositions(), stepcount
+
+    def runMultilevel(self, coarseststeps=300, stepsperlevel=60,
+                      energythreshold=None, framerate=50.0, seed=0,
+                      backend=None):
+        """Lays out the graph from scratch by laying out coarser versions of
+        it first, which is much quicker than Graph.run for big graphs.
+        Every node that isn't static is moved. See multilevel.py.
+        Returns a tuple of (positions, number of steps done), like Graph.run.
+        """
+        return multilevelLayout(self, coarseststeps, stepsperlevel,
+                                energythreshold, framerate, seed, backend)
+
+    def kineticEnergy(self):
+        """Returns the total kinetic energy of all of the non static nodes.
+        """
+        energy = 0.0
+        for n in self.nodes.values():
+            if not n.static:
+                vx, vy = n.velocity
+                energy += 0.5 * n.mass * (vx * vx + vy * vy)
+        return energy
+
+    def getPositions(self):
+        """Returns a dictionary of node UIDs to (x, y) positions.
+        """
+        return dict((uid, n.position) for uid, n in self.nodes.items())
 
     # we do the following things:
         # calculate and apply attractive forces
         # calculate and apply repulsive forces
         # move each node
+        # refresh the spatial index with the new positions
     def _doPhysics(self, framerate):
         """Does all of the physics calculations. Takes framerate.
         """
-        self._calculateAttractiveForces()
-        self._calculateRepulsiveForces()
+        metrics = self.metrics
+        if metrics is not None:
+            starttime = time.perf_counter()
+
+        if self._physicsbackend is not None:
+            self._physicsbackend.doPhysics(self, framerate)
+        elif metrics is None:
+            self._calculateAttractiveForces()
+            self._calculateRepulsiveForces()
+
+            self._moveAllNodes(framerate)
+        else:
+            laptime = starttime
+            self._calculateAttractiveForces()
+            laptime = metrics.lap("attraction", laptime)
+            self._calculateRepulsiveForces()
+            laptime = metrics.lap("repulsion", laptime)
+
+            self._moveAllNodes(framerate)
+            metrics.lap("integration", laptime)
+
+        for group in self._collapsed:
+            groups.gatherCollapsed(self._groupNodes(group))
+
+        self._updateSpatialIndex()
 
-        self._moveAllNodes(framerate)
+        if metrics is not None:
+            metrics.lap("physics", starttime)
 
     def _calculateAttractiveForces(self):
         """We go through every outgoing relationship, and for each one
         apply a force to both the outgoing node and incoming.
+        Relationships between two nodes that can't move are skipped when
+        sleeping is turned on.
         """
-        for nodeUID in self.relationships:
-            for outgoingrelationUID in self.relationships[nodeUID][0]:
-                fx, fy = self.nodes[nodeUID].calculateAttractiveForce(
-                    self.nodes[outgoingrelationUID])
-                self.nodes[nodeUID].applyForce((fx, fy))
-                self.nodes[outgoingrelationUID].applyForce((-fx, -fy))
+        sleeping = self.sleepingenabled
+        for nodeUID in self._adjacency:
+            node = self.nodes[nodeUID]
+            for outgoingrelationUID in self._adjacency[nodeUID][0]:
+                node2 = self.nodes[outgoingrelationUID]
+                if sleeping and not _isAwake(node) and not _isAwake(node2):
+                    continue
+                fx, fy = node.calculateAttractiveForce(node2)
+                node.applyForce((fx, fy))
+                node2.applyForce((-fx, -fy))
 
     def _calculateRepulsiveForces(self):
         """This method calculates and applies repulsive forces for
         each node on oneanother.
         """
-        for index, node in enumerate(list(self.nodes.values())):
-            for node2 in list(self.nodes.values())[index + 1:]:
+        if self._groups:
+            self._calculateGroupedRepulsiveForces()
+            return
+
+        if self.barneshuttheta is not None:
+            self._calculateBarnesHutRepulsiveForces()
+            return
+
+        nodes = list(self.nodes.values())
+        if self.sleepingenabled:
+            # only pairs with at least one awake node need to be calculated
+            awake = [n for n in nodes if _isAwake(n)]
+            asleep = [n for n in nodes if not _isAwake(n)]
+            for index, node in enumerate(awake):
+                for node2 in itertools.chain(
+                        itertools.islice(awake, index + 1, None), asleep):
+                    fx, fy = node.calculateRepulsiveForce(node2)
+                    node.applyForce((fx, fy))
+                    node2.applyForce((-fx, -fy))
+            return
+
+        for index, node in enumerate(nodes):
+            for node2 in itertools.islice(nodes, index + 1, None):
                 fx, fy = node.calculateRepulsiveForce(node2)
                 node.applyForce((fx, fy))
                 node2.applyForce((-fx, -fy))
 
+    def _calculateGroupedRepulsiveForces(self):
+        """Calculates and applies repulsive forces with every group acting as
+        one large node to the nodes outside of it.
+        """
+        nodes = list(self.nodes.values())
+        indices = None
+        if self.sleepingenabled:
+            indices = [i for i, n in enumerate(nodes) if _isAwake(n)]
+
+        forces = groups.calculateRepulsiveForces(
+            [n.position[0] for n in nodes],
+            [n.position[1] for n in nodes],
+            [n.charge for n in nodes],
+            [self._nodegroups.get(n.UID) for n in nodes], indices)
+
+        if indices is not None:
+            nodes = [nodes[i] for i in indices]
+        for node, force in zip(nodes, forces):
+            node.applyForce(force)
+
+    def _calculateBarnesHutRepulsiveForces(self):
+        """Calculates and applies repulsive forces using a quadtree.
+        Static nodes are still in the tree, so they still repel other nodes.
+        """
+        nodes = list(self.nodes.values())
+        indices = None
+        if self.sleepingenabled:
+            indices = [i for i, n in enumerate(nodes) if _isAwake(n)]
+
+        forces = quadtree.calculateRepulsiveForces(
+            [n.position[0] for n in nodes],
+            [n.position[1] for n in nodes],
+            [n.charge for n in nodes],
+            self.barneshuttheta, indices)
+
+        if indices is not None:
+            nodes = [nodes[i] for i in indices]
+        for node, force in zip(nodes, forces):
+            node.applyForce(force)
+
     def _moveAllNodes(self, framerate):
         """Applies each node's forces to it.
         """
+        if not self.sleepingenabled:
+            self.integrator.moveNodes(self, list(self.nodes.values()), framerate)
+            return
+
+        awake = []
         for n in self.nodes.values():
-            n.move(framerate)
+            if n.sleeping or n.static:
+                # throw away any forces from awake nodes
+                n.takeAppliedForce()
+            else:
+                awake.append(n)
+
+        forces = [n.force for n in awake]
+        oldpositions = [n.position for n in awake]
+        self.integrator.moveNodes(self, awake, framerate)
+
+        moved = []
+        for n, force, (oldx, oldy) in zip(awake, forces, oldpositions):
+            n.updateSleeping(force)
+            x, y = n.position
+            if math.hypot(x - oldx, y - oldy) > Constants.WAKE_DISTANCE:
+                moved.append(n.UID)
+
+        for uid in moved:
+            self._wakeNeighbours(uid)
+
+
+def _lookupPair(pair, uids):
+    """Returns the UIDs at the two indexes in pair. Raises IndexError for
+    negative indexes too, rather than counting from the end.
+    """
+    outgoing, incoming = pair
+    if outgoing < 0 or incoming < 0:
+        raise IndexError(pair)
+    return uids[outgoing], uids[incoming]
+
+
+def _lookupPairs(pairs, uids):
+    """Takes pairs of indexes into uids, as an iterable or a numpy array with
+    2 columns. Returns (rows, uid pairs, errors), where uid pairs has the
+    UIDs of each pair that could be looked up, rows has the position of each
+    of them in pairs, and errors is a dictionary of the position of every
+    other pair to its error message.
+    A numpy array is checked all at once, which is much quicker.
+    """
+    errors = {}
+    if hasattr(pairs, "shape"):
+        pairs = numpy.asarray(pairs).reshape(-1, 2)
+        inrange = ((pairs >= 0) & (pairs < len(uids))).all(axis=1)
+        rows = numpy.flatnonzero(inrange)
+        for row in numpy.flatnonzero(~inrange).tolist():
+            errors[row] = _indexError(pairs[row, 0], pairs[row, 1])
+        lookup = uids.__getitem__
+        uidpairs = list(zip(map(lookup, pairs[rows, 0].tolist()),
+                            map(lookup, pairs[rows, 1].tolist())))
+        return rows.tolist(), uidpairs, errors
+
+    rows = []
+    uidpairs = []
+    for row, pair in enumerate(pairs):
+        try:
+            uidpairs.append(_lookupPair(pair, uids))
+        except IndexError:
+            errors[row] = _indexError(pair[0], pair[1])
+            continue
+        rows.append(row)
+    return rows, uidpairs, errors
+
+
+def _indexError(outgoing, incoming):
+    return "TRIED TO ADD RELATIONSHIP {} > {} WITH AN INDEX OUTSIDE OF UIDS.".format(
+        str(outgoing), str(incoming))
+
+
+def _isAwake(node):
+    """Whether the node can currently be moved by the physics.
+    """
+    return not (node.static or node.sleeping)
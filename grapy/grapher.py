@@ -18,7 +18,11 @@ from threading import Thread
 import pygame
 from pygame.locals import *
 
+from .colours import relationshipColour
+from .events import EventQueue
 from .graph import Graph
+from .snapshot import GraphSnapshot
+from .spritecache import SpriteCache
 from .framerateaverager import FramerateAverager
 from .constants import Constants
 
@@ -38,6 +42,52 @@ def checkCollision(node, pos):
     return True
 
 
+def pointInRect(point, rect):
+    """Takes a point and a rect given as ((left, top), (right, bottom)).
+    """
+    return (rect[0][0] <= point[0] <= rect[1][0] and
+            rect[0][1] <= point[1] <= rect[1][1])
+
+
+def segmentIntersectsRect(start, end, rect):
+    """Whether any part of the line from start to end is inside rect,
+    including when both ends are outside but the line crosses it.
+    rect is given as ((left, top), (right, bottom)).
+    """
+    (left, top), (right, bottom) = rect
+    x1, y1 = start
+    x2, y2 = end
+
+    # both ends off the same side
+    if (x1 < left and x2 < left) or (x1 > right and x2 > right):
+        return False
+    if (y1 < top and y2 < top) or (y1 > bottom and y2 > bottom):
+        return False
+
+    if pointInRect(start, rect) or pointInRect(end, rect):
+        return True
+
+    # clipping the line against each edge of the rect (Liang-Barsky)
+    dx = x2 - x1
+    dy = y2 - y1
+    entering = 0.0
+    leaving = 1.0
+    for p, q in ((-dx, x1 - left), (dx, right - x1),
+                 (-dy, y1 - top), (dy, bottom - y1)):
+        if p == 0:
+            if q < 0:
+                return False
+        else:
+            t = q / float(p)
+            if p < 0:
+                entering = max(entering, t)
+            else:
+                leaving = min(leaving, t)
+            if entering > leaving:
+                return False
+    return True
+
+
 def tupleAdd(tuple1, tuple2):
     """Takes two tuples with two values each, and returns a tuple with
     the value t1 + t2
@@ -52,43 +102,45 @@ def tupleSubtract(tuple1, tuple2):
     return (tuple1[0] - tuple2[0], tuple1[1] - tuple2[1])
 
 
+def _addLap(times, phase, since):
+    """Adds the time from since until now to phase in times, and returns now
+    so that it can be used as the start of the next phase.
+    """
+    now = time.perf_counter()
+    times[phase] = times.get(phase, 0.0) + now - since
+    return now
+
+
 class Grapher:
 
     # Some other draw functions that we might want to use
-    def drawwithoutcolouring(self, screen, node, graph, position):
+    def drawwithoutcolouring(self, screen, node, snapshot, position):
         """
         Args:
             screen
             node
-            graph
+            snapshot: the GraphSnapshot being drawn
             position (tuple): Position of the node
                 (after compensation for the camera's position)
         """
-        pygame.draw.circle(screen, (50, 50, 255), position, node.radius, 0)
+        self.queueBlit(self.spritecache.getCircle(node.radius, (50, 50, 255)),
+                       tupleSubtract(position, (node.radius, node.radius)))
 
-        f = pygame.font.Font(None, 20).render(node.UID, 1, (255, 255, 255))
+        f = self.spritecache.getText(str(node.UID), 20, (255, 255, 255))
         # blitting the text with a 5 pixel offset
-        screen.blit(f, tupleSubtract(position, (5, 5)))
+        self.queueBlit(f, tupleSubtract(position, (5, 5)))
 
-    def defaultnodedrawfunction(self, screen, node, graph, position):
-        relationships = len(
-            graph.relationships[node.UID][0]) + len(graph.relationships[node.UID][1])
+    def defaultnodedrawfunction(self, screen, node, snapshot, position):
+        noderelationships = snapshot.relationships.get(node.UID, ((), ()))
+        relationships = len(noderelationships[0]) + len(noderelationships[1])
 
-        # n produces a colour gradient between 0 and 254,
-        # depending on the number of relationships
-        n = (((1 + 1.0 / (0.35 * (relationships + 1)))**(0.35 * relationships) - 1) / 1.71828) * 254  # tends to 254 as relaitonships tend to infinity
+        circle = self.spritecache.getCircle(
+            node.radius, relationshipColour(relationships))
+        self.queueBlit(circle, tupleSubtract(position, (node.radius, node.radius)))
 
-        pygame.draw.circle(
-            screen,
-            (int(n), 0, 255 - int(n)),
-            position,
-            node.radius,
-            0
-        )
-
-        f = pygame.font.Font(None, 20).render(node.UID, 1, (255, 255, 255))
+        f = self.spritecache.getText(str(node.UID), 20, (255, 255, 255))
         # blitting the text with a 5 pixel offset
-        screen.blit(f, tupleSubtract(position, (5, 5)))
+        self.queueBlit(f, tupleSubtract(position, (5, 5)))
 
     def defaultvertexdrawfunction(self, screen, start, end):
         pygame.draw.aaline(screen, (255, 255, 255), start, end, 1)
@@ -101,6 +153,10 @@ class Grapher:
 
     graph = None
 
+    # the draw functions are called on the drawing thread without the graph's
+    # lock, so they shouldn't use the graph. node draw functions are given
+    # the GraphSnapshot being drawn in its place, and background and
+    # foreground draw functions can use getSnapshot().
     backgrounddrawfunction = None
     nodedrawfunction = None
     linedrawfunction = None
@@ -109,6 +165,24 @@ class Grapher:
     size = (800, 600)
     camera = None
 
+    # nodes and lines further than this many pixels outside of the window
+    # aren't passed to the draw functions
+    cullingmargin = 50
+
+    # the area around a node's position, ((left, top), (right, bottom)),
+    # that its draw function might draw in, including its label.
+    # the node's radius is always included as well.
+    nodedrawextent = ((-40, -40), (160, 60))
+
+    # when this is True, frames where nothing has moved by more than a pixel
+    # aren't drawn at all, and when only a few nodes have moved, only the
+    # areas around them are drawn and updated on the screen.
+    # draw functions which change what they draw without any node moving
+    # should call redraw() when they do. when it is None, it is only done
+    # while all of the draw functions are the grapher's own, since other
+    # draw functions might not; set it to True to use it with them as well.
+    dirtyredraw = None
+
     running = False
 
     # this can be changed using the stop() function with either another thread
@@ -124,6 +198,17 @@ class Grapher:
 
     _thread = None
 
+    # the physics runs in its own thread at a fixed timestep, independent of
+    # the framerate that things are drawn at. after every step it publishes a
+    # snapshot of the graph, which the drawing thread draws from.
+    _physicsframerate = 50
+    _physicsthread = None
+    _snapshot = GraphSnapshot()
+
+    # a Metrics object which the time taken by each part of a frame is
+    # recorded in, or None to not record anything. see metrics.py
+    metrics = None
+
     # 0 - the mouse is unclicked and not performing any tasks
     # 1 - the mouse is controlling a node
     # 2 - the mouse is controlling the camera
@@ -133,10 +218,24 @@ class Grapher:
     _clickednode = None
     _clickednodestatic = False
 
-    _eventslist = []
+    # the mouse events, see events.py
+    events = None
+
+    # used for only drawing what has changed since the last frame.
+    # _drawnpositions holds where each node was last drawn, in whole pixels
+    _fullredraw = True
+    _drawnpositions = None
+    _drawnversion = None
+    _drawncamera = None
+
+    # rendered text and circles are kept in the sprite cache. node draw
+    # functions can queue surfaces to be blitted, and they are all blitted
+    # at once, in the order they were queued, after every node has been drawn.
+    spritecache = None
+    _blits = None
 
     def __init__(self, graph=None, size=(800, 600), nodedrawfunction=None,
-                 vertexdrawfunction=None, framerate=50):
+                 vertexdrawfunction=None, framerate=50, physicsframerate=50):
         if graph is None:
             self.graph = Graph()
         else:
@@ -158,11 +257,26 @@ class Grapher:
         self.backgrounddrawfunction = self.defaultbackgrounddrawfunction
         self.foregrounddrawfunction = self.defaultforegrounddrawfunction
 
+        self.spritecache = SpriteCache()
+        self._blits = []
+
+        self.events = EventQueue()
+
         self._frameaverager = FramerateAverager()
-        _targetframerate = framerate
+        self._targetframerate = framerate
+        self._physicsframerate = physicsframerate
 
     def setGraph(self, graph):
         self.graph = graph
+        self.graph.metrics = self.metrics
+        self._snapshot = GraphSnapshot()
+
+    def setMetrics(self, metrics):
+        """Takes a Metrics object to record timings in, or None to stop
+        recording them. The graph's physics is recorded in it too.
+        """
+        self.metrics = metrics
+        self.graph.metrics = metrics
 
     def setNodeDrawFunction(self, nodedrawfunction):
         self.nodedrawfunction = nodedrawfunction
@@ -176,25 +290,40 @@ class Grapher:
     def setForegroundDrawFunction(self, foregrounddrawfunction):
         self.foregrounddrawfunction = foregrounddrawfunction
 
-    # Gets a list of all of the mouse and key events since the last call.
-    def getEvents(self):
-        e = self._eventslist[:]
-        self._eventslist = []
-        return e
+    # Gets a list of all of the mouse events since the last call.
+    # if there aren't any, waits for up to "timeout" seconds for one
+    # (None waits until there is one). the graph doesn't need to be locked.
+    def getEvents(self, timeout=0):
+        return self.events.get(timeout)
+
+    # "callback" is called with every mouse event, on the drawing thread
+    # while the graph is locked, so it can change the graph but should be quick
+    def addEventCallback(self, callback):
+        self.events.addCallback(callback)
+
+    def removeEventCallback(self, callback):
+        self.events.removeCallback(callback)
 
     # Gets the mosue position considering the camera position
     def getRelativeMousePosition(self):
         p = pygame.mouse.get_pos()
         return (p[0] + self.camera.position[0], p[1] + self.camera.position[1])
 
-    # returns the UID of the first node that it finds to collide with
-        # "position". "position" is a tuple of x and y coords.
-    # if no nodes collide, None is returned
+    # returns the UID of a node that collides with "position".
+    # "position" is a tuple of x and y coords. if several nodes collide, the
+    # one closest to "position" is returned. if no nodes collide, None is returned
     def findCollidingNode(self, position):
-        for n in self.graph.nodes:
-            if checkCollision(self.graph.nodes[n], position):
-                return n
-        return None
+        return self.graph.getSpatialIndex().findCollidingNode(position)
+
+    # returns a list of the UIDs of every node inside "rect".
+    # "rect" is a pair of opposite corners: ((x1, y1), (x2, y2))
+    def findNodesInRect(self, rect):
+        return self.graph.getSpatialIndex().findNodesInRect(rect)
+
+    # returns a list of the UIDs of the "k" nodes nearest to "position",
+    # nearest first
+    def findNearestNodes(self, position, k=1):
+        return self.graph.getSpatialIndex().findNearestNodes(position, k)
 
     def _calculateFrictionCoefficient(self, framerate):
         """Calculates the frictional coefficient for the frame.
@@ -203,8 +332,68 @@ class Grapher:
             Constants.FRICTION_COEFFICIENT, 1.0 / framerate)
 
     def start(self):
+        self._quit = False
+        if self.events.closed:
+            self.events = EventQueue()
         self._thread = Thread(target=self._run)
         self._thread.start()
+        self._physicsthread = Thread(target=self._runPhysics)
+        self._physicsthread.start()
+
+    def queueBlit(self, surface, position):
+        """Queues a surface to be blitted at position once every node has
+        been drawn. Anything drawn straight to the screen by a node draw
+        function will end up underneath the queued surfaces.
+        """
+        self._blits.append((surface, position))
+
+    def _flushBlits(self, screen):
+        if self._blits:
+            screen.blits(self._blits, False)
+            del self._blits[:]
+
+    def redraw(self):
+        """Makes the next frame redraw the whole screen.
+        """
+        self._fullredraw = True
+
+    def getSnapshot(self):
+        """Returns the snapshot of the graph from the latest physics step.
+        """
+        return self._snapshot
+
+    # the physics loop which is run in its own thread.
+    # the graph is only locked for the length of a single step
+    def _runPhysics(self):
+        interval = 1.0 / self._physicsframerate
+        steps = 0
+        nexttime = time.monotonic()
+
+        while not self._quit:
+            metrics = self.metrics
+            if metrics is not None:
+                starttime = time.perf_counter()
+            self.graph.lock()
+            if metrics is not None:
+                metrics.lap("lockwait.physics", starttime)
+
+            self.graph.step(self._physicsframerate)
+            steps = steps + 1
+            snapshot = GraphSnapshot.fromGraph(self.graph, steps, self._snapshot)
+            self.graph.unlock()
+
+            # swapping the reference is atomic, so the drawing thread always
+            # sees either the old or the new snapshot, never a partial one
+            self._snapshot = snapshot
+
+            nexttime = nexttime + interval
+            delay = nexttime - time.monotonic()
+            if delay > 0:
+                time.sleep(delay)
+            else:
+                # the physics can't keep up, so let it run slower rather
+                # than trying to catch up
+                nexttime = time.monotonic()
 
     def _processInput(self):
         for event in pygame.event.get():
@@ -217,6 +406,8 @@ class Grapher:
                 self._processMouseButtonRelease(event)
             elif event.type == MOUSEMOTION:
                 self._processMouseMovement(event)
+            elif event.type == VIDEOEXPOSE:
+                self.redraw()
 
         pygame.event.clear()
 
@@ -237,8 +428,7 @@ class Grapher:
             else:
                 self._mousemode = 2
 
-        # the code to add an event to the event queue will go here
-        self._eventslist = self._eventslist + [(0, event.button, collidingnode)]
+        self.events.put((0, event.button, collidingnode))
 
     def _processMouseButtonRelease(self, event):
         collidingnode = self.findCollidingNode(self.getRelativeMousePosition())
@@ -247,9 +437,10 @@ class Grapher:
             if self._mousemode == 1:  # deselecting the node that was selected
                 if self._clickednode in self.graph.nodes:
                     self.graph.nodes[self._clickednode].static = self._clickednodestatic
+                    self.graph.wakeNode(self._clickednode)
             self._resetmousemode()
 
-        self._eventslist = self._eventslist + [(1, event.button, collidingnode)]
+        self.events.put((1, event.button, collidingnode))
 
     def _processMouseMovement(self, event):
         if self._mousemode == 1:
@@ -257,6 +448,7 @@ class Grapher:
             # it could have been deleted since the last mouse move
             if self._clickednode in self.graph.nodes:
                 self.graph.nodes[self._clickednode].position = self.getRelativeMousePosition()
+                self.graph.wakeNode(self._clickednode)
             else:
                 self._resetmousemode()
         elif self._mousemode == 2:
@@ -270,7 +462,207 @@ class Grapher:
         self._clickednode = None
         self._mousemode = 0
 
-    # the main function which will be run in a separate thread
+    def _nodeRect(self, node, position):
+        """Returns the area a node might be drawn in, in graph coordinates.
+        """
+        (left, top), (right, bottom) = self.nodedrawextent
+        radius = node.radius
+        return ((position[0] + min(left, -radius), position[1] + min(top, -radius)),
+                (position[0] + max(right, radius), position[1] + max(bottom, radius)))
+
+    def _drawRegion(self, screen, snapshot, region, cameraposition=None,
+                    times=None):
+        """Draws everything that touches region, given in graph coordinates
+        as ((left, top), (right, bottom)), with the top left of screen at
+        cameraposition (by default, the camera's position).
+        When there are metrics, the time taken by each phase is recorded in
+        them, or added to the dictionary times if it is given, so that a
+        frame drawn a region at a time can be recorded once.
+        """
+        if cameraposition is None:
+            cameraposition = self.camera.position
+        cam_x, cam_y = cameraposition
+        (left, top), (right, bottom) = region
+
+        metrics = self.metrics
+        if metrics is not None:
+            phasetimes = {} if times is None else times
+            laptime = time.perf_counter()
+
+        self.backgrounddrawfunction(screen, cameraposition)
+        if metrics is not None:
+            laptime = _addLap(phasetimes, "callbacks", laptime)
+
+        for start, end in snapshot.edges:  # drawing lines
+            if not segmentIntersectsRect(start, end, region):
+                continue
+            # Account for the camera position before passing it to
+            # the draw method
+            self.vertexdrawfunction(
+                screen,
+                (start[0] - cam_x, start[1] - cam_y),
+                (end[0] - cam_x, end[1] - cam_y))
+        if metrics is not None:
+            laptime = _addLap(phasetimes, "edges", laptime)
+
+        for n, position in snapshot.nodes:  # drawing nodes
+            (nodeleft, nodetop), (noderight, nodebottom) = self._nodeRect(n, position)
+            if (noderight < left or nodeleft > right or
+                    nodebottom < top or nodetop > bottom):
+                continue
+            self.nodedrawfunction(
+                screen, n, snapshot,
+                (int(position[0] - cam_x), int(position[1] - cam_y)))
+        self._flushBlits(screen)
+        if metrics is not None:
+            laptime = _addLap(phasetimes, "nodes", laptime)
+
+        self.foregrounddrawfunction(screen, cameraposition)
+        if metrics is not None:
+            _addLap(phasetimes, "callbacks", laptime)
+            if times is None:
+                for phase, seconds in phasetimes.items():
+                    metrics.record(phase, seconds)
+
+    def _useDirtyRedraw(self):
+        """Returns whether only the parts of the screen that have changed
+        should be drawn, see dirtyredraw.
+        """
+        if self.dirtyredraw is not None:
+            return self.dirtyredraw
+        return (self.nodedrawfunction in (self.defaultnodedrawfunction,
+                                          self.drawwithoutcolouring) and
+                self.vertexdrawfunction == self.defaultvertexdrawfunction and
+                self.backgrounddrawfunction == self.defaultbackgrounddrawfunction and
+                self.foregrounddrawfunction == self.defaultforegrounddrawfunction)
+
+    def _draw(self, screen, snapshot):
+        """Draws a frame. Draws everything if the camera has moved, the graph
+        has changed or lots of nodes have moved, otherwise only redraws the
+        areas around nodes which have moved by more than a pixel.
+        """
+        camera = tuple(self.camera.position)
+        drawn = self._drawnpositions
+
+        dirtyrects = None
+        if (self._useDirtyRedraw() and not self._fullredraw and drawn is not None and
+                snapshot.version == self._drawnversion and camera == self._drawncamera):
+            dirtyrects = self._findDirtyRects(snapshot, drawn)
+            if dirtyrects is not None and not dirtyrects:
+                # nothing has moved, so the screen is already up to date
+                return
+
+        if dirtyrects is None:
+            cam_x, cam_y = camera
+            margin = self.cullingmargin
+            visible = ((cam_x - margin, cam_y - margin),
+                       (cam_x + self.size[0] + margin, cam_y + self.size[1] + margin))
+            self._drawRegion(screen, snapshot, visible)
+            self._updateDisplay()
+
+            self._drawnpositions = dict(
+                (n.UID, (int(position[0]), int(position[1])))
+                for n, position in snapshot.nodes)
+            self._drawnversion = snapshot.version
+            self._drawncamera = camera
+            self._fullredraw = False
+            return
+
+        cam_x, cam_y = camera
+        metrics = self.metrics
+        times = None if metrics is None else {}
+        for rect in dirtyrects:
+            screen.set_clip(rect)
+            self._drawRegion(screen, snapshot, (
+                (rect.left + cam_x, rect.top + cam_y),
+                (rect.right + cam_x, rect.bottom + cam_y)), times=times)
+        screen.set_clip(None)
+        if metrics is not None:
+            # one time for each phase of the frame, however many regions
+            # it was drawn in
+            for phase, seconds in times.items():
+                metrics.record(phase, seconds)
+        self._updateDisplay(dirtyrects)
+
+        # nodes that moved less than a pixel keep their old drawn position,
+        # so that they are redrawn once they have drifted far enough
+        for n, position in snapshot.nodes:
+            old = drawn[n.UID]
+            if abs(position[0] - old[0]) > 1 or abs(position[1] - old[1]) > 1:
+                drawn[n.UID] = (int(position[0]), int(position[1]))
+
+    def _updateDisplay(self, rects=None):
+        """Pushes the frame to the screen. Only pushes rects if they are given.
+        """
+        metrics = self.metrics
+        if metrics is not None:
+            starttime = time.perf_counter()
+
+        if rects is None:
+            pygame.display.flip()
+        else:
+            pygame.display.update(rects)
+
+        if metrics is not None:
+            metrics.lap("flip", starttime)
+
+    def _findDirtyRects(self, snapshot, drawn):
+        """Returns a list of the screen rects that need redrawing because nodes
+        have moved more than a pixel since they were drawn. Returns None if so
+        much has changed that it is quicker to redraw everything.
+        """
+        moved = set()
+        for n, position in snapshot.nodes:
+            old = drawn.get(n.UID)
+            if old is None:
+                return None
+            if abs(position[0] - old[0]) > 1 or abs(position[1] - old[1]) > 1:
+                moved.add(n.UID)
+
+        if not moved:
+            return []
+        if len(moved) * 4 > len(snapshot.nodes):
+            return None
+
+        cam_x, cam_y = self.camera.position
+        screenrect = pygame.Rect((0, 0), self.size)
+
+        def toScreenRect(corner1, corner2, padding):
+            left = min(corner1[0], corner2[0]) - cam_x - padding
+            top = min(corner1[1], corner2[1]) - cam_y - padding
+            right = max(corner1[0], corner2[0]) - cam_x + padding
+            bottom = max(corner1[1], corner2[1]) - cam_y + padding
+            return pygame.Rect(int(left), int(top),
+                               int(right - left) + 1, int(bottom - top) + 1)
+
+        rects = []
+        for n, position in snapshot.nodes:
+            if n.UID in moved:
+                rects.append(toScreenRect(*self._nodeRect(n, drawn[n.UID]), padding=1))
+                rects.append(toScreenRect(*self._nodeRect(n, position), padding=1))
+
+        for (start, end), (outgoing, incoming) in zip(snapshot.edges, snapshot.edgeuids):
+            if outgoing in moved or incoming in moved:
+                rects.append(toScreenRect(drawn[outgoing], drawn[incoming], 2))
+                rects.append(toScreenRect(start, end, 2))
+
+        rects = [r.clip(screenrect) for r in rects]
+        rects = [r for r in rects if r.width > 0 and r.height > 0]
+        if not rects:
+            return []
+
+        # redrawing lots of small areas means calling the draw functions for
+        # each one, so past a point it is better to merge them in to one
+        if len(rects) > 16:
+            rects = [rects[0].unionall(rects[1:])]
+
+        area = sum(r.width * r.height for r in rects)
+        if area * 2 > screenrect.width * screenrect.height:
+            return None
+
+        return rects
+
+    # the main drawing function which will be run in a separate thread
     def _run(self):
         self.running = True
 
@@ -279,11 +671,9 @@ class Grapher:
         screen = pygame.display.set_mode(self.size)
         pygame.display.set_caption("GraPy")
 
-        framecount = 0
         frameclock = pygame.time.Clock()
         # The main loop
         while not self._quit:
-            framecount = framecount + 1
             self._frametime = frameclock.tick_busy_loop(self._targetframerate)
 
             # adding a new frametime to the frameaverager and getting the
@@ -291,59 +681,34 @@ class Grapher:
             self._frameaverager.addFrametime(self._frametime)
             self._realframerate = self._frameaverager.getAverageFramerate()
 
-            # locking the graph datastructure so that it canot be changed while
-            # we iterate over it
+            metrics = self.metrics
+            if metrics is not None:
+                starttime = time.perf_counter()
+
+            # input can change the graph (eg. dragging a node),
+            # so the graph is only locked while it is processed
             self.graph.lock()
+            if metrics is not None:
+                laptime = metrics.lap("lockwait.input", starttime)
 
-            starttime = time.clock()
             # Processing mouse and key events
             self._processInput()
-            inputtime = time.clock() - starttime
-
-            starttime = time.clock()
-            # doing all physics
-            self._calculateFrictionCoefficient(self._realframerate)
-            self.graph._doPhysics(self._realframerate)  # self._realframerate)
-            physicstime = time.clock() - starttime
-
-            starttime = time.clock()
-            # doing all drawing
-            self.backgrounddrawfunction(screen, self.camera.position)
-
-            for r in self.graph.relationships:  # drawing lines
-                cam_x = self.camera.position[0]
-                cam_y = self.camera.position[1]
-                for i in self.graph.relationships[r][0]:
-                    start = (self.graph.nodes[r].position[0] - cam_x,
-                             self.graph.nodes[r].position[1] - cam_y)
-                    end = (self.graph.nodes[i].position[0] - cam_x,
-                           self.graph.nodes[i].position[1] - cam_y)
-                    # Account for the camera position before passing it to
-                    # the draw method
-                    self.vertexdrawfunction(screen, start, end)
-
-            for n in self.graph.nodes.values():  # drawing nodes
-                pos = tupleSubtract(n.position, self.camera.position)
-                self.nodedrawfunction(
-                    screen, n, self.graph, (int(pos[0]), int(pos[1])))
-
-            pygame.display.flip()
 
-            drawtime = time.clock() - starttime
-            # unlocking the graph to allow other threads to use/edit it
             self.graph.unlock()
+            if metrics is not None:
+                metrics.lap("input", laptime)
 
-            # the slow print statements cause frametime abnormalities,
-            # leading to bizarre node behaviour
-            if(framecount % 200 == 0):
-                print("TIMES:  ", "Input", inputtime, "   Physics",
-                      physicstime, "   Draw", drawtime)
-                print("frametime:", self._frametime)
-                print("framerate used in calculation:", self._realframerate)
+            # doing all drawing, from the latest snapshot rather than the
+            # graph itself so that the graph doesn't need to be locked
+            self._draw(screen, self._snapshot)
 
-                framecount = 0
+            if metrics is not None:
+                metrics.lap("frame", starttime)
+                metrics.frameDone()
 
         self.running = False
+        # stopping anything that is waiting for events
+        self.events.close()
 
 
 class Camera():
@@ -0,0 +1,193 @@
+from .constants import Constants
+
+# Node groups. A group acts as one large node to the nodes outside of it,
+# and as separate nodes to the nodes inside it.
+#
+# when a graph has groups, each node is repelled exactly by the other nodes in
+# its group, and every other group acts on it as a single charge (the total of
+# the group's charges) at the group's charge weighted centre. nodes that
+# aren't in a group are treated as groups of one. a graph of n nodes in k
+# groups costs about n * (k + n / k) pairs a step instead of n * n.
+#
+# so that the forces are equal and opposite (otherwise the graph drifts off
+# and never settles), each node feels half of the force from every other
+# group's centre, and that group's members share the reaction to it, split
+# between them by their charge. since the group's members do the same with
+# the node's group, every pair of groups gets the whole force between them.
+# between two nodes that aren't in groups this is the same as doing them
+# exactly.
+#
+# a collapsed group keeps all of its nodes on top of each other at their
+# centre of mass, so it moves as one node. the forces between its own nodes
+# cancel out, so only the forces from outside move it.
+
+
+def _exactForce(px, py, q, x, y, charge, offset, constant):
+    """The same force as Node.calculateRepulsiveForce, with offset being the
+    direction offset from findDistanceTuple.
+    """
+    dx = x - px
+    dy = y - py
+    distance = (dx * dx + dy * dy) ** 0.5
+    if distance < 15:
+        distance = 15
+    charge = q * charge
+    magnitude = -constant * charge / ((distance * 0.2) ** 2 + charge)
+    dx += offset
+    dy += offset
+    length = (dx * dx + dy * dy) ** 0.5
+    return dx / length * magnitude, dy / length * magnitude
+
+
+def calculateRepulsiveForces(xs, ys, charges, groups, indices=None):
+    """Takes lists of x positions, y positions, charges and the group of each
+    node (None for a node that isn't in a group). Returns a list of (fx, fy)
+    repulsive forces, one for each index in indices (or every node if
+    indices is None).
+
+    Like a quadtree cell, the charge product in the denominator of a group's
+    force uses the group's average charge.
+    """
+    count = len(xs)
+    if indices is None:
+        indices = range(count)
+
+    # every group, including each ungrouped node as a group of one, as a list
+    # of member indices, and which of those lists each node is in
+    members = {}
+    units = []
+    unitof = [0] * count
+    for i, group in enumerate(groups):
+        if group is None:
+            unitof[i] = len(units)
+            units.append([i])
+        else:
+            unit = members.get(group)
+            if unit is None:
+                unit = members[group] = len(units)
+                units.append([])
+            unitof[i] = unit
+            units[unit].append(i)
+
+    # the total charge and charge weighted centre of each of them
+    centres = []
+    totals = []
+    for unit, indexes in enumerate(units):
+        charge = 0.0
+        weightedx = 0.0
+        weightedy = 0.0
+        for j in indexes:
+            q = charges[j]
+            charge += q
+            weightedx += xs[j] * q
+            weightedy += ys[j] * q
+        totals.append(charge)
+        if charge != 0:
+            centres.append((unit, weightedx / charge, weightedy / charge,
+                            charge, len(indexes)))
+
+    # only the groups with a node that needs its force calculated get
+    # reactions, so a node that isn't in indices only has to look at those
+    wanted = set(indices)
+    wantedunits = set(unitof[i] for i in wanted)
+    wantedcentres = [centre for centre in centres if centre[0] in wantedunits]
+
+    constant = Constants.REPULSIVE_FORCE_CONSTANT
+    forcesx = [0.0] * count
+    forcesy = [0.0] * count
+    # the reaction each group's members share, before it is split
+    reactionsx = [0.0] * len(units)
+    reactionsy = [0.0] * len(units)
+
+    for i in range(count):
+        px = xs[i]
+        py = ys[i]
+        q = charges[i]
+        fx = 0.0
+        fy = 0.0
+        ownunit = unitof[i]
+
+        if i in wanted:
+            # nodes in the same group are done exactly. the offset matches
+            # the one in findDistanceTuple, from the point of view of the
+            # lower index.
+            for j in units[ownunit]:
+                if j == i:
+                    continue
+                forcex, forcey = _exactForce(px, py, q, xs[j], ys[j], charges[j],
+                                             0.01 if j > i else -0.01, constant)
+                fx += forcex
+                fy += forcey
+            others = centres
+        else:
+            others = wantedcentres
+
+        for unit, x, y, charge, unitcount in others:
+            if unit == ownunit:
+                continue
+            dx = x - px
+            dy = y - py
+            distance = (dx * dx + dy * dy) ** 0.5
+            if distance < 15:
+                distance = 15
+            charge = q * charge
+            magnitude = -0.5 * constant * charge / (
+                (distance * 0.2) ** 2 + charge / unitcount)
+            dx += 0.01 if unit > ownunit else -0.01
+            dy += 0.01 if unit > ownunit else -0.01
+            length = (dx * dx + dy * dy) ** 0.5
+            forcex = dx / length * magnitude
+            forcey = dy / length * magnitude
+            fx += forcex
+            fy += forcey
+            reactionsx[unit] -= forcex
+            reactionsy[unit] -= forcey
+
+        forcesx[i] = fx
+        forcesy[i] = fy
+
+    forces = []
+    for i in indices:
+        unit = unitof[i]
+        # a group without any charge has no centre, so it gets no reaction
+        share = charges[i] / totals[unit] if totals[unit] else 0.0
+        forces.append((forcesx[i] + reactionsx[unit] * share,
+                       forcesy[i] + reactionsy[unit] * share))
+
+    return forces
+
+
+def gatherCollapsed(nodes):
+    """Takes the nodes of a collapsed group, and moves them all to their
+    centre of mass with their average velocity (weighted by mass), so that
+    they move together as one node.
+    """
+    moving = [n for n in nodes if not n.static]
+    if not moving:
+        return
+    static = [n for n in nodes if n.static]
+
+    if static:
+        # a static node holds the whole group in place
+        x, y = static[0].position
+        vx, vy = 0.0, 0.0
+    else:
+        mass = 0.0
+        x = y = vx = vy = 0.0
+        for n in moving:
+            m = n.mass
+            px, py = n.position
+            nvx, nvy = n.velocity
+            mass += m
+            x += px * m
+            y += py * m
+            vx += nvx * m
+            vy += nvy * m
+        x /= mass
+        y /= mass
+        vx /= mass
+        vy /= mass
+
+    for n in moving:
+        n.position = (x, y)
+        n.velocity = (vx, vy)
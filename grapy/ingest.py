@@ -0,0 +1,270 @@
+import csv
+import json
+import queue
+import random
+import threading
+
+from .constants import Constants
+from .node import Node
+
+# Streaming ingestion feeds a graph from an iterator of records, such as
+# a crawler or a log reader, without the producer having to lock the graph.
+#
+# a background thread pulls records from the iterator into a bounded queue,
+# so a producer that is faster than the graph is slowed down (backpressure)
+# rather than using up all the memory. records can also be pushed with put.
+# the graph applies at most maxperstep records from the queue at the start of
+# each physics step, while it is locked, so frames take a predictable time
+# however fast records arrive.
+#
+# a record is one of:
+#   a Node, which is added
+#   an (outgoing, incoming) pair, which adds a relationship
+#   a dictionary with a "type" of:
+#       "node": with a "uid", and optionally "x", "y", "mass", "charge" and
+#           "static"
+#       "relationship": with an "outgoing" and an "incoming" UID
+#       "removenode": with a "uid"
+#       "removerelationship": with an "outgoing" and an "incoming" UID
+#   when a dictionary has no "type", it is a node if it has a "uid", and a
+#   relationship if it has an "outgoing" and an "incoming".
+
+_NODE = "node"
+_RELATIONSHIP = "relationship"
+_REMOVE_NODE = "removenode"
+_REMOVE_RELATIONSHIP = "removerelationship"
+
+# put on the queue by the reader thread when the iterator runs out
+_END = object()
+
+
+class StreamIngester:
+
+    def __init__(self, records=None, maxperstep=500, maxpending=10000,
+                 createnodes=True):
+        """Takes:
+            records: an iterable of records to read in the background,
+                or None to only take records given to put
+            maxperstep: the most records to apply in one physics step
+            maxpending: how many records can wait to be applied before the
+                iterator (and put) have to wait
+            createnodes: whether a relationship to a node that doesn't exist
+                creates the node, rather than being an error
+        """
+        self.maxperstep = maxperstep
+        self.createnodes = createnodes
+
+        # messages for every record that couldn't be applied
+        self.errors = []
+        self.applied = 0
+
+        self._queue = queue.Queue(maxpending)
+        self._records = records
+        self._reading = records is not None
+        self._stopped = False
+        self._finished = threading.Event()
+        self._thread = None
+        if not self._reading:
+            self._finished.set()
+
+    def start(self):
+        """Starts reading records in the background. Called by
+        Graph.addIngester.
+        """
+        if self._reading and self._thread is None:
+            self._thread = threading.Thread(target=self._read)
+            self._thread.daemon = True
+            self._thread.start()
+
+    def stop(self):
+        """Stops reading records. Records that have already been read are
+        still applied.
+        """
+        self._stopped = True
+
+    def put(self, record, timeout=None):
+        """Queues a record to be applied. Blocks while the queue is full,
+        for at most timeout seconds, after which queue.Full is raised.
+        """
+        self._queue.put(record, timeout=timeout)
+        # if the record has already been applied, the next step sets this again
+        self._finished.clear()
+
+    def pending(self):
+        """Returns roughly how many records are waiting to be applied.
+        """
+        return self._queue.qsize()
+
+    def isFinished(self):
+        """Whether the iterator has run out and every record has been applied.
+        """
+        return self._finished.is_set()
+
+    def wait(self, timeout=None):
+        """Waits until isFinished, for at most timeout seconds.
+        Returns whether it finished. The graph must be stepping meanwhile.
+        """
+        return self._finished.wait(timeout)
+
+    def _read(self):
+        for record in self._records:
+            if not self._putUnlessStopped(record):
+                return
+        self._putUnlessStopped(_END)
+
+    def _putUnlessStopped(self, record):
+        while not self._stopped:
+            try:
+                self._queue.put(record, timeout=0.1)
+                return True
+            except queue.Full:
+                pass
+        return False
+
+    def applyBatch(self, graph):
+        """Applies up to maxperstep queued records to graph, which should be
+        locked. Called by the graph at the start of every physics step.
+        Returns the number of records applied.
+        """
+        batch = []
+        while len(batch) < self.maxperstep:
+            try:
+                record = self._queue.get_nowait()
+            except queue.Empty:
+                break
+            if record is _END:
+                self._reading = False
+                continue
+            batch.append(record)
+
+        if batch:
+            self._applyRecords(graph, batch)
+            self.applied += len(batch)
+        if not self._reading and self._queue.empty():
+            self._finished.set()
+        return len(batch)
+
+    def _applyRecords(self, graph, records):
+        # runs of nodes and of relationships are added in bulk. the order of
+        # the records is kept, so a relationship can follow its nodes.
+        nodes = []
+        relationships = []
+        for record in records:
+            try:
+                kind, values = _parseRecord(record)
+            except (KeyError, TypeError, ValueError) as e:
+                self.errors.append("COULDN'T READ RECORD {}: {}".format(repr(record), e))
+                continue
+
+            if kind == _NODE:
+                if relationships:
+                    self._addRelationships(graph, relationships)
+                    relationships = []
+                nodes.append(values)
+            elif kind == _RELATIONSHIP:
+                if nodes:
+                    self.errors.extend(graph.addNodes(nodes))
+                    nodes = []
+                relationships.append(values)
+            else:
+                if nodes:
+                    self.errors.extend(graph.addNodes(nodes))
+                    nodes = []
+                if relationships:
+                    self._addRelationships(graph, relationships)
+                    relationships = []
+                self._remove(graph, kind, values)
+
+        if nodes:
+            self.errors.extend(graph.addNodes(nodes))
+        if relationships:
+            self._addRelationships(graph, relationships)
+
+    def _addRelationships(self, graph, relationships):
+        if self.createnodes:
+            for outgoing, incoming in relationships:
+                for uid, other in ((outgoing, incoming), (incoming, outgoing)):
+                    if uid not in graph.nodes:
+                        graph.addNode(self.createNode(graph, uid, other))
+        self.errors.extend(graph.addRelationships(relationships))
+
+    def createNode(self, graph, uid, other):
+        """Returns a new node for uid, which a relationship to other needs.
+        By default it is placed a spring's length from other in a random
+        direction. Can be overridden to make nodes differently.
+        """
+        x, y = 0.0, 0.0
+        if other in graph.nodes:
+            x, y = graph.nodes[other].position
+        offset = Constants.MINIMUM_SPRING_SIZE
+        return Node(uid, position=(x + random.uniform(-offset, offset),
+                                   y + random.uniform(-offset, offset)))
+
+    def _remove(self, graph, kind, values):
+        if kind == _REMOVE_NODE:
+            if values not in graph.nodes:
+                self.errors.append("TRIED TO REMOVE NODE {} WHICH DIDN'T EXIST.".format(str(values)))
+                return
+            graph.removeNode(values)
+            return
+
+        outgoing, incoming = values
+        if outgoing not in graph.relationships or incoming not in graph.relationships[outgoing][0]:
+            self.errors.append("TRIED TO REMOVE RELATIONSHIP {} > {} WHICH DIDN'T EXIST.".format(
+                str(outgoing), str(incoming)))
+            return
+        graph.removeRelationship(outgoing, incoming)
+
+
+def _parseRecord(record):
+    """Returns (kind, values), where values is a Node for nodes, a UID for
+    removed nodes, and an (outgoing, incoming) pair for relationships.
+    """
+    if isinstance(record, Node):
+        return _NODE, record
+    if not isinstance(record, dict):
+        outgoing, incoming = record
+        return _RELATIONSHIP, (outgoing, incoming)
+
+    kind = record.get("type")
+    if kind is None:
+        kind = _NODE if "uid" in record else _RELATIONSHIP
+
+    if kind == _NODE:
+        return kind, Node(record["uid"],
+                          position=(float(record.get("x", 0.0)),
+                                    float(record.get("y", 0.0))),
+                          mass=float(record.get("mass", 1)),
+                          charge=float(record.get("charge", 10)),
+                          static=bool(record.get("static", False)))
+    if kind == _REMOVE_NODE:
+        return kind, record["uid"]
+    if kind in (_RELATIONSHIP, _REMOVE_RELATIONSHIP):
+        return kind, (record["outgoing"], record["incoming"])
+    raise ValueError("unknown record type {}".format(repr(kind)))
+
+
+# readers. each is a generator of records, which can be given to a
+# StreamIngester.
+
+def readCSV(path):
+    """Reads records from a CSV file with a header row. Rows with an
+    "outgoing" and an "incoming" column are relationships, and rows with a
+    "uid" column are nodes. A "type" column can be used as well.
+    """
+    with open(path, newline="") as f:
+        for row in csv.DictReader(f):
+            record = dict((k, v) for k, v in row.items() if v not in ("", None))
+            if "static" in record:
+                record["static"] = record["static"].strip().lower() in ("1", "true", "yes")
+            yield record
+
+
+def readJSONL(path):
+    """Reads records from a file with one JSON object on each line.
+    """
+    with open(path) as f:
+        for line in f:
+            line = line.strip()
+            if line:
+                yield json.loads(line)
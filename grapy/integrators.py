@@ -0,0 +1,336 @@
+import math
+
+try:
+    import numpy
+except ImportError:
+    numpy = None
+
+from .constants import Constants
+
+# Integrators move the nodes once the forces on them are known.
+#
+# a graph has one integrator, which is given the nodes to move (by the
+# node by node physics) or the arrays of a NumpyPhysics (by the numpy and
+# parallel backends). each one is called once per physics step. the
+# integrators are:
+#   EulerIntegrator: what Node.move does, and the default. quick, but
+#       oscillates with big timesteps
+#   VerletIntegrator: velocity Verlet, which averages the acceleration over
+#       the step, so it stays stable with bigger timesteps
+#   TemperatureIntegrator: the Fruchterman-Reingold scheme, where nodes have
+#       no momentum and move at most the current "temperature" each step.
+#       the temperature cools every step, so the layout freezes in place
+#       after a predictable number of steps
+#   AdaptiveStepSize: wraps any of the others, and makes the timestep bigger
+#       while the total energy of the graph keeps falling, and smaller as
+#       soon as it rises, stopping the nodes so that they don't carry on
+#       uphill. the energy is rising when the power of the forces (the sum of
+#       each force times the velocity of its node) is negative. this is the
+#       timestep part of the FIRE minimiser
+#
+# the timestep of every integrator is stepscale / framerate, so a controller
+# can change it without changing the framerate. the forces given to
+# moveArrays already include friction.
+
+
+def _damping(timestep):
+    """The fraction of its velocity a node keeps over timestep.
+    """
+    return math.pow(Constants.FRICTION_COEFFICIENT, timestep)
+
+
+def _frictionalForce(node):
+    friction = -Constants.FRICTION_COEFFICIENT * node.mass
+    vx, vy = node.velocity
+    return vx * friction, vy * friction
+
+
+class EulerIntegrator:
+
+    stepscale = 1.0
+
+    def moveNodes(self, graph, nodes, framerate):
+        """Moves every node in nodes (which can include static nodes) by the
+        forces applied to them, then clears their forces.
+        """
+        damping = None
+        if self.stepscale != 1.0:
+            framerate = framerate / self.stepscale
+            damping = _damping(1.0 / framerate)
+        for n in nodes:
+            n.move(framerate, damping)
+
+    def moveArrays(self, physics, forces, framerate):
+        """Moves the nodes in physics's arrays that aren't static or asleep
+        by forces.
+        """
+        damping = None
+        if self.stepscale != 1.0:
+            framerate = framerate / self.stepscale
+            damping = _damping(1.0 / framerate)
+        physics.move(forces, framerate, damping)
+
+    def stop(self):
+        """Forgets anything kept about how the nodes were moving, for when
+        they are all stopped.
+        """
+        pass
+
+
+class VerletIntegrator:
+
+    stepscale = 1.0
+
+    # the longest timestep that is ever taken, in seconds, however low the
+    # framerate gets or big the step scale gets
+    maximumtimestep = 0.05
+
+    def __init__(self):
+        # each moving node's acceleration in the last step, by UID
+        self._accelerations = {}
+        # the same for moveArrays, in the order of the uids it was made for
+        self._arrayaccelerations = None
+        self._arrayuids = None
+
+    def _timestep(self, framerate):
+        return min(self.stepscale / framerate, self.maximumtimestep)
+
+    def moveNodes(self, graph, nodes, framerate):
+        timestep = self._timestep(framerate)
+        damping = _damping(timestep)
+        previous = self._accelerations
+        accelerations = {}
+
+        for n in nodes:
+            fx, fy = n.takeAppliedForce()
+            if n.static:
+                continue
+            frictionx, frictiony = _frictionalForce(n)
+            ax = (fx + frictionx) / n.mass
+            ay = (fy + frictiony) / n.mass
+
+            # finishing the velocity from the last step with the new
+            # acceleration, then moving with both
+            pax, pay = previous.get(n.UID, (0.0, 0.0))
+            vx, vy = n.velocity
+            vx = (vx + 0.5 * (pax + ax) * timestep) * damping
+            vy = (vy + 0.5 * (pay + ay) * timestep) * damping
+
+            x, y = n.position
+            n.position = (x + vx * timestep + 0.5 * ax * timestep * timestep,
+                          y + vy * timestep + 0.5 * ay * timestep * timestep)
+            n.velocity = (vx, vy)
+            accelerations[n.UID] = (ax, ay)
+
+        # nodes that didn't move (eg. they were asleep) start again from rest
+        self._accelerations = accelerations
+
+    def stop(self):
+        self._accelerations = {}
+        self._arrayaccelerations = None
+        self._arrayuids = None
+
+    def _previousAccelerations(self, physics):
+        uids = physics.uids
+        previous = self._arrayaccelerations
+        if previous is None:
+            return numpy.zeros((len(uids), 2))
+        if self._arrayuids is uids:
+            return previous
+
+        # the graph has changed, so the accelerations are moved to where
+        # their nodes are now
+        rows = dict((uid, i) for i, uid in enumerate(self._arrayuids))
+        moved = numpy.zeros((len(uids), 2))
+        for i, uid in enumerate(uids):
+            row = rows.get(uid)
+            if row is not None:
+                moved[i] = previous[row]
+        return moved
+
+    def moveArrays(self, physics, forces, framerate):
+        timestep = self._timestep(framerate)
+        moving = ~(physics.static | physics.sleeping)
+
+        acceleration = forces / physics.masses[:, None]
+        previous = self._previousAccelerations(physics)
+        velocities = physics.velocities + 0.5 * (previous + acceleration) * timestep
+        velocities *= _damping(timestep)
+
+        physics.velocities[moving] = velocities[moving]
+        physics.positions[moving] += (velocities[moving] * timestep +
+                                      0.5 * acceleration[moving] * timestep * timestep)
+
+        acceleration[~moving] = 0.0
+        self._arrayaccelerations = acceleration
+        self._arrayuids = physics.uids
+
+
+class TemperatureIntegrator:
+
+    stepscale = 1.0
+
+    def __init__(self, temperature=None, cooling=0.99,
+                 minimumtemperature=0.5, reheat=0.5):
+        """Takes:
+            temperature: the furthest a node can move in the first step, in
+                pixels. by default, the spring length
+            cooling: what the temperature is multiplied by after every step
+            minimumtemperature: the temperature never cools below this, so
+                that nodes can still be dragged around and settle
+            reheat: when nodes or relationships are added or removed, the
+                temperature goes back up to at least this fraction of the
+                starting temperature, so the graph can make room for them
+        """
+        if temperature is None:
+            temperature = Constants.MINIMUM_SPRING_SIZE
+        self.initialtemperature = temperature
+        self.temperature = temperature
+        self.cooling = cooling
+        self.minimumtemperature = minimumtemperature
+        self.reheat = reheat
+        self._version = None
+
+    def reset(self):
+        """Puts the temperature back to where it started.
+        """
+        self.temperature = self.initialtemperature
+
+    def stop(self):
+        pass
+
+    def _cool(self, version):
+        """Takes the structure version of the graph. Returns the temperature
+        for this step, and cools it for the next.
+        """
+        if version != self._version:
+            if self._version is not None:
+                self.temperature = max(self.temperature,
+                                       self.initialtemperature * self.reheat)
+            self._version = version
+        temperature = self.temperature
+        self.temperature = max(self.minimumtemperature,
+                               self.temperature * self.cooling)
+        return temperature
+
+    def _reach(self, framerate):
+        """Returns how far a node moves in one step for each unit of
+        acceleration, which is how far the Euler integration would move it
+        each step once it had reached its top speed.
+        """
+        timestep = self.stepscale / framerate
+        damping = _damping(timestep)
+        return timestep * timestep * damping / (1.0 - damping)
+
+    def moveNodes(self, graph, nodes, framerate):
+        temperature = self._cool(graph._version) * self.stepscale
+        reach = self._reach(framerate)
+
+        for n in nodes:
+            fx, fy = n.takeAppliedForce()
+            if n.static:
+                continue
+            frictionx, frictiony = _frictionalForce(n)
+            dx = (fx + frictionx) / n.mass * reach
+            dy = (fy + frictiony) / n.mass * reach
+
+            distance = math.hypot(dx, dy)
+            if distance > temperature:
+                dx *= temperature / distance
+                dy *= temperature / distance
+
+            x, y = n.position
+            n.position = (x + dx, y + dy)
+            # the velocity is only kept so that the speed of the layout can
+            # still be measured, it isn't used to move the node
+            n.velocity = (dx * framerate, dy * framerate)
+
+    def moveArrays(self, physics, forces, framerate):
+        temperature = self._cool(physics._graphversion) * self.stepscale
+        moving = ~(physics.static | physics.sleeping)
+
+        displacement = forces / physics.masses[:, None] * self._reach(framerate)
+        distance = numpy.hypot(displacement[:, 0], displacement[:, 1])
+        scale = numpy.minimum(1.0, temperature / numpy.maximum(distance, 1e-12))
+        displacement *= scale[:, None]
+
+        physics.positions[moving] += displacement[moving]
+        physics.velocities[moving] = displacement[moving] * framerate
+
+
+class AdaptiveStepSize:
+
+    def __init__(self, integrator=None, grow=1.1, shrink=0.5, growafter=5,
+                 minimumscale=0.1, maximumscale=5.0):
+        """Takes:
+            integrator: the integrator whose timestep is controlled, by
+                default a VerletIntegrator
+            grow: what the timestep is multiplied by when it grows
+            shrink: what the timestep is multiplied by when the energy rises
+            growafter: how many steps in a row the energy has to fall for
+                before the timestep starts growing (every step)
+            minimumscale, maximumscale: the limits of the timestep, as a
+                multiple of the normal one
+        """
+        if integrator is None:
+            integrator = VerletIntegrator()
+        self.integrator = integrator
+        self.grow = grow
+        self.shrink = shrink
+        self.growafter = growafter
+        self.minimumscale = minimumscale
+        self.maximumscale = maximumscale
+
+        # the power in the last step, and how many steps in a row the energy
+        # has fallen for
+        self.power = None
+        self._progress = 0
+
+    @property
+    def stepscale(self):
+        return self.integrator.stepscale
+
+    def _update(self, power):
+        """Takes the power of the forces on the moving nodes. Returns whether
+        the energy is rising, in which case the nodes should be stopped.
+        """
+        self.power = power
+        integrator = self.integrator
+        if power > 0:
+            self._progress += 1
+            if self._progress >= self.growafter:
+                integrator.stepscale = min(
+                    self.maximumscale, integrator.stepscale * self.grow)
+            return False
+
+        self._progress = 0
+        integrator.stepscale = max(
+            self.minimumscale, integrator.stepscale * self.shrink)
+        integrator.stop()
+        return True
+
+    def stop(self):
+        self.integrator.stop()
+
+    def moveNodes(self, graph, nodes, framerate):
+        # with friction, the same as the forces moveArrays is given
+        power = 0.0
+        for n in nodes:
+            if not n.static:
+                fx, fy = n.force
+                frictionx, frictiony = _frictionalForce(n)
+                vx, vy = n.velocity
+                power += (fx + frictionx) * vx + (fy + frictiony) * vy
+
+        if self._update(power):
+            for n in nodes:
+                n.velocity = (0.0, 0.0)
+        self.integrator.moveNodes(graph, nodes, framerate)
+
+    def moveArrays(self, physics, forces, framerate):
+        moving = ~(physics.static | physics.sleeping)
+        power = float((forces[moving] * physics.velocities[moving]).sum())
+
+        if self._update(power):
+            physics.velocities[moving] = 0.0
+        self.integrator.moveArrays(physics, forces, framerate)
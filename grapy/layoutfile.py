@@ -0,0 +1,163 @@
+import array
+import json
+import mmap
+import struct
+import sys
+
+# A compact binary file for saving a computed layout and resuming it later.
+#
+# the file is laid out as:
+#   a header: the magic bytes, the format version, the number of nodes, the
+#       number of relationships and the length of the UID table
+#   the UID table: a JSON list of every node's UID, in node order
+#   the arrays, each starting on an 8 byte boundary:
+#       positions     2 doubles per node (x, y)
+#       velocities    2 doubles per node (x, y)
+#       masses        1 double per node
+#       charges       1 double per node
+#       static        1 byte per node (1 if static)
+#       relationships 2 64 bit ints per relationship (outgoing, incoming),
+#                     which are indexes into the UID table
+# everything is little endian.
+#
+# LayoutFile memory maps the arrays rather than reading them, so opening a
+# file is quick however big it is, and several processes can share one file.
+# the arrays are memoryviews, which numpy.frombuffer can use without copying.
+# UIDs are stored as JSON, so they must be strings, numbers or tuples of them.
+
+MAGIC = b"GRAPYLAY"
+FORMAT_VERSION = 1
+
+_HEADER = struct.Struct("<8sIQQQ")
+
+# (name, typecode, values per node or relationship)
+_NODE_ARRAYS = (("positions", "d", 2),
+                ("velocities", "d", 2),
+                ("masses", "d", 1),
+                ("charges", "d", 1),
+                ("static", "B", 1))
+_EDGE_ARRAY = ("relationships", "q", 2)
+
+_SWAP = sys.byteorder != "little"
+
+
+def _padding(length):
+    return -length % 8
+
+
+def _fromJSON(uid):
+    # tuples are written as JSON lists, so they have to be turned back into
+    # tuples to be usable as UIDs again
+    if isinstance(uid, list):
+        return tuple(_fromJSON(u) for u in uid)
+    return uid
+
+
+def saveLayout(graph, path):
+    """Writes the nodes and relationships of graph to path.
+    The graph should be locked, or not running.
+    """
+    nodes = list(graph.nodes.values())
+    indexes = dict((n.UID, i) for i, n in enumerate(nodes))
+
+    try:
+        uidtable = json.dumps([n.UID for n in nodes]).encode("utf-8")
+    except TypeError:
+        raise TypeError("Only UIDs that are strings, numbers or tuples of them can be saved.")
+
+    arrays = {
+        "positions": array.array("d", [c for n in nodes for c in n.position]),
+        "velocities": array.array("d", [c for n in nodes for c in n.velocity]),
+        "masses": array.array("d", [n.mass for n in nodes]),
+        "charges": array.array("d", [n.charge for n in nodes]),
+        "static": array.array("B", [1 if n.static else 0 for n in nodes]),
+        "relationships": array.array("q", [
+            i for uid, (outgoings, incomings) in graph.relationships.items()
+            for other in outgoings
+            for i in (indexes[uid], indexes[other])]),
+    }
+
+    with open(path, "wb") as f:
+        f.write(_HEADER.pack(MAGIC, FORMAT_VERSION, len(nodes),
+                             len(arrays["relationships"]) // 2, len(uidtable)))
+        f.write(uidtable)
+        f.write(b"\0" * _padding(_HEADER.size + len(uidtable)))
+
+        for name, typecode, width in _NODE_ARRAYS + (_EDGE_ARRAY,):
+            values = arrays[name]
+            if _SWAP:
+                values.byteswap()
+            values.tofile(f)
+            f.write(b"\0" * _padding(len(values) * values.itemsize))
+
+
+class LayoutFile:
+    """A read-only, memory mapped layout file written by saveLayout.
+
+    Contains:
+        uids: a list of the node UIDs
+        positions, velocities: flat arrays of x, y pairs, one per node
+        masses, charges, static: arrays with one value per node
+        relationships: a flat array of (outgoing, incoming) index pairs
+    The arrays are memoryviews into the file, so they are only valid until
+    the file is closed.
+    """
+
+    def __init__(self, path):
+        self._file = open(path, "rb")
+        try:
+            self._map = mmap.mmap(self._file.fileno(), 0, access=mmap.ACCESS_READ)
+        except ValueError:
+            # an empty file can't be mapped
+            self._file.close()
+            raise ValueError("{} is not a layout file.".format(path))
+
+        try:
+            magic, version, nodecount, edgecount, uidlength = \
+                _HEADER.unpack_from(self._map, 0)
+        except struct.error:
+            magic = None
+        if magic != MAGIC:
+            self.close()
+            raise ValueError("{} is not a layout file.".format(path))
+        if version != FORMAT_VERSION:
+            self.close()
+            raise ValueError("{} is a version {} layout file, only version {} can be read.".format(
+                path, version, FORMAT_VERSION))
+
+        self.nodecount = nodecount
+        self.relationshipcount = edgecount
+
+        offset = _HEADER.size
+        self.uids = [_fromJSON(uid) for uid in json.loads(
+            self._map[offset:offset + uidlength].decode("utf-8"))]
+        offset += uidlength + _padding(_HEADER.size + uidlength)
+
+        view = memoryview(self._map)
+        self._views = [view]
+        for name, typecode, width in _NODE_ARRAYS + (_EDGE_ARRAY,):
+            count = (edgecount if name == "relationships" else nodecount) * width
+            length = count * struct.calcsize(typecode)
+            values = view[offset:offset + length].cast(typecode)
+            self._views.append(values)
+            if _SWAP:
+                # memoryviews can't be byteswapped, so big endian machines
+                # get a copy instead
+                values = array.array(typecode, values)
+                values.byteswap()
+            setattr(self, name, values)
+            offset += length + _padding(length)
+
+    def close(self):
+        for view in reversed(getattr(self, "_views", [])):
+            view.release()
+        self._views = []
+        self._map.close()
+        self._file.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+        return False
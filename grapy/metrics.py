@@ -0,0 +1,162 @@
+from __future__ import print_function
+
+import time
+
+# Timing of each phase of the physics and drawing.
+# Metrics are turned off by default, and the code that is timed only checks
+# whether a Metrics object has been set, so there is no cost when it hasn't.
+# to turn them on, give a Metrics object to Grapher.setMetrics (or to a
+# graph's metrics attribute when it is used without a Grapher).
+#
+# the phases that are recorded are:
+#   input        processing mouse and key events
+#   attraction   calculating the spring forces
+#   repulsion    calculating the repulsive forces
+#   integration  moving the nodes
+#   physics      the whole physics step
+#   edges        drawing the lines
+#   nodes        drawing the nodes
+#   callbacks    the background and foreground draw functions
+#   flip         pushing the frame to the screen
+#   lockwait     waiting to lock the graph
+#   frame        a whole drawn frame
+# all times are in seconds, measured with time.perf_counter.
+
+
+class PhaseHistogram:
+    """Keeps the most recent values recorded for a phase in a ring buffer,
+    so that percentiles only ever cover recent history.
+    """
+
+    def __init__(self, size=1000):
+        self._values = [0.0] * size
+        self._index = 0
+        self.count = 0
+        self.total = 0.0
+
+    def add(self, value):
+        self._values[self._index] = value
+        self._index = (self._index + 1) % len(self._values)
+        self.count += 1
+        self.total += value
+
+    def recent(self):
+        """Returns the values in the buffer, oldest first.
+        """
+        if self.count < len(self._values):
+            return self._values[:self.count]
+        return self._values[self._index:] + self._values[:self._index]
+
+    def percentile(self, percent):
+        return _percentile(sorted(self.recent()), percent)
+
+    def summary(self):
+        values = sorted(self.recent())
+        if not values:
+            return {"count": 0}
+
+        return {
+            "count": self.count,
+            "mean": sum(values) / len(values),
+            "p50": _percentile(values, 50),
+            "p95": _percentile(values, 95),
+            "p99": _percentile(values, 99),
+            "max": values[-1],
+        }
+
+
+def _percentile(sortedvalues, percent):
+    if not sortedvalues:
+        return 0.0
+    return sortedvalues[int(round(percent / 100.0 * (len(sortedvalues) - 1)))]
+
+
+class Metrics:
+
+    def __init__(self, historysize=1000, exportinterval=200):
+        """Takes the number of recent values to keep for each phase, and how
+        many frames to wait between each call to the exporters.
+        """
+        self.historysize = historysize
+        self.exportinterval = exportinterval
+
+        self._histograms = {}
+        self._exporters = []
+        self._frames = 0
+
+    def record(self, phase, seconds):
+        histogram = self._histograms.get(phase)
+        if histogram is None:
+            histogram = PhaseHistogram(self.historysize)
+            self._histograms[phase] = histogram
+        histogram.add(seconds)
+
+    def lap(self, phase, since):
+        """Records the time from since until now against phase, and returns
+        now so that it can be used as the start of the next phase.
+        """
+        now = time.perf_counter()
+        self.record(phase, now - since)
+        return now
+
+    def timer(self, phase):
+        """Returns a context manager that records how long its block took.
+        """
+        return _PhaseTimer(self, phase)
+
+    def getHistogram(self, phase):
+        return self._histograms.get(phase)
+
+    def summary(self):
+        """Returns a dictionary of each phase to a dictionary of its count,
+        mean, p50, p95, p99 and max.
+        """
+        return dict((phase, histogram.summary())
+                    for phase, histogram in self._histograms.items())
+
+    def addExporter(self, exporter):
+        """Takes a function which is called with the summary every
+        exportinterval frames.
+        """
+        self._exporters.append(exporter)
+
+    def removeExporter(self, exporter):
+        self._exporters.remove(exporter)
+
+    def frameDone(self):
+        """Called at the end of every frame. Calls the exporters when it is
+        time to.
+        """
+        self._frames += 1
+        if self._exporters and self._frames % self.exportinterval == 0:
+            summary = self.summary()
+            for exporter in self._exporters:
+                exporter(summary)
+
+
+class _PhaseTimer:
+
+    def __init__(self, metrics, phase):
+        self._metrics = metrics
+        self._phase = phase
+        self._start = None
+
+    def __enter__(self):
+        self._start = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc):
+        self._metrics.lap(self._phase, self._start)
+        return False
+
+
+def printMetrics(summary):
+    """An exporter that prints the summary, in milliseconds.
+    """
+    for phase in sorted(summary):
+        stats = summary[phase]
+        if not stats["count"]:
+            continue
+        print("{:<16} p50 {:8.3f}ms  p95 {:8.3f}ms  p99 {:8.3f}ms  max {:8.3f}ms".format(
+            phase, stats["p50"] * 1000, stats["p95"] * 1000,
+            stats["p99"] * 1000, stats["max"] * 1000))
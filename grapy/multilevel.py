@@ -0,0 +1,280 @@
+import copy
+import math
+import random
+
+from .constants import Constants
+from .node import Node
+
+# A multilevel layout, in the style of Walshaw's multilevel force directed
+# placement and FM^3.
+#
+# big graphs take thousands of steps to untangle from random positions,
+# because the physics only moves nodes a little at a time. instead, the graph
+# is repeatedly coarsened by collapsing pairs of related nodes in to single
+# nodes, until it is small. the small graph untangles quickly, and its
+# layout is then copied back up one level at a time, each node starting where
+# the node it was collapsed in to ended up, and refined with a few steps of
+# the normal physics at each level.
+#
+# every level is a normal Graph, so the same springs and charges are used
+# at every level. a collapsed node has the mass and charge of all of its
+# nodes added together, so coarse levels are spread out roughly as much as
+# the full graph will be. each level does its physics with the graph's own
+# backend (so a ParallelPhysics only has one pool of workers), and moves its
+# nodes with a copy of the graph's integrator.
+
+# coarsening stops when a level has fewer nodes than this
+MINIMUM_LEVEL_SIZE = 50
+
+# or when a level is at least this fraction of the size of the one below it
+MINIMUM_REDUCTION = 0.9
+
+
+class _Level:
+    """One level of coarsening. graph is the coarser graph, and parents maps
+    each node index of the finer level to the index of the node it was
+    collapsed in to.
+    """
+
+    __slots__ = ("graph", "parents")
+
+    def __init__(self, graph, parents):
+        self.graph = graph
+        self.parents = parents
+
+
+def multilevelLayout(graph, coarseststeps=300, stepsperlevel=60,
+                     energythreshold=None, framerate=50.0, seed=0,
+                     backend=None):
+    """Lays out graph by coarsening it, laying out the coarsest level and
+    refining the layout back up each level. Takes:
+        coarseststeps: how many steps to lay out the coarsest level for
+        stepsperlevel: how many steps to refine each finer level for
+        energythreshold: a kinetic energy to stop a level's steps early at
+        seed: the seed for the matching order and starting positions, so the
+            same graph always gets the same layout
+        backend: a function which returns a new physics backend for each of
+            the coarser levels, such as lambda: NumpyPhysics(theta=0.8).
+            each one is closed (if it has a close method) once its level is
+            done. by default every level uses graph's own backend.
+    The last level is graph itself, which is refined with its own physics.
+    Static nodes are never collapsed and never moved.
+    Returns a tuple of (positions, number of steps done), like Graph.run.
+    """
+    rng = random.Random(seed)
+
+    nodes = list(graph.nodes.values())
+    index = dict((n.UID, i) for i, n in enumerate(nodes))
+    edges = _undirectedEdges(
+        (index[uid], index[other])
+        for uid in graph.relationships
+        for other in graph.relationships[uid][0])
+
+    # coarsening
+    levels = []
+    current = _levelNodes(nodes)
+    while len(current) > MINIMUM_LEVEL_SIZE:
+        parents, groupcount = _matchNodes(current, edges, rng)
+        if groupcount > MINIMUM_REDUCTION * len(current):
+            break
+
+        coarsenodes = _collapseNodes(current, parents, groupcount)
+        edges = _undirectedEdges(
+            (parents[a], parents[b]) for a, b in edges)
+
+        levelgraph = _buildGraph(coarsenodes, edges, graph, backend)
+        levels.append(_Level(levelgraph, parents))
+        current = coarsenodes
+
+    stepcount = 0
+    if not levels:
+        _placeRandomly(nodes, rng)
+        positions, steps = graph.run(coarseststeps + stepsperlevel,
+                                     energythreshold, framerate=framerate)
+        return positions, steps
+
+    try:
+        # laying out the coarsest level
+        coarsest = levels[-1].graph
+        _placeRandomly(list(coarsest.nodes.values()), rng)
+        stepcount += coarsest.run(coarseststeps, energythreshold,
+                                  framerate=framerate)[1]
+
+        # refining each level with the layout of the one above it
+        for depth in range(len(levels) - 1, -1, -1):
+            coarsegraph = levels[depth].graph
+            if depth > 0:
+                finegraph = levels[depth - 1].graph
+            else:
+                finegraph = graph
+            _prolong(list(coarsegraph.nodes.values()),
+                     list(finegraph.nodes.values()), levels[depth].parents, rng)
+            if backend is not None:
+                _closeBackend(coarsegraph)
+            stepcount += finegraph.run(stepsperlevel, energythreshold,
+                                       framerate=framerate)[1]
+    finally:
+        if backend is not None:
+            for level in levels:
+                _closeBackend(level.graph)
+
+    return graph.getPositions(), stepcount
+
+
+def _closeBackend(graph):
+    physicsbackend = graph._physicsbackend
+    if physicsbackend is not None:
+        graph.setPhysicsBackend(None)
+        close = getattr(physicsbackend, "close", None)
+        if close is not None:
+            close()
+
+
+def _undirectedEdges(pairs):
+    """Returns a dictionary of (lower index, higher index) pairs to how many
+    times they were given. Pairs of a node with itself are dropped.
+    """
+    edges = {}
+    for a, b in pairs:
+        if a == b:
+            continue
+        if a > b:
+            a, b = b, a
+        edges[(a, b)] = edges.get((a, b), 0) + 1
+    return edges
+
+
+def _levelNodes(nodes):
+    return [Node(i, position=n.position, mass=n.mass, static=n.static,
+                 charge=n.charge)
+            for i, n in enumerate(nodes)]
+
+
+def _matchNodes(nodes, edges, rng):
+    """Heavy edge matching. Visits the nodes in a random order, and pairs
+    each one with the unpaired neighbour it has the heaviest edge to.
+    Nodes left without a partner join the group of their heaviest neighbour,
+    so that star shaped graphs still get smaller.
+    Returns (parents, number of groups), where parents[i] is the group of
+    node i.
+    """
+    count = len(nodes)
+    neighbours = [[] for i in range(count)]
+    for (a, b), weight in edges.items():
+        neighbours[a].append((b, weight))
+        neighbours[b].append((a, weight))
+
+    partners = [None] * count
+    order = list(range(count))
+    rng.shuffle(order)
+
+    for i in order:
+        if partners[i] is not None or nodes[i].static:
+            continue
+        best = None
+        bestkey = None
+        for other, weight in neighbours[i]:
+            if partners[other] is not None or nodes[other].static:
+                continue
+            # heavy edges first, then light nodes, so groups stay even
+            key = (weight, -nodes[other].mass)
+            if bestkey is None or key > bestkey:
+                best = other
+                bestkey = key
+        if best is not None:
+            partners[i] = best
+            partners[best] = i
+
+    parents = [None] * count
+    groupcount = 0
+    for i in range(count):
+        if parents[i] is not None:
+            continue
+        parents[i] = groupcount
+        if partners[i] is not None:
+            parents[partners[i]] = groupcount
+        groupcount += 1
+
+    # the unpaired nodes that can join a neighbour's group
+    for i in order:
+        if partners[i] is not None or nodes[i].static or not neighbours[i]:
+            continue
+        joinable = [(weight, other) for other, weight in neighbours[i]
+                    if partners[other] is not None]
+        if joinable:
+            other = max(joinable)[1]
+            parents[i] = parents[other]
+
+    # renumbering the groups, because some have been emptied
+    renumbered = {}
+    for i in range(count):
+        parents[i] = renumbered.setdefault(parents[i], len(renumbered))
+
+    return parents, len(renumbered)
+
+
+def _collapseNodes(nodes, parents, groupcount):
+    """Returns the nodes of the coarser level. Each has the total mass and
+    charge of its group, and sits at the group's centre of mass.
+    """
+    masses = [0.0] * groupcount
+    charges = [0.0] * groupcount
+    xs = [0.0] * groupcount
+    ys = [0.0] * groupcount
+    static = [False] * groupcount
+
+    for n, parent in zip(nodes, parents):
+        x, y = n.position
+        masses[parent] += n.mass
+        charges[parent] += n.charge
+        xs[parent] += x * n.mass
+        ys[parent] += y * n.mass
+        static[parent] = static[parent] or n.static
+
+    return [Node(i, position=(xs[i] / masses[i], ys[i] / masses[i]),
+                 mass=masses[i], static=static[i], charge=charges[i])
+            for i in range(groupcount)]
+
+
+def _buildGraph(nodes, edges, original, backend):
+    # imported here because graph.py imports this module
+    from .graph import Graph
+
+    graph = Graph()
+    graph.addNodes(nodes)
+    graph.addRelationships(list(edges))
+    graph.setBarnesHut(original.barneshuttheta)
+    if backend is not None:
+        graph.setPhysicsBackend(backend())
+    else:
+        graph.setPhysicsBackend(original._physicsbackend)
+    # a copy, so the levels don't share anything the integrator keeps about
+    # how the nodes were moving
+    graph.setIntegrator(copy.deepcopy(original.integrator))
+    return graph
+
+
+def _placeRandomly(nodes, rng):
+    """Scatters the nodes that can move over a square big enough for all of
+    them.
+    """
+    side = math.sqrt(len(nodes)) * Constants.MINIMUM_SPRING_SIZE
+    for n in nodes:
+        if not n.static:
+            n.position = (rng.uniform(0, side), rng.uniform(0, side))
+            n.velocity = (0.0, 0.0)
+
+
+def _prolong(coarsenodes, finenodes, parents, rng):
+    """Moves every fine node that can move to the position of the coarse node
+    it was collapsed in to, plus a small random offset so that nodes from
+    the same group don't sit exactly on top of each other.
+    """
+    offset = Constants.MINIMUM_SPRING_SIZE * 0.25
+    for n, parent in zip(finenodes, parents):
+        if n.static:
+            continue
+        x, y = coarsenodes[parent].position
+        n.position = (x + rng.uniform(-offset, offset),
+                      y + rng.uniform(-offset, offset))
+        n.velocity = (0.0, 0.0)
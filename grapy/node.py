@@ -33,28 +33,67 @@ class Node:
     never the forces that would act upon another node.
     """
 
-    data = []
-
-    acceleration = (0.0, 0.0)
-
-    _forcelist = []
-
-    charge = 1.0
-
-    radius = 9
+    # every attribute lives in a slot, so a node has no __dict__.
+    # the position, velocity, acceleration and the forces applied this frame
+    # are each stored as two floats that are updated in place, rather than as
+    # tuples and lists that are rebuilt every frame.
+    __slots__ = ("UID", "mass", "static", "charge", "boundingbox",
+                 "neighbours", "data", "radius", "sleeping", "_stillframes",
+                 "_px", "_py", "_vx", "_vy", "_ax", "_ay", "_fx", "_fy")
 
     def __init__(self, uid,
                  position=(0.0, 0.0), velocity=(0.0, 0.0), mass=1,
                  static=False, charge=10, boundingbox=((-5, -5), (5, 5)),
-                 neighbours=[]):
+                 neighbours=None, radius=9):
         self.UID = uid
-        self.position = position
-        self.velocity = velocity
+        self._px, self._py = position
+        self._vx, self._vy = velocity
+        self._ax = 0.0
+        self._ay = 0.0
+        self._fx = 0.0
+        self._fy = 0.0
         self.mass = mass
         self.static = static
         self.charge = charge
         self.boundingbox = boundingbox
-        self.neighbours = neighbours
+        self.neighbours = [] if neighbours is None else neighbours
+        self.radius = radius
+        self.data = []
+
+        # a sleeping node has settled, and isn't moved by the physics.
+        # _stillframes counts how many frames in a row it has been settled for
+        self.sleeping = False
+        self._stillframes = 0
+
+    @property
+    def position(self):
+        return (self._px, self._py)
+
+    @position.setter
+    def position(self, position):
+        self._px, self._py = position
+
+    @property
+    def velocity(self):
+        return (self._vx, self._vy)
+
+    @velocity.setter
+    def velocity(self, velocity):
+        self._vx, self._vy = velocity
+
+    @property
+    def acceleration(self):
+        return (self._ax, self._ay)
+
+    @acceleration.setter
+    def acceleration(self, acceleration):
+        self._ax, self._ay = acceleration
+
+    @property
+    def force(self):
+        """The total of the forces applied since the node last moved.
+        """
+        return (self._fx, self._fy)
 
     # these methods find the force acting on SELF given the other node, not the forces self is producing on the other node.
     # when we say force we are referring to a tuple with x and y values in that order
@@ -100,49 +139,80 @@ class Node:
         return map(self.calculateRepulsiveForce, nodeslist)
 
     def applyForce(self, force):
-        self._forcelist = self._forcelist + [force]
+        self._fx += force[0]
+        self._fy += force[1]
 
     def applyForces(self, forcelist):
-        map(applyforce, forcelist)
+        for force in forcelist:
+            self.applyForce(force)
 
     # calculates the frictional force but does not apply it
     def calculateFrictionalForce(self):
         friction = -Constants.FRICTION_COEFFICIENT * self.mass
 
         return (
-            self.velocity[0] * friction,
-            self.velocity[1] * friction
+            self._vx * friction,
+            self._vy * friction
         )
 
-    def move(self, framerate):
+    def takeAppliedForce(self):
+        """Returns the total of the applied forces and acceleration as a
+        single force, and clears them. Used by physics which moves the node
+        itself rather than calling move.
+        """
+        force = (self._fx + self._ax * self.mass,
+                 self._fy + self._ay * self.mass)
+        self._ax = 0.0
+        self._ay = 0.0
+        self._fx = 0.0
+        self._fy = 0.0
+        return force
+
+    def wake(self):
+        self.sleeping = False
+        self._stillframes = 0
+
+    def updateSleeping(self, force):
+        """Takes the net force (without friction) that acted on the node in the
+        frame it just moved. Puts the node to sleep once it has been settled
+        for Constants.SLEEP_FRAMES frames in a row.
+        """
+        speed = math.hypot(self._vx, self._vy)
+        if (speed < Constants.SLEEP_VELOCITY_THRESHOLD and
+                math.hypot(force[0], force[1]) < Constants.SLEEP_FORCE_THRESHOLD):
+            self._stillframes += 1
+            if self._stillframes >= Constants.SLEEP_FRAMES:
+                self.sleeping = True
+                self._vx = 0.0
+                self._vy = 0.0
+        else:
+            self._stillframes = 0
+
+    def move(self, framerate, damping=None):
         """Takes the framerate of the simulation.
 
         This should be an unchanging/static framerate,
         and should ideally not fluctuate.
+        damping is the fraction of the velocity kept over the step, which is
+        Constants.PER_FRAME_FRICTION_COEFFICIENT by default.
         """
         if not self.static:
-            self.applyForce(self.calculateFrictionalForce())
-
-            totalforce = (0.0, 0.0)
-            for f in self._forcelist:
-                totalforce = (totalforce[0] + f[0], totalforce[1] + f[1])
-
-            self.acceleration = (
-                self.acceleration[0] + (totalforce[0] / self.mass),
-                self.acceleration[1] + (totalforce[1] / self.mass))
+            friction = -Constants.FRICTION_COEFFICIENT * self.mass
+            mass = self.mass
 
-            self.velocity = (
-                self.velocity[0] + self.acceleration[0] / framerate,
-                self.velocity[1] + self.acceleration[1] / framerate)
+            ax = self._ax + (self._fx + self._vx * friction) / mass
+            ay = self._ay + (self._fy + self._vy * friction) / mass
 
-            frictionalcoefficient = Constants.PER_FRAME_FRICTION_COEFFICIENT
-            self.velocity = (
-                self.velocity[0] * frictionalcoefficient,
-                self.velocity[1] * frictionalcoefficient)
+            frictionalcoefficient = damping
+            if frictionalcoefficient is None:
+                frictionalcoefficient = Constants.PER_FRAME_FRICTION_COEFFICIENT
+            self._vx = (self._vx + ax / framerate) * frictionalcoefficient
+            self._vy = (self._vy + ay / framerate) * frictionalcoefficient
 
-            self.position = (
-                self.position[0] + self.velocity[0] / framerate,
-                self.position[1] + self.velocity[1] / framerate)
+            self._px += self._vx / framerate
+            self._py += self._vy / framerate
 
-        self.acceleration = (0.0, 0.0)
-        self._forcelist = []
+        self._ax = 0.0
+        self._ay = 0.0
+        self._fx = 0.0
+        self._fy = 0.0
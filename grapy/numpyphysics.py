@@ -0,0 +1,343 @@
+import time
+import weakref
+
+try:
+    import numpy
+except ImportError:
+    numpy = None
+
+from .constants import Constants
+from . import groups
+from . import quadtree
+
+# An optional physics backend which keeps the state of every node in
+# contiguous numpy arrays (a structure of arrays) instead of walking the
+# python Node objects pair by pair.
+# the arrays are indexed by node, in the order of graph.nodes.
+# the forces are the same as the ones in Node._calcAttractiveForceMagnitude
+# and Node._calcRepulsiveForceMagnitude, just computed for every pair at once.
+# after each step the new positions and velocities are written back to the
+# nodes, so the rest of the Graph/Node API keeps working as before.
+
+
+class NumpyPhysics:
+
+    # the maximum number of pairwise entries that are computed at once.
+    # repulsion is done in blocks of rows so that memory use stays bounded
+    # for large graphs.
+    blocksize = 2 ** 15
+
+    def __init__(self, theta=None):
+        """Takes an optional Barnes-Hut opening angle. When it is given,
+        repulsion is approximated with a quadtree instead of every pair.
+        """
+        if numpy is None:
+            raise ImportError("NumpyPhysics requires numpy to be installed.")
+
+        self.uids = []
+        self.index = {}
+
+        self.positions = numpy.zeros((0, 2))
+        self.velocities = numpy.zeros((0, 2))
+        self.masses = numpy.zeros(0)
+        self.charges = numpy.zeros(0)
+        self.static = numpy.zeros(0, dtype=bool)
+        self.sleeping = numpy.zeros(0, dtype=bool)
+
+        # an (edges, 2) array of [outgoing index, incoming index]
+        self.edges = numpy.zeros((0, 2), dtype=numpy.intp)
+
+        # the graph the arrays were built for, since a backend can be used for
+        # more than one graph (such as the levels of a multilevel layout)
+        self._graph = None
+        self._graphversion = None
+
+        self.theta = theta
+
+    def _rebuildStructure(self, graph):
+        """Rebuilds the node index and the edge index array.
+        Only needed when nodes or relationships have been added or removed.
+        """
+        self.uids = list(graph.nodes)
+        self.index = dict((uid, i) for i, uid in enumerate(self.uids))
+
+        edges = [(self.index[uid], self.index[other])
+                 for uid in graph.relationships
+                 for other in graph.relationships[uid][0]]
+        self.edges = numpy.array(edges, dtype=numpy.intp).reshape(-1, 2)
+
+        self._graph = weakref.ref(graph)
+        self._graphversion = graph._version
+
+    def gather(self, graph):
+        """Copies the current state of every node in to the arrays.
+        Node positions can be changed from outside of the physics (eg. a node
+        being dragged), so this is done at the start of every step.
+        """
+        if (self._graphversion != graph._version or self._graph is None or
+                self._graph() is not graph):
+            self._rebuildStructure(graph)
+
+        nodes = [graph.nodes[uid] for uid in self.uids]
+
+        self.positions = numpy.array([n.position for n in nodes],
+                                     dtype=float).reshape(-1, 2)
+        self.velocities = numpy.array([n.velocity for n in nodes],
+                                      dtype=float).reshape(-1, 2)
+        self.masses = numpy.array([n.mass for n in nodes], dtype=float)
+        self.charges = numpy.array([n.charge for n in nodes], dtype=float)
+        self.static = numpy.array([n.static for n in nodes], dtype=bool)
+        self.sleeping = numpy.array([n.sleeping for n in nodes], dtype=bool)
+
+        return nodes
+
+    def scatter(self, nodes):
+        """Writes the positions and velocities back to the nodes.
+        """
+        positions = self.positions.tolist()
+        velocities = self.velocities.tolist()
+        for i, n in enumerate(nodes):
+            if not n.static:
+                n.position = positions[i]
+                n.velocity = velocities[i]
+
+    def calculateAttractiveForces(self):
+        """Returns an (n, 2) array of the spring forces acting on each node.
+        """
+        if len(self.edges) == 0:
+            return numpy.zeros_like(self.positions)
+        return self.sumEdgeForces(self.calculateEdgeForces(self.edges))
+
+    def calculateEdgeForces(self, edges):
+        """Takes an (edges, 2) array of [outgoing index, incoming index], and
+        returns the spring force on the outgoing node of each edge.
+        """
+        outgoing = edges[:, 0]
+        incoming = edges[:, 1]
+
+        delta = self.positions[incoming] - self.positions[outgoing]
+        distance = numpy.hypot(delta[:, 0], delta[:, 1])
+        magnitude = Constants.ATTRACTIVE_FORCE_CONSTANT * (
+            distance - Constants.MINIMUM_SPRING_SIZE)
+
+        # the direction uses the same small offset as findDistanceTuple
+        direction = delta + 0.01
+        direction /= numpy.hypot(direction[:, 0], direction[:, 1])[:, None]
+
+        return direction * magnitude[:, None]
+
+    def sumEdgeForces(self, edgeforces):
+        """Takes the force on the outgoing node of each edge in self.edges, and
+        returns the total force on each node, with the opposite force applied
+        to the incoming nodes.
+        """
+        forces = numpy.zeros_like(self.positions)
+        numpy.add.at(forces, self.edges[:, 0], edgeforces)
+        numpy.add.at(forces, self.edges[:, 1], -edgeforces)
+        return forces
+
+    def calculateRepulsiveForces(self, indices=None):
+        """Returns an array of the repulsive forces acting on each node in
+        indices (an array of node indices), or on every node if it is None.
+        """
+        if indices is None:
+            indices = numpy.arange(len(self.positions))
+
+        if self.theta is not None:
+            forces = quadtree.calculateRepulsiveForces(
+                self.positions[:, 0].tolist(), self.positions[:, 1].tolist(),
+                self.charges.tolist(), self.theta, indices.tolist())
+            return numpy.array(forces, dtype=float).reshape(-1, 2)
+
+        forces = numpy.zeros((len(indices), 2))
+        if len(indices) == 0:
+            return forces
+
+        rowsperblock = max(1, self.blocksize // len(self.positions))
+        for blockstart in range(0, len(indices), rowsperblock):
+            rows = indices[blockstart:blockstart + rowsperblock]
+            forces[blockstart:blockstart + len(rows)] = (
+                self.calculateRepulsiveForceRows(rows))
+
+        return forces
+
+    def calculateGroupedRepulsiveForces(self, nodegroups, indices=None):
+        """Returns an array of the repulsive forces acting on each node in
+        indices, or on every node if it is None, with every group acting as
+        one large node to the nodes outside of it. Takes the group of each
+        node, or None for ungrouped nodes.
+        """
+        forces = groups.calculateRepulsiveForces(
+            self.positions[:, 0].tolist(), self.positions[:, 1].tolist(),
+            self.charges.tolist(), nodegroups,
+            None if indices is None else indices.tolist())
+        return numpy.array(forces, dtype=float).reshape(-1, 2)
+
+    def calculateRepulsiveForceRows(self, rows):
+        """Takes an array of node indices, and returns the repulsive forces
+        acting on each of them from every other node in the graph.
+        Every pair is computed at once, so rows should be kept small enough
+        that len(rows) * nodes entries fit in memory.
+        """
+        positions = self.positions
+        charges = self.charges
+        count = len(positions)
+        forces = numpy.zeros((len(rows), 2))
+        if count < 2:
+            return forces
+
+        columns = numpy.arange(count)
+        selves = numpy.arange(len(rows))
+        xs = positions[:, 0]
+        ys = positions[:, 1]
+
+        # delta[i, j] is the vector from node i to node j
+        dx = xs[None, :] - xs[rows, None]
+        dy = ys[None, :] - ys[rows, None]
+
+        distance = dx * dx
+        distance += dy * dy
+        numpy.sqrt(distance, out=distance)
+        numpy.maximum(distance, 15, out=distance)
+
+        # -REPULSIVE_FORCE_CONSTANT * charge / ((distance * 0.2) ** 2 + charge)
+        charge = charges[rows, None] * charges[None, :]
+        distance *= 0.2
+        distance *= distance
+        distance += charge
+        magnitude = numpy.divide(charge, distance, out=charge)
+        magnitude *= -Constants.REPULSIVE_FORCE_CONSTANT
+
+        # the scalar loop only visits each pair once, from the node with
+        # the lower index, so the direction offset from findDistanceTuple
+        # has its sign flipped for the pairs seen from the other side.
+        offset = numpy.where(columns[None, :] > rows[:, None], 0.01, -0.01)
+        dx += offset
+        dy += offset
+        length = numpy.multiply(dx, dx, out=offset)
+        length += dy * dy
+        numpy.sqrt(length, out=length)
+
+        # a node doesn't repel itself
+        length[selves, rows] = 1.0
+        magnitude[selves, rows] = 0.0
+        magnitude /= length
+
+        dx *= magnitude
+        dy *= magnitude
+        forces[:, 0] = dx.sum(axis=1)
+        forces[:, 1] = dy.sum(axis=1)
+
+        return forces
+
+    def calculateFrictionalForces(self):
+        friction = -Constants.FRICTION_COEFFICIENT * self.masses
+        return self.velocities * friction[:, None]
+
+    def move(self, forces, framerate, damping=None):
+        """Integrates the nodes the same way as Node.move,
+        skipping static and sleeping nodes.
+        """
+        if damping is None:
+            damping = Constants.PER_FRAME_FRICTION_COEFFICIENT
+        moving = ~(self.static | self.sleeping)
+
+        acceleration = forces / self.masses[:, None]
+        velocities = self.velocities + acceleration / framerate
+        velocities *= damping
+
+        self.velocities[moving] = velocities[moving]
+        self.positions[moving] += velocities[moving] / framerate
+
+    def doPhysics(self, graph, framerate):
+        """Does a full physics step for the graph. Takes framerate.
+        """
+        nodes = self.gather(graph)
+        if not nodes:
+            return
+
+        metrics = graph.metrics
+        if metrics is not None:
+            laptime = time.perf_counter()
+
+        forces = self.calculateAttractiveForces()
+        if metrics is not None:
+            laptime = metrics.lap("attraction", laptime)
+
+        if graph._groups:
+            # the groups are already an approximation, so they are used
+            # instead of every pair or the quadtree
+            nodegroups = [graph._nodegroups.get(uid) for uid in self.uids]
+            if not graph.sleepingenabled:
+                forces += self.calculateGroupedRepulsiveForces(nodegroups)
+            else:
+                awake = numpy.flatnonzero(~(self.static | self.sleeping))
+                forces[awake] += self.calculateGroupedRepulsiveForces(
+                    nodegroups, awake)
+        elif not graph.sleepingenabled:
+            forces += self.calculateRepulsiveForces()
+        else:
+            # only the awake nodes need their forces calculating, and a pair
+            # of nodes that are both asleep never affects an awake one
+            awake = numpy.flatnonzero(~(self.static | self.sleeping))
+            forces[awake] += self.calculateRepulsiveForces(awake)
+        if metrics is not None:
+            laptime = metrics.lap("repulsion", laptime)
+
+        forces += self._takeAppliedForces(nodes)
+
+        if not graph.sleepingenabled:
+            forces += self.calculateFrictionalForces()
+            graph.integrator.moveArrays(self, forces, framerate)
+        else:
+            netforces = forces.copy()
+            forces += self.calculateFrictionalForces()
+            oldpositions = self.positions.copy()
+            graph.integrator.moveArrays(self, forces, framerate)
+            self._updateSleeping(nodes, netforces, oldpositions)
+
+        self.scatter(nodes)
+        if metrics is not None:
+            metrics.lap("integration", laptime)
+
+    def _updateSleeping(self, nodes, netforces, oldpositions):
+        """The array version of Node.updateSleeping, followed by waking the
+        neighbours of every node that moved further than Constants.WAKE_DISTANCE.
+        """
+        awake = ~(self.static | self.sleeping)
+
+        speed = numpy.hypot(self.velocities[:, 0], self.velocities[:, 1])
+        force = numpy.hypot(netforces[:, 0], netforces[:, 1])
+        still = (speed < Constants.SLEEP_VELOCITY_THRESHOLD) & (
+            force < Constants.SLEEP_FORCE_THRESHOLD)
+
+        stillframes = numpy.array([n._stillframes for n in nodes])
+        stillframes = numpy.where(awake & still, stillframes + 1, stillframes)
+        stillframes[awake & ~still] = 0
+
+        fallingasleep = awake & (stillframes >= Constants.SLEEP_FRAMES)
+        self.velocities[fallingasleep] = 0.0
+        self.sleeping |= fallingasleep
+
+        displacement = self.positions - oldpositions
+        moved = awake & (numpy.hypot(displacement[:, 0], displacement[:, 1]) >
+                         Constants.WAKE_DISTANCE)
+        woken = numpy.zeros(len(nodes), dtype=bool)
+        if len(self.edges):
+            woken[self.edges[moved[self.edges[:, 0]], 1]] = True
+            woken[self.edges[moved[self.edges[:, 1]], 0]] = True
+        woken &= self.sleeping
+        self.sleeping &= ~woken
+        stillframes[woken] = 0
+
+        for n, sleeping, frames in zip(nodes, self.sleeping.tolist(),
+                                       stillframes.tolist()):
+            n.sleeping = sleeping
+            n._stillframes = frames
+
+    def _takeAppliedForces(self, nodes):
+        """Collects any forces or acceleration that were applied directly to
+        the nodes through Node.applyForce, and clears them.
+        """
+        return numpy.array([n.takeAppliedForce() for n in nodes],
+                           dtype=float).reshape(-1, 2)
@@ -0,0 +1,269 @@
+import multiprocessing
+import weakref
+
+try:
+    from multiprocessing import shared_memory
+except ImportError:
+    shared_memory = None
+
+try:
+    from multiprocessing import resource_tracker
+except ImportError:
+    # windows doesn't need one
+    resource_tracker = None
+
+try:
+    import numpy
+except ImportError:
+    numpy = None
+
+from .numpyphysics import NumpyPhysics
+from . import quadtree
+
+# A physics backend which spreads the repulsion and attraction over several
+# processes, to get around the GIL.
+#
+# the positions, charges, edges and forces live in shared memory, so the
+# only thing sent to the workers each step is which tile of rows (or edges)
+# to do. each worker writes its results straight in to the shared forces.
+# each node's force is calculated by exactly the same code as NumpyPhysics,
+# and the tiles are combined in the same order every time, so the results
+# are the same as NumpyPhysics, and the same from run to run.
+#
+# the pool is started the first time it is needed, or by calling start.
+# with the "fork" start method (the default on Linux) it should be started
+# before any other threads, such as the Grapher's, so call start before
+# Grapher.start. with "spawn" (the default on Windows and macOS) the main
+# script must be guarded with if __name__ == "__main__":
+#
+# groups aren't spread over the workers, and are calculated in this process.
+
+
+class _SharedArray:
+    """A numpy array in a block of shared memory, which can be grown.
+    """
+
+    def __init__(self, dtype, width):
+        self.dtype = numpy.dtype(dtype)
+        self.width = width
+        self.memory = None
+        self.capacity = 0
+        self.array = None
+
+    def resize(self, length):
+        """Makes the array length rows long, reallocating the shared memory if
+        it isn't big enough. Returns whether it was reallocated.
+        """
+        reallocated = False
+        if length > self.capacity or self.memory is None:
+            self.close()
+            self.capacity = max(length, 2 * self.capacity, 64)
+            self.memory = shared_memory.SharedMemory(
+                create=True, size=self.capacity * self.width * self.dtype.itemsize)
+            reallocated = True
+
+        self.array = numpy.ndarray((length, self.width), dtype=self.dtype,
+                                   buffer=self.memory.buf)
+        return reallocated
+
+    def description(self):
+        return (self.memory.name, self.array.shape, self.dtype.str)
+
+    def close(self):
+        self.array = None
+        if self.memory is not None:
+            self.memory.close()
+            self.memory.unlink()
+            self.memory = None
+
+
+# the arrays each worker has attached to, by shared memory name
+_attached = {}
+
+
+def _attach(description):
+    name, shape, dtype = description
+    attached = _attached.get(name)
+    if attached is None:
+        # the workers share the parent's resource tracker, which frees the
+        # memory when the parent unlinks it (or exits), so the workers only
+        # need to close it
+        memory = shared_memory.SharedMemory(name=name)
+        attached = (memory, {})
+        _attached[name] = attached
+    memory, arrays = attached
+    key = (shape, dtype)
+    array = arrays.get(key)
+    if array is None:
+        array = numpy.ndarray(shape, dtype=numpy.dtype(dtype), buffer=memory.buf)
+        arrays.clear()
+        arrays[key] = array
+    return array
+
+
+def _forget(names):
+    """Detaches from any shared memory that isn't in names any more.
+    """
+    for name in list(_attached):
+        if name not in names:
+            memory, arrays = _attached.pop(name)
+            arrays.clear()
+            memory.close()
+
+
+def _repulsionTile(task):
+    """Calculates the repulsive forces for one tile of rows in a worker.
+    """
+    (positions, charges, indices, forces, start, stop, theta,
+     blocksize) = task
+    _forget(set(d[0] for d in (positions, charges, indices, forces)))
+
+    physics = NumpyPhysics()
+    physics.positions = _attach(positions)
+    physics.charges = _attach(charges)[:, 0]
+    physics.blocksize = blocksize
+    rows = _attach(indices)[start:stop, 0]
+    out = _attach(forces)
+
+    if theta is not None:
+        xs = physics.positions[:, 0].tolist()
+        ys = physics.positions[:, 1].tolist()
+        out[start:stop] = numpy.array(quadtree.calculateRepulsiveForces(
+            xs, ys, physics.charges.tolist(), theta, rows.tolist()),
+            dtype=float).reshape(-1, 2)
+        return
+
+    # the same blocks as NumpyPhysics.calculateRepulsiveForces
+    rowsperblock = max(1, blocksize // len(physics.positions))
+    for blockstart in range(start, stop, rowsperblock):
+        blockstop = min(blockstart + rowsperblock, stop)
+        out[blockstart:blockstop] = physics.calculateRepulsiveForceRows(
+            rows[blockstart - start:blockstop - start])
+
+
+def _attractionTile(task):
+    """Calculates the spring force of one tile of edges in a worker.
+    """
+    positions, edges, edgeforces, start, stop = task
+    _forget(set(d[0] for d in (positions, edges, edgeforces)))
+
+    physics = NumpyPhysics()
+    physics.positions = _attach(positions)
+    edges = _attach(edges)[start:stop]
+    _attach(edgeforces)[start:stop] = physics.calculateEdgeForces(edges)
+
+
+def _closePool(pool, arrays):
+    pool.terminate()
+    for array in arrays:
+        array.close()
+
+
+class ParallelPhysics(NumpyPhysics):
+
+    # there are tilesperprocess tiles for every process, so that a slow
+    # process doesn't hold up the others for long
+    tilesperprocess = 4
+
+    # graphs with fewer nodes than this are done in this process, because
+    # handing them out would take longer than doing them
+    minimumparallelsize = 2000
+
+    def __init__(self, processes=None, theta=None, context=None):
+        """Takes the number of processes to use (by default, one for each
+        CPU), an optional Barnes-Hut opening angle like NumpyPhysics, and an
+        optional multiprocessing start method such as "spawn".
+        """
+        NumpyPhysics.__init__(self, theta)
+        if shared_memory is None:
+            raise ImportError("ParallelPhysics requires multiprocessing.shared_memory (Python 3.8+).")
+
+        self.processes = processes or multiprocessing.cpu_count()
+        self._context = multiprocessing.get_context(context)
+        self._pool = None
+        self._finalizer = None
+
+        self._sharedpositions = _SharedArray(float, 2)
+        self._sharedcharges = _SharedArray(float, 1)
+        self._sharedindices = _SharedArray(numpy.intp, 1)
+        self._sharedforces = _SharedArray(float, 2)
+        self._sharededges = _SharedArray(numpy.intp, 2)
+        self._sharededgeforces = _SharedArray(float, 2)
+
+    def start(self):
+        """Starts the worker processes, if they haven't been already.
+        """
+        if self._pool is None:
+            if resource_tracker is not None:
+                # the workers have to share this process's resource tracker,
+                # otherwise each of them would free the shared memory when
+                # it exits. it is only shared if it is running before they
+                # start.
+                resource_tracker.ensure_running()
+            self._pool = self._context.Pool(self.processes)
+            self._finalizer = weakref.finalize(
+                self, _closePool, self._pool,
+                [self._sharedpositions, self._sharedcharges,
+                 self._sharedindices, self._sharedforces,
+                 self._sharededges, self._sharededgeforces])
+
+    def close(self):
+        """Stops the worker processes and frees the shared memory.
+        """
+        if self._finalizer is not None:
+            self._finalizer()
+            self._finalizer = None
+            self._pool = None
+
+    def _tiles(self, count):
+        tilecount = max(1, min(count, self.processes * self.tilesperprocess))
+        bounds = [count * i // tilecount for i in range(tilecount + 1)]
+        return list(zip(bounds[:-1], bounds[1:]))
+
+    def calculateAttractiveForces(self):
+        if len(self.positions) < self.minimumparallelsize or len(self.edges) == 0:
+            return NumpyPhysics.calculateAttractiveForces(self)
+        self.start()
+
+        self._sharedpositions.resize(len(self.positions))
+        self._sharedpositions.array[:] = self.positions
+        self._sharededges.resize(len(self.edges))
+        self._sharededges.array[:] = self.edges
+        self._sharededgeforces.resize(len(self.edges))
+
+        positions = self._sharedpositions.description()
+        edges = self._sharededges.description()
+        edgeforces = self._sharededgeforces.description()
+        self._pool.map(_attractionTile, [
+            (positions, edges, edgeforces, start, stop)
+            for start, stop in self._tiles(len(self.edges))])
+
+        # adding them up here, in edge order, keeps the result the same as
+        # NumpyPhysics
+        return self.sumEdgeForces(self._sharededgeforces.array)
+
+    def calculateRepulsiveForces(self, indices=None):
+        if indices is None:
+            indices = numpy.arange(len(self.positions))
+        if len(self.positions) < self.minimumparallelsize or len(indices) == 0:
+            return NumpyPhysics.calculateRepulsiveForces(self, indices)
+        self.start()
+
+        self._sharedpositions.resize(len(self.positions))
+        self._sharedpositions.array[:] = self.positions
+        self._sharedcharges.resize(len(self.charges))
+        self._sharedcharges.array[:, 0] = self.charges
+        self._sharedindices.resize(len(indices))
+        self._sharedindices.array[:, 0] = indices
+        self._sharedforces.resize(len(indices))
+
+        positions = self._sharedpositions.description()
+        charges = self._sharedcharges.description()
+        shared = self._sharedindices.description()
+        forces = self._sharedforces.description()
+        self._pool.map(_repulsionTile, [
+            (positions, charges, shared, forces, start, stop, self.theta,
+             self.blocksize)
+            for start, stop in self._tiles(len(indices))])
+
+        return self._sharedforces.array.copy()
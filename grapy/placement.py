@@ -0,0 +1,182 @@
+import collections
+import math
+
+from .constants import Constants
+
+# Automatic placement of new nodes.
+#
+# a node added at an arbitrary position (or all at the origin) gets pulled
+# across the whole graph by its springs, which shakes everything around it
+# for a long time. instead, a new node is placed at the barycentre of the
+# neighbours it already has (weighted by their mass), and then moved out
+# in whichever direction is least crowded, as far as the relationships around
+# those neighbours are long, so that it starts close to where it is going to
+# settle.
+#
+# new nodes are only placed at the start of the next physics step, so that
+# the relationships added along with them are known by then. when many are
+# added at once, they are placed outwards from the nodes that are already
+# placed, so a new subtree grows out of the node it is attached to.
+
+# how many directions around the barycentre are tried
+DIRECTIONS = 8
+
+# how many spring lengths out from the centre of the graph a node with no
+# placed neighbours can be put
+MAXIMUM_RINGS = 32
+
+
+class _DensityGrid:
+    """Counts the placed nodes in each square of a grid a spring's length
+    wide, so that crowded areas can be avoided.
+    """
+
+    def __init__(self, positions):
+        self.cellsize = float(Constants.MINIMUM_SPRING_SIZE)
+        self.counts = {}
+        for position in positions:
+            self.add(position)
+
+    def _cellOf(self, position):
+        return (int(math.floor(position[0] / self.cellsize)),
+                int(math.floor(position[1] / self.cellsize)))
+
+    def add(self, position):
+        cell = self._cellOf(position)
+        self.counts[cell] = self.counts.get(cell, 0) + 1
+
+    def crowding(self, position):
+        """Returns the number of nodes in the cell of position and the cells
+        around it, with the cell itself counted more.
+        """
+        cx, cy = self._cellOf(position)
+        counts = self.counts
+        total = 3 * counts.get((cx, cy), 0)
+        for dx in (-1, 0, 1):
+            for dy in (-1, 0, 1):
+                if dx or dy:
+                    total += counts.get((cx + dx, cy + dy), 0)
+        return total
+
+
+def placeNodes(graph, uids, rng):
+    """Places the nodes in uids (which have just been added to graph) using
+    the positions of the rest of the graph. rng is a random.Random used to
+    turn the directions that are tried, so that layouts don't line up on a
+    grid.
+    """
+    unplaced = set(uid for uid in uids
+                   if uid in graph.nodes and not graph.nodes[uid].static)
+    if not unplaced:
+        return
+
+    nodes = graph.nodes
+    adjacency = graph._adjacency
+    placed = [n.position for uid, n in nodes.items() if uid not in unplaced]
+    grid = _DensityGrid(placed)
+
+    # the centre of the placed nodes, for nodes that have no placed
+    # neighbours at all
+    if placed:
+        centre = (sum(p[0] for p in placed) / len(placed),
+                  sum(p[1] for p in placed) / len(placed))
+    else:
+        centre = (0.0, 0.0)
+
+    # placing outwards from the placed nodes, one ring of neighbours at a
+    # time. queued holds the nodes waiting in the queue, so they aren't
+    # queued twice.
+    order = [uid for uid in uids if uid in unplaced]
+    queue = collections.deque(
+        uid for uid in order
+        if any(other not in unplaced for half in adjacency[uid] for other in half))
+    queued = set(queue)
+    position = 0
+
+    while unplaced:
+        if queue:
+            uid = queue.popleft()
+            neighbours = [other for half in adjacency[uid]
+                          for other in half if other not in unplaced]
+            _place(nodes[uid], [nodes[other] for other in neighbours], grid,
+                   rng, distance=_edgeLength(nodes, adjacency, neighbours,
+                                             unplaced))
+        else:
+            # nothing left is connected to a placed node, so the next one
+            # starts a new area near the centre of the graph
+            while order[position] not in unplaced:
+                position += 1
+            uid = order[position]
+            _place(nodes[uid], [], grid, rng, centre)
+        unplaced.discard(uid)
+
+        for half in adjacency[uid]:
+            for other in half:
+                if other in unplaced and other not in queued:
+                    queue.append(other)
+                    queued.add(other)
+
+
+def _edgeLength(nodes, adjacency, uids, unplaced):
+    """Returns the average length of the relationships between the nodes in
+    uids and their placed neighbours, which is roughly how far apart nodes
+    settle in that part of the graph. Returns the spring length if they
+    don't have any.
+    """
+    total = 0.0
+    count = 0
+    for uid in uids:
+        x, y = nodes[uid].position
+        for half in adjacency[uid]:
+            for other in half:
+                if other not in unplaced:
+                    ox, oy = nodes[other].position
+                    total += math.hypot(ox - x, oy - y)
+                    count += 1
+    if not count:
+        return Constants.MINIMUM_SPRING_SIZE
+    return max(total / count, Constants.MINIMUM_SPRING_SIZE)
+
+
+def _place(node, neighbours, grid, rng, centre=(0.0, 0.0),
+           distance=Constants.MINIMUM_SPRING_SIZE):
+    if neighbours:
+        mass = 0.0
+        x = 0.0
+        y = 0.0
+        for n in neighbours:
+            nx, ny = n.position
+            mass += n.mass
+            x += nx * n.mass
+            y += ny * n.mass
+        x /= mass
+        y /= mass
+        # a node between several neighbours is already roughly in place, so
+        # it is only moved a little way off their barycentre
+        if len(neighbours) > 1:
+            distance *= 0.5
+    else:
+        x, y = centre
+
+    best = None
+    bestcrowding = None
+    start = rng.uniform(0, 2 * math.pi)
+    # a node with no neighbours looks further and further out from the centre
+    # until it finds an empty area
+    rings = 1 if neighbours else MAXIMUM_RINGS
+    for ring in range(1, rings + 1):
+        for i in range(DIRECTIONS):
+            angle = start + 2 * math.pi * i / DIRECTIONS
+            candidate = (x + math.cos(angle) * distance * ring,
+                         y + math.sin(angle) * distance * ring)
+            crowding = grid.crowding(candidate)
+            if bestcrowding is None or crowding < bestcrowding:
+                best = candidate
+                bestcrowding = crowding
+        if bestcrowding == 0:
+            break
+
+    node.position = best
+    node.velocity = (0.0, 0.0)
+    node.wake()
+    grid.add(best)
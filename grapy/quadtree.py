@@ -0,0 +1,176 @@
+from .constants import Constants
+
+# A Barnes-Hut quadtree for calculating the repulsive forces between nodes
+# in O(n log n) rather than O(n^2).
+# the tree is built over the node positions every step. each cell knows the
+# total charge of the nodes inside it, and their charge weighted centre.
+# when a cell is far enough away from a node (its size divided by its
+# distance is less than theta) the whole cell is treated as one large node,
+# otherwise it is opened up and its children are looked at instead.
+# a theta of 0 gives the same result as the full pairwise calculation,
+# larger values trade accuracy for speed.
+
+# cells with this many nodes or less are not split any further
+MAXIMUM_LEAF_SIZE = 4
+
+# stops the tree growing forever when lots of nodes share a position
+MAXIMUM_DEPTH = 24
+
+
+class QuadTreeCell:
+    """A square region of space, and the aggregated charge of the nodes in it.
+    """
+
+    __slots__ = ("x", "y", "size", "charge", "count",
+                 "centrex", "centrey", "children", "indices")
+
+    def __init__(self, x, y, size):
+        self.x = x
+        self.y = y
+        self.size = size
+        self.charge = 0.0
+        self.count = 0
+        self.centrex = 0.0
+        self.centrey = 0.0
+        self.children = None
+        self.indices = None
+
+    def contains(self, px, py):
+        return (self.x <= px <= self.x + self.size and
+                self.y <= py <= self.y + self.size)
+
+
+def buildQuadTree(xs, ys, charges):
+    """Takes lists of x positions, y positions and charges,
+    and returns the root cell of a quadtree containing all of them.
+    """
+    if not xs:
+        return None
+
+    minx = min(xs)
+    miny = min(ys)
+    size = max(max(xs) - minx, max(ys) - miny, 1.0)
+
+    root = QuadTreeCell(minx, miny, size)
+    _fillCell(root, list(range(len(xs))), xs, ys, charges, 0)
+    return root
+
+
+def _fillCell(cell, indices, xs, ys, charges, depth):
+    charge = 0.0
+    weightedx = 0.0
+    weightedy = 0.0
+    for i in indices:
+        q = charges[i]
+        charge += q
+        weightedx += xs[i] * q
+        weightedy += ys[i] * q
+
+    cell.count = len(indices)
+    cell.charge = charge
+    if charge != 0:
+        cell.centrex = weightedx / charge
+        cell.centrey = weightedy / charge
+    else:
+        cell.centrex = sum(xs[i] for i in indices) / len(indices)
+        cell.centrey = sum(ys[i] for i in indices) / len(indices)
+
+    if len(indices) <= MAXIMUM_LEAF_SIZE or depth >= MAXIMUM_DEPTH:
+        cell.indices = indices
+        return
+
+    half = cell.size / 2.0
+    midx = cell.x + half
+    midy = cell.y + half
+
+    quadrants = ([], [], [], [])
+    for i in indices:
+        quadrants[(xs[i] >= midx) + 2 * (ys[i] >= midy)].append(i)
+
+    cell.children = []
+    for quadrant, quadrantindices in enumerate(quadrants):
+        if not quadrantindices:
+            continue
+        child = QuadTreeCell(cell.x + half * (quadrant & 1),
+                             cell.y + half * (quadrant >> 1), half)
+        _fillCell(child, quadrantindices, xs, ys, charges, depth + 1)
+        cell.children.append(child)
+
+
+def calculateRepulsiveForces(xs, ys, charges, theta, indices=None):
+    """Takes lists of x positions, y positions and charges, and the opening
+    angle theta. Returns a list of (fx, fy) repulsive forces, one for each
+    index in indices (or every node if indices is None).
+
+    Uses the same force as Node._calcRepulsiveForceMagnitude. When a cell
+    is approximated, the charge product in the denominator uses the cell's
+    average charge, so a cell of identical nodes at the same distance gives
+    the same force as each of its nodes would.
+    """
+    if indices is None:
+        indices = range(len(xs))
+
+    root = buildQuadTree(xs, ys, charges)
+    if root is None:
+        return []
+
+    constant = Constants.REPULSIVE_FORCE_CONSTANT
+    thetasquared = theta * theta
+    forces = []
+
+    for i in indices:
+        px = xs[i]
+        py = ys[i]
+        q = charges[i]
+        fx = 0.0
+        fy = 0.0
+
+        stack = [root]
+        while stack:
+            cell = stack.pop()
+
+            if cell.indices is not None:
+                # a leaf, so every node in it is done exactly
+                for j in cell.indices:
+                    if j == i:
+                        continue
+                    # matches the offset in findDistanceTuple, from the point
+                    # of view of the node with the lower index
+                    offset = 0.01 if j > i else -0.01
+                    dx = xs[j] - px
+                    dy = ys[j] - py
+                    distance = (dx * dx + dy * dy) ** 0.5
+                    if distance < 15:
+                        distance = 15
+                    charge = q * charges[j]
+                    magnitude = -constant * charge / ((distance * 0.2) ** 2 + charge)
+                    dx += offset
+                    dy += offset
+                    length = (dx * dx + dy * dy) ** 0.5
+                    fx += dx / length * magnitude
+                    fy += dy / length * magnitude
+                continue
+
+            dx = cell.centrex - px
+            dy = cell.centrey - py
+            distancesquared = dx * dx + dy * dy
+
+            if (cell.size * cell.size < thetasquared * distancesquared and
+                    not cell.contains(px, py)):
+                distance = distancesquared ** 0.5
+                if distance < 15:
+                    distance = 15
+                charge = q * cell.charge
+                magnitude = -constant * charge / (
+                    (distance * 0.2) ** 2 + charge / cell.count)
+                dx += 0.01
+                dy += 0.01
+                length = (dx * dx + dy * dy) ** 0.5
+                fx += dx / length * magnitude
+                fy += dy / length * magnitude
+            else:
+                stack.extend(cell.children)
+
+        forces.append((fx, fy))
+
+    return forces
@@ -0,0 +1,63 @@
+import copy
+
+# A snapshot is an immutable copy of where everything in a graph was at the
+# end of a physics step. The physics thread publishes a new one after every
+# step, and the render thread draws from the latest one, so drawing never
+# has to hold the graph's lock.
+#
+# the draw functions are given a snapshot rather than the graph, since they
+# are called without the lock. the nodes in it are the graph's own nodes, so
+# their data and radius are the current ones, and should only be changed
+# with the graph locked (or with queueUpdateNode).
+
+
+class GraphSnapshot:
+    """Contains:
+        nodes: a tuple of (node, (x, y)) pairs
+        edges: a tuple of ((x1, y1), (x2, y2)) pairs, from outgoing to incoming
+        edgeuids: a tuple of (outgoing UID, incoming UID) pairs, in the same
+            order as edges
+        relationships: a dictionary of UID to a tuple of (the UIDs of its
+            outgoing relationships, the UIDs of its incoming relationships)
+        data: a shallow copy of the graph's data, as it was when the
+            snapshot was taken
+        step: the number of physics steps done when it was taken
+        version: the structure version of the graph when it was taken, which
+            changes whenever a node or relationship is added or removed
+    """
+
+    __slots__ = ("nodes", "edges", "edgeuids", "relationships", "data",
+                 "step", "version")
+
+    def __init__(self, nodes=(), edges=(), edgeuids=(), step=0, version=None,
+                 relationships=None, data=None):
+        self.nodes = tuple(nodes)
+        self.edges = tuple(edges)
+        self.edgeuids = tuple(edgeuids)
+        self.relationships = {} if relationships is None else relationships
+        self.data = [] if data is None else data
+        self.step = step
+        self.version = version
+
+    @classmethod
+    def fromGraph(cls, graph, step=0, previous=None):
+        """Takes a snapshot of graph. The graph should be locked.
+        previous is an optional earlier snapshot of the same graph. If the
+        structure of the graph hasn't changed since it was taken, its
+        relationships are used again rather than copied.
+        """
+        positions = dict((uid, n.position) for uid, n in graph.nodes.items())
+        nodes = [(n, positions[uid]) for uid, n in graph.nodes.items()]
+        if previous is not None and previous.version == graph._version:
+            edgeuids = previous.edgeuids
+            relationships = previous.relationships
+        else:
+            edgeuids = [(uid, other)
+                        for uid in graph.relationships
+                        for other in graph.relationships[uid][0]]
+            relationships = dict(
+                (uid, (tuple(outgoings), tuple(incomings)))
+                for uid, (outgoings, incomings) in graph.relationships.items())
+        edges = [(positions[uid], positions[other]) for uid, other in edgeuids]
+        return cls(nodes, edges, edgeuids, step, graph._version,
+                   relationships, copy.copy(graph.data))
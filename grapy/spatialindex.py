@@ -0,0 +1,213 @@
+import heapq
+import math
+
+# A uniform grid over the node positions, used to find nodes near a point
+# or inside a region without checking every node in the graph.
+# the grid is rebuilt from scratch once per physics step, which is cheaper
+# than keeping it up to date as every node moves.
+# rectangles are given like bounding boxes: ((left, top), (right, bottom))
+
+
+class SpatialIndex:
+
+    def __init__(self, cellsize=64):
+        self.cellsize = float(cellsize)
+
+        # maps (cell x, cell y) to a list of the UIDs in that cell
+        self._cells = {}
+        self._positions = {}
+        self._radii = {}
+
+        # the largest node radius, so that point queries know how far
+        # around themselves to look
+        self._maxradius = 0
+
+        self._bounds = None
+
+        # the version of the graph the index was last built from
+        self.graphversion = None
+
+    def _cellOf(self, x, y):
+        return (int(math.floor(x / self.cellsize)),
+                int(math.floor(y / self.cellsize)))
+
+    def rebuild(self, nodes, graphversion=None):
+        """Takes a dictionary of UIDs to nodes and indexes all of them.
+        """
+        cells = {}
+        positions = {}
+        radii = {}
+        maxradius = 0
+        cellsize = self.cellsize
+
+        for uid, node in nodes.items():
+            x, y = node.position
+            key = (int(math.floor(x / cellsize)), int(math.floor(y / cellsize)))
+            if key in cells:
+                cells[key].append(uid)
+            else:
+                cells[key] = [uid]
+            positions[uid] = (x, y)
+            radii[uid] = node.radius
+            if node.radius > maxradius:
+                maxradius = node.radius
+
+        self._cells = cells
+        self._positions = positions
+        self._radii = radii
+        self._maxradius = maxradius
+        self.graphversion = graphversion
+
+        if cells:
+            self._bounds = (min(k[0] for k in cells), min(k[1] for k in cells),
+                            max(k[0] for k in cells), max(k[1] for k in cells))
+        else:
+            self._bounds = None
+
+    def __len__(self):
+        return len(self._positions)
+
+    def _uidsInCells(self, left, top, right, bottom):
+        """Yields the UIDs in every cell that overlaps the rectangle.
+        """
+        if self._bounds is None:
+            return
+        minx, miny = self._cellOf(left, top)
+        maxx, maxy = self._cellOf(right, bottom)
+        minx = max(minx, self._bounds[0])
+        miny = max(miny, self._bounds[1])
+        maxx = min(maxx, self._bounds[2])
+        maxy = min(maxy, self._bounds[3])
+
+        cells = self._cells
+        for cx in range(minx, maxx + 1):
+            for cy in range(miny, maxy + 1):
+                uids = cells.get((cx, cy))
+                if uids:
+                    for uid in uids:
+                        yield uid
+
+    def findCollidingNode(self, position):
+        """Returns the UID of the node whose bounding box contains position,
+        or None. If several do, the one nearest to position is returned.
+        """
+        px, py = position
+        reach = self._maxradius
+        found = None
+        founddistance = None
+
+        for uid in self._uidsInCells(px - reach, py - reach, px + reach, py + reach):
+            x, y = self._positions[uid]
+            radius = self._radii[uid]
+            if abs(px - x) > radius or abs(py - y) > radius:
+                continue
+            distance = (px - x) ** 2 + (py - y) ** 2
+            if found is None or distance < founddistance:
+                found = uid
+                founddistance = distance
+
+        return found
+
+    def findNodesInRect(self, rect):
+        """Returns a list of the UIDs of the nodes positioned inside rect.
+        """
+        (left, top), (right, bottom) = rect
+        if left > right:
+            left, right = right, left
+        if top > bottom:
+            top, bottom = bottom, top
+
+        found = []
+        for uid in self._uidsInCells(left, top, right, bottom):
+            x, y = self._positions[uid]
+            if left <= x <= right and top <= y <= bottom:
+                found.append(uid)
+        return found
+
+    def findNearestNodes(self, position, k=1):
+        """Returns a list of up to k UIDs, ordered from nearest to position.
+
+        Searches outwards from position one ring of cells at a time, and stops
+        once no unsearched cell could contain anything closer.
+        """
+        if self._bounds is None or k <= 0:
+            return []
+
+        px, py = position
+        positions = self._positions
+
+        def distanceTo(uid):
+            x, y = positions[uid]
+            return (px - x) ** 2 + (py - y) ** 2
+
+        if k >= len(positions):
+            return sorted(positions, key=distanceTo)
+
+        centrex, centrey = self._cellOf(px, py)
+        minx, miny, maxx, maxy = self._bounds
+        # the rings before firstring are entirely outside of the grid, so
+        # they are skipped, and the parts of later rings outside it too
+        firstring = max(0, minx - centrex, centrex - maxx,
+                        miny - centrey, centrey - maxy)
+        lastring = max(abs(centrex - minx), abs(centrex - maxx),
+                       abs(centrey - miny), abs(centrey - maxy))
+
+        # a max heap of (-distance squared, counter, uid) holding the k best
+        # so far. the counter stops uids from ever being compared.
+        best = []
+        counter = 0
+        cells = self._cells
+        # when the nodes are spread thinly over a big grid, most cells are
+        # empty, and it is quicker to just check every node
+        budget = len(positions)
+
+        for ring in range(firstring, lastring + 1):
+            if len(best) == k:
+                # the nearest point any cell in this ring can have
+                reach = (ring - 1) * self.cellsize
+                if reach > 0 and reach * reach > -best[0][0]:
+                    break
+
+            keys = self._ringCells(centrex, centrey, ring)
+            budget -= len(keys)
+            if budget < 0:
+                return heapq.nsmallest(k, positions, key=distanceTo)
+
+            for key in keys:
+                uids = cells.get(key)
+                if not uids:
+                    continue
+                for uid in uids:
+                    distance = distanceTo(uid)
+                    counter += 1
+                    if len(best) < k:
+                        heapq.heappush(best, (-distance, counter, uid))
+                    elif distance < -best[0][0]:
+                        heapq.heapreplace(best, (-distance, counter, uid))
+
+        best.sort(key=lambda entry: (-entry[0], entry[1]))
+        return [entry[2] for entry in best]
+
+    def _ringCells(self, centrex, centrey, ring):
+        """Returns the cells in the square ring of cells ring cells away from
+        the centre cell, leaving out any outside of the grid's bounds.
+        """
+        if ring == 0:
+            return [(centrex, centrey)]
+
+        minx, miny, maxx, maxy = self._bounds
+        left = max(centrex - ring, minx)
+        right = min(centrex + ring, maxx)
+        top = max(centrey - ring + 1, miny)
+        bottom = min(centrey + ring - 1, maxy)
+
+        keys = []
+        for cy in (centrey - ring, centrey + ring):
+            if miny <= cy <= maxy:
+                for cx in range(left, right + 1):
+                    keys.append((cx, cy))
+        for cx in (centrex - ring, centrex + ring):
+            if minx <= cx <= maxx:
+                for cy in range(top, bottom + 1):
+                    keys.append((cx, cy))
+        return keys
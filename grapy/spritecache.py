@@ -0,0 +1,75 @@
+from collections import OrderedDict
+
+import pygame
+
+# Rendering text with a pygame font is slow, and so is drawing the same
+# circle over and over again, so the surfaces are rendered once and kept
+# around. custom draw functions can use the same cache through
+# Grapher.spritecache.
+# the cache is bounded, and throws away whatever was used least recently.
+
+# the colour used for the transparent part of circle sprites. if a circle is
+# this colour, a different one is used instead.
+_COLOURKEYS = ((255, 0, 255), (0, 255, 0))
+
+
+class SpriteCache:
+
+    def __init__(self, maxsize=4096):
+        self.maxsize = maxsize
+
+        self._fonts = {}
+        self._surfaces = OrderedDict()
+
+    def __len__(self):
+        return len(self._surfaces)
+
+    def clear(self):
+        self._surfaces.clear()
+
+    def getFont(self, size=20):
+        """Returns the default pygame font at the given size.
+        """
+        font = self._fonts.get(size)
+        if font is None:
+            font = pygame.font.Font(None, size)
+            self._fonts[size] = font
+        return font
+
+    def getText(self, text, size=20, colour=(255, 255, 255)):
+        """Returns a surface with the text rendered on it.
+        """
+        key = ("text", text, size, colour)
+        surface = self._get(key)
+        if surface is None:
+            surface = self.getFont(size).render(text, 1, colour)
+            self._put(key, surface)
+        return surface
+
+    def getCircle(self, radius, colour):
+        """Returns a surface with a filled circle of radius drawn in the
+        middle of it. It is (2 * radius + 1) pixels wide, so to centre the
+        circle on a point, blit it at the point minus the radius.
+        """
+        key = ("circle", radius, colour)
+        surface = self._get(key)
+        if surface is None:
+            colourkey = _COLOURKEYS[0] if tuple(colour[:3]) != _COLOURKEYS[0] else _COLOURKEYS[1]
+            size = 2 * radius + 1
+            surface = pygame.Surface((size, size))
+            surface.fill(colourkey)
+            pygame.draw.circle(surface, colour, (radius, radius), radius, 0)
+            surface.set_colorkey(colourkey, pygame.RLEACCEL)
+            self._put(key, surface)
+        return surface
+
+    def _get(self, key):
+        surface = self._surfaces.get(key)
+        if surface is not None:
+            self._surfaces.move_to_end(key)
+        return surface
+
+    def _put(self, key, surface):
+        self._surfaces[key] = surface
+        if len(self._surfaces) > self.maxsize:
+            self._surfaces.popitem(last=False)
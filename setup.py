@@ -8,5 +8,5 @@ setup(name='grapy',
       author_email='2089249F@students.gla.ac.uk',
       license='MIT',
       packages = ['grapy'],
-      install_requires=['pygame>=1.9.1'],
+      install_requires=['pygame>=1.9.4'],
       zip_safe=False)
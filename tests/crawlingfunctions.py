@@ -1,30 +1,348 @@
-from urllib.request import urlopen
+# Crawling for the wikipedia browser.
+#
+# pages are fetched by an asyncio crawler, which:
+#   fetches at most "concurrency" pages at once
+#   keeps connections open between requests (HTTP/1.1 keep-alive, see
+#       keepalive.py), up to "connectionsperhost" to each host, rather than
+#       connecting every time
+#   keeps the links found on each page in an on-disk cache (sqlite), dropping
+#       the least recently used pages when it gets too big
+#   finds the links while the page is still arriving, with an HTMLParser,
+#       rather than waiting for the whole page and splitting it up
+#   removes duplicate links with a set
+#
+# the crawler runs on its own event loop thread (BackgroundCrawler), and
+# hands its results over in batches, so that the graph can be changed once
+# for several pages rather than once for each.
+#
+# the base url can point anywhere, such as a local http.server serving some
+# fixture pages, so it can be tried out without wikipedia. test_crawler.py
+# does this with the pages in fixtures.
+
+import asyncio
+import codecs
+import json
+import sqlite3
+import threading
+from html.parser import HTMLParser
+from urllib.parse import quote, urljoin, urlsplit
+
+from keepalive import ConnectionPool
+
+WIKIPEDIA_URL = "https://en.wikipedia.org/wiki/"
+
+# how many redirects are followed before giving up
+MAXIMUM_REDIRECTS = 5
 
 
 def finduniquepages(listofpages):
+    """Returns the pages without any duplicates, in the order they first
+    appear.
+    """
+    seen = set()
     uniquepages = []
     for p in listofpages:
-        if p not in uniquepages:
-            uniquepages = uniquepages + [p]
+        if p not in seen:
+            seen.add(p)
+            uniquepages.append(p)
 
     return uniquepages
 
 
-def findlinksonpage(pagename):
-    if isinstance(pagename, bytes):
-        pagename = pagename.decode("utf-8")
+class LinkParser(HTMLParser):
+    """Finds the links to other articles in a page, as it is fed. The names of
+    the articles are in links, in the order they first appear.
+    """
 
-    url = "http://en.wikipedia.org/wiki/{}".format(pagename)
-    html = urlopen(url).read()
+    def __init__(self, prefix="/wiki/"):
+        HTMLParser.__init__(self, convert_charrefs=True)
+        self.prefix = prefix
+        self.links = []
+        self._seen = set()
 
-    split1 = html.split(b"\"")
+    def handle_starttag(self, tag, attrs):
+        if tag != "a":
+            return
+        for name, value in attrs:
+            if name == "href" and value and value.startswith(self.prefix):
+                page = value[len(self.prefix):]
+                # skipping special pages, sections and anything escaped
+                if (page and ":" not in page and "#" not in page and
+                        "%" not in page and page not in self._seen):
+                    self._seen.add(page)
+                    self.links.append(page)
 
-    pages = []
 
-    for chunk in split1:
-        if chunk.startswith(b"/wiki/") and (b":" not in chunk and b"#" not in chunk and b"%" not in chunk):
-            pages = pages + [chunk[6:]]
+class LinkCache:
+    """An on-disk cache of the links on each page, by url. When it holds more
+    than maxpages pages, the least recently used are dropped.
+    """
 
-    uniquepages = finduniquepages(pages)
+    def __init__(self, path, maxpages=10000):
+        self.maxpages = maxpages
+        self._lock = threading.Lock()
+        self._connection = sqlite3.connect(path, check_same_thread=False)
+        self._connection.execute(
+            "CREATE TABLE IF NOT EXISTS pages "
+            "(url TEXT PRIMARY KEY, links TEXT NOT NULL, used INTEGER NOT NULL)")
+        self._connection.execute(
+            "CREATE INDEX IF NOT EXISTS pagesused ON pages (used)")
+        self._connection.commit()
+        # incremented every time a page is used, to order them by
+        row = self._connection.execute("SELECT MAX(used) FROM pages").fetchone()
+        self._clock = row[0] or 0
 
-    return uniquepages
+    def get(self, url):
+        """Returns the links on the page at url, or None if it isn't cached.
+        """
+        with self._lock:
+            row = self._connection.execute(
+                "SELECT links FROM pages WHERE url = ?", (url,)).fetchone()
+            if row is None:
+                return None
+            self._clock += 1
+            self._connection.execute(
+                "UPDATE pages SET used = ? WHERE url = ?", (self._clock, url))
+            self._connection.commit()
+            return json.loads(row[0])
+
+    def put(self, url, links):
+        with self._lock:
+            self._clock += 1
+            self._connection.execute(
+                "INSERT OR REPLACE INTO pages (url, links, used) VALUES (?, ?, ?)",
+                (url, json.dumps(links), self._clock))
+            self._connection.execute(
+                "DELETE FROM pages WHERE used <= ?",
+                (self._clock - self.maxpages,))
+            self._connection.commit()
+
+    def __len__(self):
+        with self._lock:
+            return self._connection.execute(
+                "SELECT COUNT(*) FROM pages").fetchone()[0]
+
+    def close(self):
+        with self._lock:
+            self._connection.close()
+
+
+class HTTPError(Exception):
+    pass
+
+
+class Crawler:
+
+    def __init__(self, baseurl=WIKIPEDIA_URL, concurrency=8,
+                 connectionsperhost=4, cache=None):
+        """Takes:
+            baseurl: the url that page names are added on to
+            concurrency: the most pages to fetch at once
+            connectionsperhost: the most connections to keep open to a host
+            cache: an optional LinkCache
+        """
+        self.baseurl = baseurl
+        self.prefix = urlsplit(baseurl).path
+        self.connectionsperhost = connectionsperhost
+        self.cache = cache
+        self._concurrency = concurrency
+        # the semaphore and the connections belong to an event loop, so they
+        # are made again whenever the crawler is used on a different one
+        self._loop = None
+        self._semaphore = None
+        self._pools = {}
+
+        self.fetched = 0
+        self.cachehits = 0
+
+    def urlOf(self, page):
+        return self.baseurl + quote(page)
+
+    async def fetchLinks(self, page):
+        """Returns a list of the pages linked to from page, without any
+        duplicates.
+        """
+        url = self.urlOf(page)
+        if self.cache is not None:
+            links = self.cache.get(url)
+            if links is not None:
+                self.cachehits += 1
+                return links
+
+        loop = asyncio.get_running_loop()
+        if loop is not self._loop:
+            self.close()
+            self._loop = loop
+            self._semaphore = asyncio.Semaphore(self._concurrency)
+        async with self._semaphore:
+            links = await self._fetchLinks(url)
+
+        self.fetched += 1
+        if self.cache is not None:
+            self.cache.put(url, links)
+        return links
+
+    async def _fetchLinks(self, url):
+        for i in range(MAXIMUM_REDIRECTS + 1):
+            parser = LinkParser(self.prefix)
+            decoder = codecs.getincrementaldecoder("utf-8")(errors="replace")
+
+            def onchunk(chunk):
+                parser.feed(decoder.decode(chunk))
+
+            status, headers = await self._get(url, onchunk)
+            if status in (301, 302, 303, 307, 308) and "location" in headers:
+                url = urljoin(url, headers["location"])
+                continue
+            if status != 200:
+                raise HTTPError("{} RETURNED STATUS {}".format(url, status))
+
+            parser.feed(decoder.decode(b"", final=True))
+            parser.close()
+            return parser.links
+
+        raise HTTPError("{} REDIRECTED TOO MANY TIMES".format(url))
+
+    async def _get(self, url, onchunk):
+        parts = urlsplit(url)
+        port = parts.port or (443 if parts.scheme == "https" else 80)
+        key = (parts.scheme, parts.hostname, port)
+        pool = self._pools.get(key)
+        if pool is None:
+            pool = ConnectionPool(parts.scheme, parts.hostname, port,
+                                   self.connectionsperhost)
+            self._pools[key] = pool
+
+        path = parts.path or "/"
+        if parts.query:
+            path += "?" + parts.query
+        return await pool.request(path, onchunk)
+
+    async def crawl(self, pages, batchsize=20, batchinterval=0.1):
+        """Fetches the links on every page in pages at once (up to the
+        concurrency limit), yielding lists of (page, links) pairs. A list is
+        yielded when batchsize pages have finished, or batchinterval seconds
+        after the first page in it finished. Pages that couldn't be fetched
+        have an exception instead of links.
+        """
+        tasks = [asyncio.ensure_future(self.fetchResult(p))
+                 for p in finduniquepages(pages)]
+        pending = set(tasks)
+        batch = []
+        deadline = None
+        loop = asyncio.get_running_loop()
+
+        while pending:
+            timeout = None if deadline is None else max(0, deadline - loop.time())
+            done, pending = await asyncio.wait(
+                pending, timeout=timeout, return_when=asyncio.FIRST_COMPLETED)
+            for task in done:
+                batch.append(task.result())
+            if batch and deadline is None:
+                deadline = loop.time() + batchinterval
+            if batch and (len(batch) >= batchsize or loop.time() >= deadline or
+                          not pending):
+                yield batch
+                batch = []
+                deadline = None
+
+    async def fetchResult(self, page):
+        """Returns (page, links), or (page, the exception) if it couldn't be
+        fetched.
+        """
+        try:
+            return page, await self.fetchLinks(page)
+        except Exception as e:
+            return page, e
+
+    def close(self):
+        """Closes any connections that are being kept open. The crawler can
+        still be used afterwards, on any event loop.
+        """
+        pools = self._pools
+        for pool in pools.values():
+            pool.close()
+        self._pools = {}
+        self._semaphore = None
+        self._loop = None
+        return pools
+
+    async def aclose(self):
+        """Closes the connections like close, from the crawler's event loop,
+        and waits for them to finish closing. This should be done before the
+        loop is closed, such as at the end of the coroutine given to
+        asyncio.run.
+        """
+        for pool in self.close().values():
+            await pool.aclose()
+
+
+class BackgroundCrawler:
+    """Runs a Crawler on an event loop in its own thread, so that pages can
+    be submitted from any thread. The results are handed to onbatch (on the
+    crawler's thread) as lists of (page, links) pairs, with every page that
+    finished within batchinterval seconds of each other in the same list.
+    """
+
+    def __init__(self, crawler, onbatch, batchinterval=0.1):
+        self.crawler = crawler
+        self.onbatch = onbatch
+        self.batchinterval = batchinterval
+
+        self._results = []
+        self._flushing = False
+        self._loop = asyncio.new_event_loop()
+        self._thread = threading.Thread(target=self._loop.run_forever)
+        self._thread.daemon = True
+        self._thread.start()
+
+    def submit(self, page):
+        """Starts crawling page. Can be called from any thread.
+        """
+        self._loop.call_soon_threadsafe(self._start, page)
+
+    def fetchLinks(self, page, timeout=None):
+        """Crawls page, and waits for and returns its links.
+        """
+        return asyncio.run_coroutine_threadsafe(
+            self.crawler.fetchLinks(page), self._loop).result(timeout)
+
+    def _start(self, page):
+        self._loop.create_task(self._crawl(page))
+
+    async def _crawl(self, page):
+        self._results.append(await self.crawler.fetchResult(page))
+        if not self._flushing:
+            self._flushing = True
+            self._loop.call_later(self.batchinterval, self._flush)
+
+    def _flush(self):
+        results = self._results
+        self._results = []
+        self._flushing = False
+        self.onbatch(results)
+
+    def stop(self):
+        asyncio.run_coroutine_threadsafe(self.crawler.aclose(), self._loop).result()
+        self._loop.call_soon_threadsafe(self._loop.stop)
+        self._thread.join()
+        self._loop.close()
+
+
+# used by findlinksonpage
+_defaultcrawler = None
+_defaultcrawlerlock = threading.Lock()
+
+
+def findlinksonpage(pagename):
+    """Returns the unique article names linked to from the wikipedia article
+    pagename. Waits for the page to be crawled.
+    """
+    global _defaultcrawler
+    if isinstance(pagename, bytes):
+        pagename = pagename.decode("utf-8")
+
+    with _defaultcrawlerlock:
+        if _defaultcrawler is None:
+            _defaultcrawler = BackgroundCrawler(Crawler(), lambda results: None)
+    return _defaultcrawler.fetchLinks(pagename)
@@ -59,7 +59,8 @@ def findclosest(node, graph, numbertofind):
 def mainthread():
     global graph, g, lastnodeadded, NUMBER_OF_NODES_TO_CONNECT_TO
     while g.running:
-        events = g.getEvents()
+        # waits for up to a tenth of a second for events, rather than spinning
+        events = g.getEvents(timeout=0.1)
         for e in events:
             print("recieved event:", e)
             # if the event is a mouse click event and the mousebutton is the right click
@@ -0,0 +1,146 @@
+# A small HTTP/1.1 client for the crawler, which keeps its connections open
+# between requests (keep-alive) rather than connecting every time.
+#
+# it only does what the crawler needs: GET requests, with the body handed
+# over a piece at a time as it arrives. bodies can have a Content-Length, be
+# chunked, or go on until the server closes the connection. a connection is
+# only used again when the server says it can be.
+
+import asyncio
+import ssl
+
+USER_AGENT = "GraPy-wikipedia-browser"
+
+# how much of a body is read at once
+CHUNK_SIZE = 65536
+
+
+class _Closed(Exception):
+    # the server closed the connection before answering
+    pass
+
+
+class ConnectionPool:
+    """Keeps the idle connections to one host, so they can be used again.
+    At most maxconnections requests are sent to the host at once. A pool
+    belongs to the event loop that first uses it.
+    """
+
+    def __init__(self, scheme, host, port, maxconnections):
+        self.scheme = scheme
+        self.host = host
+        self.port = port
+        self.connections = 0
+        self._idle = []
+        self._semaphore = asyncio.Semaphore(maxconnections)
+
+    async def request(self, path, onchunk):
+        """Sends a GET request for path, and calls onchunk with each piece of
+        the body as it arrives. Returns (status, headers), with the headers'
+        names in lower case.
+        """
+        async with self._semaphore:
+            # a connection that has been idle might have been closed by the
+            # server, in which case the request is tried again on a new one
+            while self._idle:
+                try:
+                    return await self._send(self._idle.pop(), path, onchunk)
+                except _Closed:
+                    pass
+            context = ssl.create_default_context() if self.scheme == "https" else None
+            connection = await asyncio.open_connection(self.host, self.port, ssl=context)
+            self.connections += 1
+            try:
+                return await self._send(connection, path, onchunk)
+            except _Closed:
+                raise ConnectionError("{} CLOSED THE CONNECTION WITHOUT ANSWERING".format(self.host))
+
+    async def _send(self, connection, path, onchunk):
+        reader, writer = connection
+        try:
+            status, headers, reusable = await self._exchange(reader, writer, path, onchunk)
+        except BaseException:
+            writer.close()
+            raise
+        if reusable:
+            self._idle.append(connection)
+        else:
+            writer.close()
+        return status, headers
+
+    async def _exchange(self, reader, writer, path, onchunk):
+        writer.write((
+            "GET {} HTTP/1.1\r\n"
+            "Host: {}\r\n"
+            "User-Agent: {}\r\n"
+            "Accept-Encoding: identity\r\n\r\n").format(
+                path, self.host, USER_AGENT).encode("latin-1"))
+        try:
+            await writer.drain()
+            statusline = await reader.readline()
+        except ConnectionError:
+            statusline = b""
+        if not statusline:
+            raise _Closed()
+        status = int(statusline.split()[1])
+        headers = {}
+        while True:
+            line = await reader.readline()
+            if line in (b"\r\n", b"\n", b""):
+                break
+            name, _, value = line.decode("latin-1").partition(":")
+            headers[name.strip().lower()] = value.strip()
+
+        reusable = (statusline.startswith(b"HTTP/1.1") and
+                    headers.get("connection", "").lower() != "close")
+        if status in (204, 304) or 100 <= status < 200:
+            pass
+        elif headers.get("transfer-encoding", "").lower() == "chunked":
+            while True:
+                size = int((await reader.readline()).split(b";")[0], 16)
+                if size == 0:
+                    break
+                onchunk(await reader.readexactly(size))
+                await reader.readline()
+            # skipping any trailers
+            while (await reader.readline()) not in (b"\r\n", b"\n", b""):
+                pass
+        elif "content-length" in headers:
+            remaining = int(headers["content-length"])
+            while remaining:
+                chunk = await reader.read(min(remaining, CHUNK_SIZE))
+                if not chunk:
+                    raise asyncio.IncompleteReadError(b"", remaining)
+                onchunk(chunk)
+                remaining -= len(chunk)
+        else:
+            reusable = False
+            while True:
+                chunk = await reader.read(CHUNK_SIZE)
+                if not chunk:
+                    break
+                onchunk(chunk)
+        return status, headers, reusable
+
+    def close(self):
+        """Closes the idle connections. Connections made on an event loop
+        that has since been closed can't be closed any more, so they are
+        dropped, and closed when they are garbage collected.
+        """
+        writers = [writer for reader, writer in self._idle]
+        del self._idle[:]
+        for writer in writers:
+            try:
+                writer.close()
+            except RuntimeError:
+                pass
+        return writers
+
+    async def aclose(self):
+        """Closes the idle connections, and waits for them to finish closing.
+        """
+        for writer in self.close():
+            try:
+                await writer.wait_closed()
+            except ConnectionError:
+                pass
@@ -0,0 +1,276 @@
+# Tests for the crawler, against a local server serving the pages in
+# fixtures, so they don't need wikipedia or the internet.
+#
+# run from the repository's root with either of:
+#   python -m pytest tests/test_crawler.py
+#   python tests/test_crawler.py
+
+import asyncio
+import gc
+import os
+import shutil
+import tempfile
+import threading
+import unittest
+import warnings
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import unquote
+
+from crawlingfunctions import BackgroundCrawler, Crawler, HTTPError, LinkCache
+from keepalive import ConnectionPool
+
+FIXTURES = os.path.join(os.path.dirname(os.path.abspath(__file__)), "fixtures")
+
+GRAPH_THEORY_LINKS = ["Graph_theory", "Vertex_(graph_theory)",
+                      "Leonhard_Euler", "Force-directed_graph_drawing",
+                      "Glossary_of_graph_theory"]
+
+PAGES = ["Graph_theory", "Vertex_(graph_theory)", "Glossary_of_graph_theory",
+         "Leonhard_Euler", "Force-directed_graph_drawing"]
+
+
+class FixtureHandler(BaseHTTPRequestHandler):
+    """Serves fixtures/<page>.html as /wiki/<page>, with a Content-Length.
+    /chunked/<page> sends the same page chunked, /redirect/<page> redirects
+    to it, and /close/<page> closes the connection after it.
+    """
+
+    protocol_version = "HTTP/1.1"
+
+    def setup(self):
+        BaseHTTPRequestHandler.setup(self)
+        with self.server.lock:
+            self.server.connections += 1
+
+    def do_GET(self):
+        kind, _, page = self.path[1:].partition("/")
+        if kind == "redirect":
+            self.send_response(301)
+            self.send_header("Location", "/wiki/" + page)
+            self.send_header("Content-Length", "0")
+            self.end_headers()
+            return
+
+        path = os.path.join(FIXTURES, unquote(page) + ".html")
+        if kind not in ("wiki", "chunked", "close") or not os.path.isfile(path):
+            self.send_error(404)
+            return
+        with open(path, "rb") as f:
+            body = f.read()
+
+        self.send_response(200)
+        self.send_header("Content-Type", "text/html; charset=utf-8")
+        if kind == "chunked":
+            self.send_header("Transfer-Encoding", "chunked")
+            self.end_headers()
+            for start in range(0, len(body), 100):
+                chunk = body[start:start + 100]
+                self.wfile.write(b"%x\r\n%s\r\n" % (len(chunk), chunk))
+            self.wfile.write(b"0\r\n\r\n")
+            return
+        if kind == "close":
+            self.send_header("Connection", "close")
+            self.close_connection = True
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format, *args):
+        pass
+
+
+class FixtureServer(ThreadingHTTPServer):
+    """A local stand-in for wikipedia, serving the fixture pages on its own
+    thread.
+    """
+
+    daemon_threads = True
+
+    def __init__(self):
+        ThreadingHTTPServer.__init__(self, ("127.0.0.1", 0), FixtureHandler)
+        self.lock = threading.Lock()
+        self.connections = 0
+        self._thread = threading.Thread(target=self.serve_forever)
+        self._thread.daemon = True
+        self._thread.start()
+
+    def url(self, kind="wiki"):
+        return "http://127.0.0.1:{}/{}/".format(self.server_port, kind)
+
+    def stop(self):
+        self.shutdown()
+        self.server_close()
+        self._thread.join()
+
+
+def run(crawler, coroutine):
+    """Runs coroutine on a new event loop, closing crawler's connections
+    before the loop is closed. Returns what the coroutine returns.
+    """
+    async def main():
+        try:
+            return await coroutine
+        finally:
+            await crawler.aclose()
+    return asyncio.run(main())
+
+
+async def crawlAll(crawler, pages, batchsize=20):
+    batches = []
+    async for batch in crawler.crawl(pages, batchsize):
+        batches.append(batch)
+    return batches
+
+
+class CrawlerTest(unittest.TestCase):
+
+    @classmethod
+    def setUpClass(cls):
+        cls.server = FixtureServer()
+
+    @classmethod
+    def tearDownClass(cls):
+        cls.server.stop()
+
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+
+    def tearDown(self):
+        shutil.rmtree(self.directory)
+
+    def crawler(self, kind="wiki", **arguments):
+        crawler = Crawler(self.server.url(kind), **arguments)
+        # every kind of url links to the pages as /wiki/
+        crawler.prefix = "/wiki/"
+        self.addCleanup(crawler.close)
+        return crawler
+
+    def test_finds_links_in_order_without_duplicates(self):
+        crawler = self.crawler()
+        links = run(crawler, crawler.fetchLinks("Graph_theory"))
+        self.assertEqual(links, GRAPH_THEORY_LINKS)
+
+    def test_chunked_pages_and_redirects(self):
+        for kind in ("chunked", "redirect"):
+            crawler = self.crawler(kind)
+            self.assertEqual(run(crawler, crawler.fetchLinks("Graph_theory")),
+                             GRAPH_THEORY_LINKS)
+
+    def test_missing_pages_give_errors(self):
+        crawler = self.crawler()
+        page, result = run(crawler, crawler.fetchResult("Missing"))
+        self.assertEqual(page, "Missing")
+        self.assertIsInstance(result, HTTPError)
+
+    def test_crawl_yields_every_page_once_in_batches(self):
+        crawler = self.crawler(concurrency=2)
+        batches = run(crawler, crawlAll(crawler, PAGES + PAGES[:2] + ["Missing"],
+                                        batchsize=2))
+        results = [result for batch in batches for result in batch]
+        self.assertTrue(all(len(batch) <= 2 for batch in batches))
+        self.assertEqual(sorted(page for page, links in results),
+                         sorted(PAGES + ["Missing"]))
+        self.assertEqual(crawler.fetched, len(PAGES))
+        self.assertEqual(dict(results)["Leonhard_Euler"], ["Graph_theory"])
+
+    def test_connections_are_kept_alive(self):
+        crawler = self.crawler(concurrency=4, connectionsperhost=1)
+        before = self.server.connections
+        run(crawler, crawlAll(crawler, PAGES))
+        self.assertEqual(self.server.connections - before, 1)
+
+    def test_crawler_can_be_used_on_several_event_loops(self):
+        crawler = self.crawler()
+        first = run(crawler, crawler.fetchLinks("Graph_theory"))
+        second = run(crawler, crawler.fetchLinks("Graph_theory"))
+        self.assertEqual(first, second)
+        self.assertEqual(crawler.fetched, 2)
+
+    def test_connections_left_on_a_closed_event_loop_are_dropped(self):
+        crawler = self.crawler()
+        # the connection is left open when the first loop is closed, and
+        # warns when it is garbage collected
+        asyncio.run(crawler.fetchLinks("Graph_theory"))
+        with warnings.catch_warnings():
+            warnings.simplefilter("ignore", ResourceWarning)
+            self.assertEqual(run(crawler, crawler.fetchLinks("Leonhard_Euler")),
+                             ["Graph_theory"])
+            gc.collect()
+
+    def test_cache_is_used_and_drops_least_recently_used(self):
+        cache = LinkCache(os.path.join(self.directory, "links.sqlite"), maxpages=3)
+        self.addCleanup(cache.close)
+        crawler = self.crawler(cache=cache)
+        for page in PAGES[:3]:
+            run(crawler, crawler.fetchLinks(page))
+        # using the first page makes the second the least recently used
+        self.assertEqual(run(crawler, crawler.fetchLinks(PAGES[0])), GRAPH_THEORY_LINKS)
+        self.assertEqual((crawler.fetched, crawler.cachehits), (3, 1))
+
+        run(crawler, crawler.fetchLinks(PAGES[3]))
+        self.assertEqual(len(cache), 3)
+        self.assertIsNone(cache.get(crawler.urlOf(PAGES[1])))
+        self.assertIsNotNone(cache.get(crawler.urlOf(PAGES[0])))
+
+    def test_background_crawler_hands_over_batches(self):
+        batches = []
+        done = threading.Event()
+
+        def onbatch(results):
+            batches.append(results)
+            if sum(len(batch) for batch in batches) == len(PAGES):
+                done.set()
+
+        background = BackgroundCrawler(self.crawler(), onbatch, batchinterval=0.2)
+        try:
+            for page in PAGES:
+                background.submit(page)
+            self.assertTrue(done.wait(10))
+            self.assertEqual(background.fetchLinks("Leonhard_Euler", 10),
+                             ["Graph_theory"])
+        finally:
+            background.stop()
+        self.assertLess(len(batches), len(PAGES))
+
+
+class ConnectionPoolTest(unittest.TestCase):
+
+    @classmethod
+    def setUpClass(cls):
+        cls.server = FixtureServer()
+
+    @classmethod
+    def tearDownClass(cls):
+        cls.server.stop()
+
+    def fetch(self, paths):
+        async def run():
+            pool = ConnectionPool("http", "127.0.0.1", self.server.server_port, 1)
+            results = []
+            for path in paths:
+                chunks = []
+                status, headers = await pool.request(path, chunks.append)
+                results.append((status, b"".join(chunks)))
+            await pool.aclose()
+            return pool.connections, results
+        return asyncio.run(run())
+
+    def test_bodies_are_the_same_however_they_are_sent(self):
+        with open(os.path.join(FIXTURES, "Graph_theory.html"), "rb") as f:
+            body = f.read()
+        connections, results = self.fetch(["/wiki/Graph_theory",
+                                           "/chunked/Graph_theory",
+                                           "/close/Graph_theory"])
+        self.assertEqual(results, [(200, body)] * 3)
+        self.assertEqual(connections, 1)
+
+    def test_closed_connections_are_not_used_again(self):
+        connections, results = self.fetch(["/close/Leonhard_Euler",
+                                           "/wiki/Leonhard_Euler",
+                                           "/wiki/Missing"])
+        self.assertEqual([status for status, body in results], [200, 200, 404])
+        self.assertEqual(connections, 2)
+
+
+if __name__ == "__main__":
+    unittest.main()
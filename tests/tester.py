@@ -18,7 +18,8 @@ g = grapy.Grapher(graph=graph)
 def mainthread():
     global graph, g, lastnodeadded
     while g.running:
-        events = g.getEvents()
+        # waits for up to a tenth of a second for events, rather than spinning
+        events = g.getEvents(timeout=0.1)
         for e in events:
             print("recieved event:", e)
             # if the event is a mouse click event and the mousebutton is the right click
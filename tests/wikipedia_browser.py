@@ -6,77 +6,92 @@
 # node data[0] is the current state of crawling. 0 - uncrawled, 1 - currently crawling, 2 - crawled
 from __future__ import print_function
 
-from threading import Thread
-
-import pygame
+import os
+import tempfile
 import webbrowser
 
 from grapy import *
-from grapy.grapher import tupleSubtract
-from crawlingfunctions import findlinksonpage
+from grapy.grapher import Grapher, tupleSubtract
+from crawlingfunctions import BackgroundCrawler, Crawler, LinkCache
+
 
+# the names of every node that has been added, including ones that are still
+# queued to be added, so that the same page isn't added twice
+addednames = set()
 
-# if this is set to true, we will cycle through
-# adds a new node to the graph near it's parent. assumes that it hasn't been crawled
+
+# adds a new node to the graph. assumes that it hasn't been crawled.
+# the graph places it near its parent automatically.
+# the node is queued, so the graph doesn't need to be locked
 def addnewnode(graph, name, parent):
-    parentposition = graph.nodes[parent].position
-    nodeposition = (parentposition[0] + 30, parentposition[1] + 30)
-    n = Node(name, position=nodeposition)
+    n = Node(name)
     n.data = [0, 0, 0]
     n.data[0] = 0
     n.data[1] = []
     n.data[2] = 0
 
-    graph.addNode(n)
-    graph.addRelationship(name, parent)
-
-# spawns a new node near a given parent node
+    addednames.add(name)
+    graph.queueAddNode(n)
+    graph.queueAddRelationship(name, parent)
 
+# spawns a new node near a given parent node, from the links that haven't been
+# added yet
 
-def spawnfrommetadata(graph, parent):
-    if not len(graph.nodes[parent].data[1]) > 0:
-        return
 
-    # killing some uncrawled nodes, because clearly they are not of interest
+def spawnfromlinks(graph, parent, links):
+    # taking the links off the front of the list until one hasn't already
+    # been added
+    while len(links) > 0:
+        newnodename = links.pop(0)
+        if newnodename not in addednames:
+            addnewnode(graph, newnodename, parent)
+            return
 
-    # taking note of the new node name before removing it from the parent node's list
-    newnodename = graph.nodes[parent].data[1][0]
-    graph.nodes[parent].data[1] = graph.nodes[parent].data[1][1:]
 
-    # checking to make sure the node doesn't already exist
-    if newnodename in graph.nodes:
-        spawnfrommetadata(graph, parent)
-    else:
-        addnewnode(graph, newnodename, parent)
+def spawnfrommetadata(graph, parent):
+    spawnfromlinks(graph, parent, graph.nodes[parent].data[1])
 
 
-# takes a graph to add the new node to. adds a true statement to the node's metadata along with a list of all of the pages crawled to the node's extra data, and the size of this list as the second element
-# does the following:
-# finds unique links on page
+# takes a batch of (page, links) pairs from the crawler. for each page:
 # the node should already exist, so update the node metadata to say it's been crawled
-# create a few new nodes from it's metadata, and remove them from the metadata
-def crawlthread(graph, page):
+# along with a list of all of the pages it links to, and the size of this list
+# create a few new nodes from it's links, and remove them from the list
+# the changes to the nodes are queued, so the graph's lock is only waited for
+# when a page has more links than any before it, to change the graph's data
+def crawledbatch(graph, results):
+    for page, uniquelinks in results:
+        if isinstance(uniquelinks, Exception):
+            print("COULDN'T CRAWL", page, uniquelinks)
+            graph.queueUpdateNode(page, data=[0, [], 0])
+            continue
+
+        print("DONE CRAWLING", page)
+        if len(uniquelinks) > graph.data[0]:
+            graph.lock()
+            try:
+                graph.data[0] = max(graph.data[0], len(uniquelinks))
+            finally:
+                graph.unlock()
+
+        links = list(uniquelinks)
+        for i in range(0, 5):
+            spawnfromlinks(graph, page, links)
+
+        graph.queueUpdateNode(page, data=[2, links, len(uniquelinks)])
+
+
+# the graph should be locked
+def startcrawling(graph, page):
     print("CURRENTLY CRAWLING:", page)
     graph.nodes[page].data[0] = 1
-    uniquelinks = findlinksonpage(page)
-
-    print("DONE CRAWLING", page, "WAITING FOR LOCK AVAILABILITY.")
-    graph.lock()
-    graph.nodes[page].data[0] = 2
-    graph.nodes[page].data[1] = uniquelinks
-    graph.nodes[page].data[2] = len(uniquelinks)
-
-    if len(uniquelinks) > graph.data[0]:
-        graph.data[0] = len(uniquelinks)
-
-    for i in range(0, 5):
-        spawnfrommetadata(graph, page)
-
-    graph.unlock()
+    # the node's colour has changed without it moving, so it needs redrawing
+    g.redraw()
+    crawler.submit(page)
 
 
-# a custom draw function for the nodes.
-def customdraw(screen, node, graph, position):
+# a custom draw function for the nodes. it is given a snapshot of the graph
+# rather than the graph, since drawing doesn't lock the graph
+def customdraw(screen, node, snapshot, position):
     # n produces a colour gradient between 0 and 254 depending on the number of relationships
     # n = (((1 + 1.0/(0.35*(relationships+1)))**(0.35*relationships)-1)/1.71828)*254 #tends to 254 as relaitonships tend to infinity
 
@@ -84,52 +99,68 @@ def customdraw(screen, node, graph, position):
     # if the node has been crawled, colour it more red depending on how many links it still has left to pop up, and totally blue when that is none.
     if node.data[0] == 2:  # if it has been crawled
         # ranges from 0 to 1. 1 being the most important
-        importance = float(node.data[2]) / graph.data[0]
+        importance = float(node.data[2]) / snapshot.data[0]
         node.radius = int(8 + 20 * importance)
-        pygame.draw.circle(screen, (int(255 * importance), 0,
-                                    255 - int(255 * importance)), position, node.radius, 0)
-
-        f = pygame.font.Font(None, 20).render(node.UID, 1, (255, 255, 255))
-        f2 = pygame.font.Font(None, 20).render(
-            str(len(node.data[1])) + "/" + str(node.data[2]), 1, (255, 255, 255))
+        circle = g.spritecache.getCircle(
+            node.radius, (int(255 * importance), 0, 255 - int(255 * importance)))
+        g.queueBlit(circle, tupleSubtract(position, (node.radius, node.radius)))
+
+        # the rendered text is cached by the grapher, so it is only rendered
+        # again when it changes
+        f = g.spritecache.getText(node.UID, 20, (255, 255, 255))
+        f2 = g.spritecache.getText(
+            str(len(node.data[1])) + "/" + str(node.data[2]), 20, (255, 255, 255))
         # blitting the text with an x offset of 15 pixels
-        screen.blit(f, tupleSubtract(position, (0, -10)))
-        screen.blit(f2, tupleSubtract(position, (0, -23)))
+        g.queueBlit(f, tupleSubtract(position, (0, -10)))
+        g.queueBlit(f2, tupleSubtract(position, (0, -23)))
     else:
         node.radius = 8
-        pygame.draw.circle(screen, (100, 100, 100), position, node.radius, 0)
+        g.queueBlit(g.spritecache.getCircle(node.radius, (100, 100, 100)),
+                    tupleSubtract(position, (node.radius, node.radius)))
 
         textcolour = (255, 255, 255)
 
         if node.data[0] == 1:  # if is currently being crawled, make the text yellow
             textcolour = (255, 255, 0)
 
-        f = pygame.font.Font(None, 20).render(node.UID, 1, textcolour)
+        f = g.spritecache.getText(node.UID, 20, textcolour)
         # blitting the text with an x offset of 15 pixels
-        screen.blit(f, tupleSubtract(position, (0, -10)))
+        g.queueBlit(f, tupleSubtract(position, (0, -10)))
 
 
 def openarticleinbrowser(article):
     webbrowser.open("http://en.wikipedia.org/wiki/" + article)
 
-# assumes the graph is currently locked
+# changes the node's data, which the drawing thread reads, so the graph is
+# locked while it does
 
 
 def registernodeclick(graph, name):
-    node = graph.nodes[name]
-    if node.data[0]:  # if it has been crawled, pop another node from its metadata
-        spawnfrommetadata(graph, name)
-    else:
-        t = Thread(target=crawlthread, args=(graph, name))
-        t.start()
+    graph.lock()
+    try:
+        node = graph.nodes[name]
+        if node.data[0]:  # if it has been crawled, pop another node from its metadata
+            spawnfrommetadata(graph, name)
+        else:
+            startcrawling(graph, name)
+    finally:
+        graph.unlock()
 
 
 print("SETTING UP GRAPH AND GRAPHER...")
 graph = Graph()
 graph.data = [1]
+graph.setAutoPlacement()
 g = Grapher(graph=graph)
 g.setNodeDrawFunction(customdraw)
 g.size = (1000, 800)
+# pages are crawled a few at a time on the crawler's own thread, and the links
+# found on them are kept between runs
+crawler = BackgroundCrawler(
+    Crawler(concurrency=8,
+            cache=LinkCache(os.path.join(tempfile.gettempdir(),
+                                         "grapy_wikipedia_links.sqlite"))),
+    lambda results: crawledbatch(graph, results))
 print("SETUP COMPLETE...")
 
 tocrawl = input("\nWhich wikipedia page should we crawl?   ")
@@ -141,17 +172,18 @@ n.data[1] = []
 n.data[2] = 0
 
 graph.addNode(n)
+addednames.add(tocrawl)
 
 g.start()
 
-while True:
-    graph.lock()
-    events = g.getEvents()
-    for e in events:
-        print(e)
-        if e[0] == 1 and e[1] == 3 and e[2] is not None:
-            registernodeclick(graph, e[2])
-        elif e[0] == 1 and e[1] == 2 and e[2] is not None:
-            openarticleinbrowser(e[2])
-
-    graph.unlock()
+# waiting for each mouse event in turn. neither this nor the changes it
+# queues need the graph to be locked. the loop ends when the grapher's window
+# is closed.
+for e in g.events:
+    print(e)
+    if e[0] == 1 and e[1] == 3 and e[2] is not None:
+        registernodeclick(graph, e[2])
+    elif e[0] == 1 and e[1] == 2 and e[2] is not None:
+        openarticleinbrowser(e[2])
+
+crawler.stop()